@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse as sp
 import pickle
 
 
@@ -79,6 +80,85 @@ def nonsingular_transformation(system):
     return Yb
 
 
+def sparse_singular_transformation(system, dense=False):
+    """
+    Create the sparse bus-admittance matrix using the singular transformation method.
+
+    The branch-bus incidence matrix A and the primitive admittance matrix Y are assembled once for all series and
+    shunt elements, and the product A @ Y @ A.T is formed in sparse form.
+    """
+
+    # Determine the number of independent buses and the number of branches in the system
+    number_of_buses = system['buses'].shape[0]
+    number_of_branches = system['branches'].shape[0]
+
+    # Extract the branch data
+    from_bus = system['branches'][:, 0].astype(int)
+    to_bus = system['branches'][:, 1].astype(int)
+    r = system['branches'][:, 2].astype(float)
+    x = system['branches'][:, 3].astype(float)
+    b = system['branches'][:, 4].astype(float)
+
+    # Determine the branches with parallel elements between the independent and the reference bus
+    shunt = np.flatnonzero(b != 0)
+    number_of_shunts = shunt.size
+    number_of_elements = number_of_branches + 2 * number_of_shunts
+
+    # Series elements occupy the first columns of A, followed by the shunt elements at both branch ends
+    series_columns = np.arange(number_of_branches)
+    shunt_columns = number_of_branches + np.arange(2 * number_of_shunts)
+    rows = np.concatenate([from_bus, to_bus, from_bus[shunt], to_bus[shunt]])
+    cols = np.concatenate([series_columns, series_columns, shunt_columns])
+    data = np.concatenate([np.ones(number_of_branches), -np.ones(number_of_branches), np.ones(2 * number_of_shunts)])
+
+    # Form the branch-bus incidence matrix A and the branch admittance matrix Y
+    A = sp.csr_matrix((data, (rows, cols)), shape=(number_of_buses, number_of_elements))
+    Y = sp.diags(np.concatenate([1 / (r + 1j * x), 1j * b[shunt] / 2, 1j * b[shunt] / 2]))
+
+    # Form the bus admittance matrix
+    Yb = (A @ Y @ A.T).tocsr()
+
+    if dense:
+        return Yb.toarray()
+
+    return Yb
+
+
+def sparse_nonsingular_transformation(system, dense=False):
+    """
+    Create the sparse bus-admittance matrix using the non-singular transformation method.
+
+    The contributions of all branches are stamped in a single vectorized pass, duplicate entries are summed.
+    """
+
+    # Determine the number of independent buses in the system
+    number_of_buses = system['buses'].shape[0]
+
+    # Extract the branch data
+    from_bus = system['branches'][:, 0].astype(int)
+    to_bus = system['branches'][:, 1].astype(int)
+    r = system['branches'][:, 2].astype(float)
+    x = system['branches'][:, 3].astype(float)
+    b = system['branches'][:, 4].astype(float)
+
+    # Calculate the series and shunt admittances of all branches
+    y_series = 1 / (r + 1j * x)
+    y_shunt = 1j * b / 2
+
+    # Off-diagonal elements followed by the diagonal elements
+    rows = np.concatenate([from_bus, to_bus, from_bus, to_bus])
+    cols = np.concatenate([to_bus, from_bus, from_bus, to_bus])
+    data = np.concatenate([-y_series, -y_series, y_series + y_shunt, y_series + y_shunt])
+
+    # Form the bus-admittance matrix
+    Yb = sp.coo_matrix((data, (rows, cols)), shape=(number_of_buses, number_of_buses)).tocsr()
+
+    if dense:
+        return Yb.toarray()
+
+    return Yb
+
+
 if __name__ == "__main__":
     # Load the system data
     with open("9 bus system.pkl", "rb") as file:
@@ -89,3 +169,9 @@ if __name__ == "__main__":
     # Check the difference between the two matrices
     dY = np.sum(np.abs(Y_b_1 - Y_b_2))
     print(dY)
+    # Create the bus-admittance matrix using the sparse versions of both methods
+    Y_b_3 = sparse_singular_transformation(system)
+    Y_b_4 = sparse_nonsingular_transformation(system, dense=True)
+    # Check the difference with respect to the dense matrices
+    print(np.sum(np.abs(Y_b_3.toarray() - Y_b_2)))
+    print(np.sum(np.abs(Y_b_4 - Y_b_2)))
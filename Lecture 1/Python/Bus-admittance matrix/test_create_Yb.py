@@ -0,0 +1,36 @@
+from create_Yb import singular_transformation, nonsingular_transformation, sparse_singular_transformation, \
+    sparse_nonsingular_transformation
+
+import numpy as np
+import pytest
+import os
+import pickle
+
+
+@pytest.fixture
+def system():
+    """
+    Load the 9-bus system.
+    """
+
+    with open(os.path.join(os.path.dirname(__file__), "9 bus system.pkl"), "rb") as file:
+        return pickle.load(file)
+
+
+def test_singular_transformation(system):
+    np.testing.assert_allclose(singular_transformation(system), nonsingular_transformation(system), rtol=0,
+                               atol=1e-12)
+
+
+def test_sparse_singular_transformation(system):
+    Y_b = singular_transformation(system)
+
+    np.testing.assert_allclose(sparse_singular_transformation(system).toarray(), Y_b, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(sparse_singular_transformation(system, dense=True), Y_b, rtol=0, atol=1e-12)
+
+
+def test_sparse_nonsingular_transformation(system):
+    Y_b = nonsingular_transformation(system)
+
+    np.testing.assert_allclose(sparse_nonsingular_transformation(system).toarray(), Y_b, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(sparse_nonsingular_transformation(system, dense=True), Y_b, rtol=0, atol=1e-12)
@@ -0,0 +1,119 @@
+from dc_power_flow import DCPowerFlow
+from sensitivity import SensitivityFactors
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+import pickle
+
+
+def dc_opf(system, cost, p_min=0.0, p_max=np.inf, ratings=None, monitored=None, model=None, tolerance=1e-6,
+           max_rounds=50, chunk_size=256):
+    """
+    Perform the DC optimal power flow, which dispatches the generators at minimum cost subject to the branch limits.
+
+    The generators are located at the slack and PV buses, and cost, p_min and p_max hold one value per generator (in
+    the order of the buses) or a single value for all of them. The problem is a linear program in the generator
+    outputs in the PTDF formulation, solved with HiGHS: the generation balances the total load and each monitored
+    branch flow PTDF[l] @ (p_gen - p_load) stays within its rating.
+
+    The branch limits are added lazily. The dispatch is first determined without them, the flows of all branches are
+    calculated with one substitution of the factorized DC model, and only the PTDF rows of the overloaded branches
+    are computed (with the transposed factorization) and added as constraints before the problem is re-solved, until
+    no branch exceeds its rating by more than the tolerance. The rows are computed chunk_size branches at a time and
+    only their generator columns are kept, so the dense PTDF matrix is never formed. The ratings are taken from the
+    sixth column of the branch data if they are not given. The branches monitored from the start can be given, e.g.
+    the monitored branches returned by a previous dispatch of the same system, and the locational marginal prices
+    are calculated from the duals of the balance and the branch constraints.
+    """
+
+    # Use the branch ratings stored in the system if they are not given
+    if ratings is None:
+        if system['branches'].shape[1] <= 5:
+            raise ValueError("The branch ratings must be given or stored in the sixth column of the branch data.")
+        ratings = system['branches'][:, 5]
+    ratings = np.asarray(ratings, dtype=float)
+
+    # Build and factorize the DC model
+    if model is None:
+        model = DCPowerFlow(system)
+    factors = SensitivityFactors(model)
+
+    # Extract the generator and load data
+    generators = np.flatnonzero(system['buses'][:, 1].astype(int) != 3)
+    number_of_generators = generators.size
+    cost = np.broadcast_to(np.asarray(cost, dtype=float), (number_of_generators,))
+    bounds = np.column_stack([np.broadcast_to(p_min, (number_of_generators,)),
+                              np.broadcast_to(p_max, (number_of_generators,))])
+    p_load = system['buses'][:, 4].astype(float)
+
+    # Constraints of the monitored branches: their indices, the generator columns of their PTDF rows and the flows
+    # caused by the loads
+    ptdf_generators = np.zeros((0, number_of_generators))
+    flow_load = np.zeros(0)
+    added = np.unique(np.asarray(monitored if monitored is not None else [], dtype=int))
+    monitored = np.zeros(0, dtype=int)
+
+    for rounds in range(1, max_rounds + 1):
+        # Compute the PTDF rows of the added branches in chunks, keeping only the parts of the constraints
+        for start in range(0, added.size, chunk_size):
+            rows = factors.ptdf_rows(added[start:start + chunk_size])
+            ptdf_generators = np.vstack([ptdf_generators, rows[:, generators]])
+            flow_load = np.concatenate([flow_load, rows @ p_load])
+        monitored = np.concatenate([monitored, added])
+
+        # Bound the flows of the monitored branches in both directions
+        A_flow = sp.csr_matrix(ptdf_generators)
+        A_ub = sp.vstack([A_flow, -A_flow]).tocsr()
+        b_ub = np.concatenate([ratings[monitored] + flow_load, ratings[monitored] - flow_load])
+
+        # Dispatch the generators at minimum cost
+        result = linprog(cost, A_ub=A_ub if monitored.size else None, b_ub=b_ub if monitored.size else None,
+                         A_eq=np.ones((1, number_of_generators)), b_eq=[np.sum(p_load)], bounds=bounds,
+                         method='highs')
+        if result.status != 0:
+            raise ValueError(f"The DC optimal power flow could not be solved: {result.message}")
+
+        # Calculate the flows of all branches and monitor the overloaded ones
+        p_gen = np.zeros(model.number_of_buses)
+        p_gen[generators] = result.x
+        theta, p_branch = model.solve(p_gen - p_load)
+        added = np.setdiff1d(np.flatnonzero(np.abs(p_branch) > ratings + tolerance), monitored)
+        if not added.size:
+            break
+    else:
+        raise ValueError(f"The DC optimal power flow did not converge in {max_rounds} rounds of added constraints.")
+
+    # Calculate the locational marginal prices from the duals of the balance and the branch constraints
+    lmp = np.full(model.number_of_buses, result.eqlin.marginals[0])
+    if monitored.size:
+        mu_upper, mu_lower = np.split(result.ineqlin.marginals, 2)
+        lmp += factors.ptdf_combination(monitored, mu_upper - mu_lower)
+
+    return {
+        'p_gen': p_gen,
+        'theta': theta,
+        'p_branch': p_branch,
+        'cost': result.fun,
+        'lmp': lmp,
+        'monitored': monitored,
+        'binding': monitored[np.abs(np.abs(p_branch[monitored]) - ratings[monitored]) <= tolerance],
+        'rounds': rounds,
+    }
+
+
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Dispatch the generators of the slack bus and both PV buses with a limit on the branches
+    ratings = np.full(system['branches'].shape[0], 1.2)
+    result = dc_opf(system, cost=[20, 30, 25], p_max=2.5, ratings=ratings)
+    print("Generation:", result['p_gen'][[0, 1, 2]])
+    print("Branch flows:", result['p_branch'])
+    print("Binding branches:", result['binding'], "after", result['rounds'], "rounds")
+    print("Locational marginal prices:", result['lmp'])
+    # Dispatch again with higher loads, monitoring the branches of the first dispatch from the start
+    system['buses'][:, 4] *= 1.1
+    result = dc_opf(system, cost=[20, 30, 25], p_max=2.5, ratings=ratings, monitored=result['monitored'])
+    print("Generation at higher loads:", result['p_gen'][[0, 1, 2]], "after", result['rounds'], "rounds")
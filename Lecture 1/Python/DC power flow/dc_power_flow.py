@@ -1,54 +1,121 @@
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
 import pickle
 
 
-def DC_power_flow(system):
+class DCPowerFlow:
     """
-    Perform the power flow using the linear DC method.
+    Linear DC power flow model that builds the bus-susceptance matrix once and keeps the LU factorization of its
+    reduced form, so that any number of injection scenarios can be solved without refactorizing.
+
+    A bus-susceptance matrix that has already been built for the system, e.g. one attached from shared memory, can
+    be passed in as B, so that only its reduced form is factorized.
     """
 
-    # Determine the number of buses and the number of branches in the system
-    number_of_buses = system['buses'].shape[0]
-    number_of_branches = system['branches'].shape[0]
+    def __init__(self, system, B=None):
+        # Determine the number of buses and the number of branches in the system
+        self.number_of_buses = system['buses'].shape[0]
+        self.number_of_branches = system['branches'].shape[0]
+
+        # Extract the system data
+        bus_type = system['buses'][:, 1].astype(int)
+        self.from_bus = system['branches'][:, 0].astype(int)
+        self.to_bus = system['branches'][:, 1].astype(int)
+        self.x = system['branches'][:, 3].astype(float)
+
+        # Determine the slack bus and the remaining buses
+        self.slack_bus = int(np.flatnonzero(bus_type == 1)[0]) if np.any(bus_type == 1) else 0
+        self.non_slack_buses = np.delete(np.arange(self.number_of_buses), self.slack_bus)
+
+        # Create the sparse bus-susceptance matrix
+        self.B = self.susceptance_matrix(system) if B is None else sp.csr_matrix(B)
+
+        # Remove the row and column associated with the slack bus and factorize the reduced matrix once
+        self.B_r = self.B[self.non_slack_buses, :][:, self.non_slack_buses].tocsc()
+        self.lu = spla.splu(self.B_r)
+
+    @staticmethod
+    def susceptance_matrix(system):
+        """
+        Create the sparse bus-susceptance matrix of a system in CSR format.
+        """
+
+        number_of_buses = system['buses'].shape[0]
+        from_bus = system['branches'][:, 0].astype(int)
+        to_bus = system['branches'][:, 1].astype(int)
+        x = system['branches'][:, 3].astype(float)
+
+        # Off-diagonal elements followed by the diagonal elements
+        rows = np.concatenate([from_bus, to_bus, from_bus, to_bus])
+        cols = np.concatenate([to_bus, from_bus, from_bus, to_bus])
+        data = np.concatenate([1 / x, 1 / x, -1 / x, -1 / x])
+
+        return sp.coo_matrix((data, (rows, cols)), shape=(number_of_buses, number_of_buses)).tocsr()
 
-    # Extract the system data
-    p_gen = system['buses'][:, 6]
-    p_load = system['buses'][:, 4]
-    from_bus = system['branches'][:, 0].astype(int)
-    to_bus = system['branches'][:, 1].astype(int)
-    x = system['branches'][:, 3]
+    @staticmethod
+    def injections(system):
+        """
+        Create the bus injection vector p = p_gen - p_load of a system.
+        """
 
-    # Create the bus-susceptance matrix
-    B = np.zeros((number_of_buses, number_of_buses))
+        return system['buses'][:, 6].astype(float) - system['buses'][:, 4].astype(float)
 
-    for i in range(number_of_branches):
-        # Off-diagonal elements
-        B[from_bus[i], to_bus[i]] += 1 / x[i]
-        B[to_bus[i], from_bus[i]] += 1 / x[i]
+    def solve(self, p):
+        """
+        Determine the voltage phase angles and the branch active power flows for the bus injections p.
 
-        # Diagonal elements
-        B[from_bus[i], from_bus[i]] -= 1 / x[i]
-        B[to_bus[i], to_bus[i]] -= 1 / x[i]
+        The injections can be a vector with one entry per bus or a matrix with one column per scenario
+        (buses x scenarios), in which case all scenarios are solved with a single forward/back substitution.
+        """
 
-    # Remove the row and column associated with the slack bus to create a reduced bus-susceptance matrix
-    B_r = np.delete(B, 0, axis=0)
-    B_r = np.delete(B_r, 0, axis=1)
+        p = np.asarray(p, dtype=float)
 
-    # Create the bus injection vector
-    p = p_gen - p_load
+        # Remove the row associated with the slack bus and determine the voltage phase angles
+        theta = np.zeros(p.shape)
+        theta[self.non_slack_buses] = -self.lu.solve(np.ascontiguousarray(p[self.non_slack_buses]))
 
-    # Remove the row associated with the slack bus to create a reduced bus-injection vector
-    p_r = p[1:]
+        # Calculate the branch active power flows
+        p_branch = self.branch_flows(theta)
+
+        return theta, p_branch
+
+    def branch_flows(self, theta):
+        """
+        Calculate the branch active power flows for the voltage phase angles theta (buses or buses x scenarios).
+        """
+
+        x = self.x if theta.ndim == 1 else self.x[:, np.newaxis]
+
+        return (theta[self.from_bus] - theta[self.to_bus]) / x
+
+
+def DC_power_flow(system, model=None, trace=None):
+    """
+    Perform the power flow using the linear DC method.
+
+    A DC model that has already been built and factorized for the same topology (e.g. taken from a cache) can be
+    passed in as model. If a trace is given, the single solution is recorded as one iteration, with the residual of
+    the linear equations as its mismatch.
+    """
 
-    # Determine the voltage phase angles
-    theta = np.zeros(number_of_buses)
-    theta[1:] = -np.linalg.inv(B_r) @ p_r
+    if trace is not None:
+        trace.start('dc_power_flow')
 
-    # Calculate the branch active power flows
-    p_branch = np.zeros(number_of_branches)
+    # Build and factorize the DC model
+    if model is None:
+        model = DCPowerFlow(system)
+    if trace is not None:
+        trace.setup_phase('factorization')
 
-    for i in range(number_of_branches):
-        p_branch[i] = (theta[from_bus[i]] - theta[to_bus[i]]) / x[i]
+    # Determine the voltage phase angles and the branch active power flows
+    p = model.injections(system)
+    theta, p_branch = model.solve(p)
+    if trace is not None:
+        trace.phase('linear_solve')
+        residual = (model.B @ theta + p)[model.non_slack_buses]
+        trace.phase('mismatch')
+        trace.iteration(1, np.max(np.abs(residual), initial=0), np.max(np.abs(theta), initial=0))
 
     return theta, p_branch
 
@@ -62,3 +129,9 @@ if __name__ == '__main__':
     # Print the results
     print(theta)
     print(p_branch)
+    # Solve a batch of scenarios with scaled loads using the same factorization
+    model = DCPowerFlow(system)
+    p_gen = system['buses'][:, 6][:, np.newaxis]
+    p_load = system['buses'][:, 4][:, np.newaxis] * np.linspace(0.5, 1.5, 5)
+    theta_batch, p_branch_batch = model.solve(p_gen - p_load)
+    print(p_branch_batch)
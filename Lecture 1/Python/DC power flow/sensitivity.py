@@ -0,0 +1,172 @@
+from dc_power_flow import DCPowerFlow, DC_power_flow
+
+import numpy as np
+import pickle
+
+
+class SensitivityFactors:
+    """
+    Power Transfer Distribution Factors (PTDF) and Line Outage Distribution Factors (LODF) of the DC model.
+
+    All factors are obtained by forward/back substitution with the LU factorization kept by the DC model, so only
+    the requested rows or columns are computed and the full dense matrices are formed only when asked for.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+        # Tolerance below which an outage is considered to split the network into islands
+        self.islanding_tolerance = 1e-10
+
+    def ptdf_columns(self, buses):
+        """
+        Calculate the PTDF columns (branches x buses) for injections at the given buses withdrawn at the slack bus.
+        """
+
+        buses = np.atleast_1d(buses).astype(int)
+
+        # Inject 1 p.u. at each of the buses and solve all unit injections at once
+        p = np.zeros((self.model.number_of_buses, buses.size))
+        p[buses, np.arange(buses.size)] = 1
+        p[self.model.slack_bus, :] = 0
+        _, p_branch = self.model.solve(p)
+
+        return p_branch
+
+    def ptdf_rows(self, branches):
+        """
+        Calculate the PTDF rows (branches x buses) of the given branches using the transposed factorization.
+        """
+
+        branches = np.atleast_1d(branches).astype(int)
+        model = self.model
+
+        # Form the scaled branch-bus incidence vectors of the branches, reduced by the slack bus
+        a = np.zeros((model.number_of_buses, branches.size))
+        a[model.from_bus[branches], np.arange(branches.size)] += 1 / model.x[branches]
+        a[model.to_bus[branches], np.arange(branches.size)] -= 1 / model.x[branches]
+
+        # Solve with the transposed reduced bus-susceptance matrix
+        rows = np.zeros((branches.size, model.number_of_buses))
+        rows[:, model.non_slack_buses] = -model.lu.solve(np.ascontiguousarray(a[model.non_slack_buses]), trans='T').T
+
+        return rows
+
+    def ptdf_combination(self, branches, weights):
+        """
+        Calculate the weighted sum of the PTDF rows of the given branches (buses) with a single transposed solve.
+        """
+
+        branches = np.atleast_1d(branches).astype(int)
+        weights = np.asarray(weights, dtype=float)
+        model = self.model
+
+        # Sum the weighted, scaled branch-bus incidence vectors, reduced by the slack bus
+        a = np.zeros(model.number_of_buses)
+        np.add.at(a, model.from_bus[branches], weights / model.x[branches])
+        np.add.at(a, model.to_bus[branches], -weights / model.x[branches])
+
+        # Solve with the transposed reduced bus-susceptance matrix
+        combination = np.zeros(model.number_of_buses)
+        combination[model.non_slack_buses] = -model.lu.solve(a[model.non_slack_buses], trans='T')
+
+        return combination
+
+    def ptdf(self, branches=None, buses=None):
+        """
+        Calculate the PTDF matrix, restricted to the given branches (rows) and/or buses (columns) if specified.
+        """
+
+        if branches is None and buses is None:
+            return self.ptdf_columns(np.arange(self.model.number_of_buses))
+
+        if branches is None:
+            return self.ptdf_columns(buses)
+
+        if buses is None:
+            return self.ptdf_rows(branches)
+
+        # Compute whichever set is smaller and select the other one from it
+        branches = np.atleast_1d(branches).astype(int)
+        buses = np.atleast_1d(buses).astype(int)
+        if branches.size <= buses.size:
+            return self.ptdf_rows(branches)[:, buses]
+
+        return self.ptdf_columns(buses)[branches, :]
+
+    def transfer_ptdf(self, from_buses, to_buses):
+        """
+        Calculate the branch flow sensitivities (branches x transfers) to transfers from from_buses to to_buses.
+        """
+
+        from_buses = np.atleast_1d(from_buses).astype(int)
+        to_buses = np.atleast_1d(to_buses).astype(int)
+        columns = np.arange(from_buses.size)
+
+        # Inject 1 p.u. at the sending bus and withdraw it at the receiving bus of each transfer
+        p = np.zeros((self.model.number_of_buses, from_buses.size))
+        np.add.at(p, (from_buses, columns), 1)
+        np.add.at(p, (to_buses, columns), -1)
+        p[self.model.slack_bus, :] = 0
+        _, p_branch = self.model.solve(p)
+
+        return p_branch
+
+    def lodf(self, outages=None, monitored=None):
+        """
+        Calculate the LODF matrix (monitored branches x outaged branches).
+
+        Entry (l, k) is the change of the flow on branch l per unit of pre-outage flow on branch k when branch k is
+        taken out of service. Outages that island the network give NaN columns.
+        """
+
+        model = self.model
+        outages = np.arange(model.number_of_branches) if outages is None else np.atleast_1d(outages).astype(int)
+        columns = np.arange(outages.size)
+
+        # Determine the flow sensitivities to a transfer between the terminals of each outaged branch
+        transfer = self.transfer_ptdf(model.from_bus[outages], model.to_bus[outages])
+
+        # Redistribute the pre-outage flow of each branch over the remaining network
+        denominator = 1 - transfer[outages, columns]
+        islanding = np.abs(denominator) < self.islanding_tolerance
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lodf = transfer / denominator
+        lodf[outages, columns] = -1
+        lodf[:, islanding] = np.nan
+
+        if monitored is not None:
+            lodf = lodf[np.atleast_1d(monitored).astype(int), :]
+
+        return lodf
+
+    def islanding_outages(self, outages=None):
+        """
+        Determine which of the given branch outages split the network into islands.
+        """
+
+        model = self.model
+        outages = np.arange(model.number_of_branches) if outages is None else np.atleast_1d(outages).astype(int)
+        transfer = self.transfer_ptdf(model.from_bus[outages], model.to_bus[outages])
+
+        return np.abs(1 - transfer[outages, np.arange(outages.size)]) < self.islanding_tolerance
+
+
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Build the DC model and its sensitivity factors
+    model = DCPowerFlow(system)
+    factors = SensitivityFactors(model)
+    PTDF = factors.ptdf()
+    LODF = factors.lodf()
+    print(PTDF)
+    print(LODF)
+    # Check the post-outage flows of branch 4 against a DC power flow without that branch
+    _, p_branch = DC_power_flow(system)
+    outage = 4
+    reduced_system = {'buses': system['buses'], 'branches': np.delete(system['branches'], outage, axis=0)}
+    _, p_branch_outage = DC_power_flow(reduced_system)
+    p_branch_lodf = np.delete(p_branch + LODF[:, outage] * p_branch[outage], outage)
+    print(np.max(np.abs(p_branch_lodf - p_branch_outage)))
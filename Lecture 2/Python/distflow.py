@@ -1,59 +1,109 @@
+from topology import feeder_topology
+from radial_kernels import use_numba, flatten_levels, distflow_sweeps
+
 import numpy as np
 import pickle
 
 
-def distflow(system):
+def distflow(system, topology=None, V0=None, max_iterations=100, trace=None, backend='numpy'):
     """
     Perform power flow calculations using the DistFlow method.
+
+    The sweeps process the branches one depth level of the feeder topology at a time, which is determined once
+    (or passed in by the caller) instead of searching for the child branches in every iteration. The iterations
+    start from a flat voltage profile unless the voltages V0 of a previous solution are given as a warm start, and
+    stop after max_iterations if the voltages have not converged. If a trace is given, each iteration is recorded
+    with the largest change of the sending-end branch powers as its mismatch and the largest change of the squared
+    voltage magnitudes as its update. With backend='numba', the sweeps run as compiled loops over the branches (if
+    Numba is installed).
     """
 
+    if trace is not None:
+        trace.start('distflow')
+    compiled = use_numba(backend)
+
     # Extract the bus data
     number_of_buses = system['buses'].shape[0]
-    p_load = system['buses'][:, 1]
-    q_load = system['buses'][:, 2]
+    p_load = system['buses'][:, 1].astype(float)
+    q_load = system['buses'][:, 2].astype(float)
 
     # Extract the branch data
     number_of_branches = system['branches'].shape[0]
-    from_bus = system['branches'][:, 1].astype(int)
-    to_bus = system['branches'][:, 2].astype(int)
-    r = system['branches'][:, 3]
-    x = system['branches'][:, 4]
+    r = system['branches'][:, 3].astype(float)
+    x = system['branches'][:, 4].astype(float)
+
+    # Determine the feeder topology
+    if topology is None:
+        topology = feeder_topology(system)
+    from_bus = topology['sending']
+    to_bus = topology['receiving']
+    levels = topology['levels']
+    if compiled:
+        level_branches, level_pointers = flatten_levels(levels)
+    else:
+        # Sending buses of each level and the index of each branch among them, so that the branch powers of a level
+        # are summed into only its sending buses
+        level_senders = []
+        level_index = []
+        for level in levels:
+            senders, index = np.unique(from_bus[level], return_inverse=True)
+            level_senders.append(senders)
+            level_index.append(index)
+    if trace is not None:
+        trace.setup_phase('topology')
 
     # Initialize the calculation variables
-    V = np.ones(number_of_buses)
+    V = np.ones(number_of_buses) if V0 is None else np.abs(np.asarray(V0)) ** 2
     V_old = np.zeros(number_of_buses)
     P = np.zeros(number_of_branches)
     Q = np.zeros(number_of_branches)
-    P_rec = np.zeros(number_of_branches)
-    Q_rec = np.zeros(number_of_branches)
+    P_node = np.zeros(number_of_buses)
+    Q_node = np.zeros(number_of_buses)
     tolerance = 1e-6
     iteration = 0
 
     # Main loop
-    while np.any(np.abs(V - V_old) >= tolerance):
+    while np.any(np.abs(V - V_old) >= tolerance) and iteration < max_iterations:
 
         # Update the iteration variables
         V_old = np.copy(V)
         iteration += 1
+        if trace is not None:
+            P_old = np.copy(P)
+            Q_old = np.copy(Q)
 
-        # Backward sweep: calculate active and reactive powers at the sending and receiving ends
-        for i in range(number_of_branches - 1, -1, -1):
-            P_rec[i] = p_load[to_bus[i]]
-            Q_rec[i] = q_load[to_bus[i]]
-
-            for j in range(number_of_branches):
-                if to_bus[i] == from_bus[j]:
-                    P_rec[i] += P[j]
-                    Q_rec[i] += Q[j]
+        if compiled:
+            # Perform both sweeps with the compiled kernel
+            distflow_sweeps(level_branches, level_pointers, from_bus, to_bus, r, x, p_load, q_load, P, Q, P_node,
+                            Q_node, V)
+            if trace is not None:
+                trace.phase('sweep')
+        else:
+            # Backward sweep: calculate active and reactive powers at the sending and receiving ends, starting from the
+            # deepest level
+            P_node[:] = 0
+            Q_node[:] = 0
+            for level, senders, index in zip(reversed(levels), reversed(level_senders), reversed(level_index)):
+                P_rec = p_load[to_bus[level]] + P_node[to_bus[level]]
+                Q_rec = q_load[to_bus[level]] + Q_node[to_bus[level]]
 
-            # Power flows at the sending end
-            P[i] = P_rec[i] + r[i] * (P_rec[i] ** 2 + Q_rec[i] ** 2) / V[to_bus[i]]
-            Q[i] = Q_rec[i] + x[i] * (P_rec[i] ** 2 + Q_rec[i] ** 2) / V[to_bus[i]]
+                # Power flows at the sending end
+                P[level] = P_rec + r[level] * (P_rec ** 2 + Q_rec ** 2) / V[to_bus[level]]
+                Q[level] = Q_rec + x[level] * (P_rec ** 2 + Q_rec ** 2) / V[to_bus[level]]
+                P_node[senders] += np.bincount(index, P[level], senders.size)
+                Q_node[senders] += np.bincount(index, Q[level], senders.size)
+            if trace is not None:
+                trace.phase('backward_sweep')
 
-        # Forward sweep: calculate node voltages
-        for i in range(number_of_branches):
-            V[to_bus[i]] = V[from_bus[i]] - 2 * (P[i] * r[i] + Q[i] * x[i]) + \
-                (r[i] ** 2 + x[i] ** 2) * (P[i] ** 2 + Q[i] ** 2) / V[from_bus[i]]
+            # Forward sweep: calculate node voltages, starting from the root
+            for level in levels:
+                V[to_bus[level]] = V[from_bus[level]] - 2 * (P[level] * r[level] + Q[level] * x[level]) + \
+                    (r[level] ** 2 + x[level] ** 2) * (P[level] ** 2 + Q[level] ** 2) / V[from_bus[level]]
+            if trace is not None:
+                trace.phase('forward_sweep')
+        if trace is not None:
+            trace.iteration(iteration, max(np.max(np.abs(P - P_old), initial=0), np.max(np.abs(Q - Q_old), initial=0)),
+                            np.max(np.abs(V - V_old)))
 
     # Perform voltage correction
     V = np.sqrt(V)
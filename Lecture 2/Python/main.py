@@ -3,24 +3,30 @@ from distflow import distflow
 
 import pickle
 import numpy as np
-import networkx as nx
-import matplotlib.pyplot as plt
+
+
+def plot_system(system):
+    """
+    Visualize the test system. The plotting libraries are imported only here, so the power flow runs without them.
+    """
+
+    import networkx as nx
+    import matplotlib.pyplot as plt
+
+    G = nx.Graph()
+    edges = [(row[1], row[2]) for row in system['branches']]
+    G.add_edges_from(edges)
+    plt.figure()
+    pos = nx.spring_layout(G, seed=42)
+    nx.draw(G, pos, with_labels=True)
+    plt.title("Test System")
+    plt.show()
 
 
 # Load the system data
 with open("13 bus system.pkl", "rb") as file:
     system = pickle.load(file)
 
-# Visualize the test system
-G = nx.Graph()
-edges = [(row[1], row[2]) for row in system['branches']]
-G.add_edges_from(edges)
-plt.figure()
-pos = nx.spring_layout(G, seed=42)
-nx.draw(G, pos, with_labels=True)
-plt.title("Test System")
-plt.show()
-
 # Perform the power flow analysis using Shirmohammadi's method
 V_sh, iteration_sh = shirmohammadi(system)
 
@@ -36,3 +42,6 @@ print(f"The mean voltage deviation is: {mean_dV}")
 print("The number of iterations to convergence:")
 print(f"Shirmohammadi - {iteration_sh}")
 print(f"DistFlow - {iteration_df}")
+
+# Visualize the test system
+plot_system(system)
@@ -0,0 +1,76 @@
+from topology import feeder_topology
+from shirmohammadi import shirmohammadi_batch
+
+import numpy as np
+import pickle
+
+
+def sample_loads(system, number_of_samples, deviation=0.1, seed=None):
+    """
+    Draw load samples (buses x samples) that are normally distributed around the loads of the system.
+    """
+
+    rng = np.random.default_rng(seed)
+    scale = np.maximum(1 + deviation * rng.standard_normal((system['buses'].shape[0], number_of_samples)), 0)
+    p_load = scale * system['buses'][:, 1:2].astype(float)
+    q_load = scale * system['buses'][:, 2:3].astype(float)
+
+    return p_load, q_load
+
+
+def voltage_statistics(V, v_min=0.95, v_max=1.05, percentiles=(1, 5, 50, 95, 99)):
+    """
+    Evaluate the percentiles and the exceedance probabilities of the voltage magnitudes (buses x samples).
+    """
+
+    V = np.abs(V)
+    under = V < v_min
+    over = V > v_max
+
+    return {
+        'percentiles': np.asarray(percentiles),
+        'V_percentiles': np.percentile(V, percentiles, axis=1),
+        'probability_under': np.mean(under, axis=1),
+        'probability_over': np.mean(over, axis=1),
+        'probability_violation': np.mean(np.any(under | over, axis=0)),
+    }
+
+
+def probabilistic_load_flow(system, p_load, q_load, batch_size=2000, v_min=0.95, v_max=1.05,
+                            percentiles=(1, 5, 50, 95, 99)):
+    """
+    Perform a probabilistic (Monte Carlo) load flow for the load samples p_load and q_load (buses x samples).
+
+    The samples are solved in batches with the batched Shirmohammadi method, and the voltage statistics are
+    evaluated from the magnitudes of all samples.
+    """
+
+    # Determine the feeder topology once for all batches
+    topology = feeder_topology(system)
+    number_of_samples = p_load.shape[1]
+    V = np.empty((system['buses'].shape[0], number_of_samples))
+    iterations = np.empty(number_of_samples, dtype=int)
+
+    # Solve the samples batch by batch
+    for start in range(0, number_of_samples, batch_size):
+        batch = slice(start, min(start + batch_size, number_of_samples))
+        V_batch, iterations[batch] = shirmohammadi_batch(system, p_load[:, batch], q_load[:, batch], topology)
+        V[:, batch] = np.abs(V_batch)
+
+    statistics = voltage_statistics(V, v_min, v_max, percentiles)
+    statistics['iterations'] = iterations
+
+    return statistics
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("13 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Perform the probabilistic load flow with 10000 load samples
+    p_load, q_load = sample_loads(system, 10000, deviation=0.2, seed=0)
+    statistics = probabilistic_load_flow(system, p_load, q_load)
+    print("Median node voltages:", statistics['V_percentiles'][2])
+    print("Probability of undervoltage:", statistics['probability_under'])
+    print("Probability of any voltage violation:", statistics['probability_violation'])
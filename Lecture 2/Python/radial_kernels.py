@@ -0,0 +1,154 @@
+import numpy as np
+import functools
+
+# Backends of the sweep kernels: NumPy array operations per level or compiled loops over the branches
+BACKENDS = ['numpy', 'numba']
+
+# Numba module, imported on the first use of the 'numba' backend so that the NumPy backend does not load it (False if
+# Numba is not installed)
+numba = None
+
+# Plain Python functions of the kernels and their compiled versions
+_kernels = {}
+_compiled = {}
+
+
+def _import_numba():
+    """
+    Import Numba on first use and return whether it is installed.
+    """
+
+    global numba
+    if numba is None:
+        try:
+            import numba as module
+        except ImportError:
+            module = False
+        numba = module
+
+    return numba is not False
+
+
+def _compile():
+    """
+    Wrap all kernels with Numba once, replacing the plain functions of the module so that the kernels call the
+    compiled versions of each other. Numba compiles each kernel for its argument types on its first call.
+    """
+
+    if not _compiled:
+        for name, function in _kernels.items():
+            _compiled[name] = globals()[name] = numba.njit(cache=True)(function)
+
+
+def _jit(function):
+    """
+    Register a kernel, which is compiled with Numba on its first call. Without Numba, the kernel stays a plain Python
+    function, which the solvers never call since they fall back to their NumPy sweeps.
+    """
+
+    _kernels[function.__name__] = function
+
+    @functools.wraps(function)
+    def kernel(*args):
+        if not _import_numba():
+            return function(*args)
+        _compile()
+        return _compiled[function.__name__](*args)
+
+    return kernel
+
+
+def use_numba(backend):
+    """
+    Check the name of a backend and return whether the compiled kernels are used. The 'numba' backend falls back to
+    NumPy if Numba is not installed.
+    """
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {', '.join(BACKENDS)}.")
+
+    return backend == 'numba' and _import_numba()
+
+
+def flatten_levels(levels):
+    """
+    Concatenate the branches of the depth levels of a feeder topology and return them with the pointers to the start
+    of each level (the last pointer is the number of branches).
+    """
+
+    level_branches = np.concatenate(levels).astype(np.int64) if levels else np.zeros(0, dtype=np.int64)
+    level_pointers = np.concatenate([[0], np.cumsum([level.size for level in levels])]).astype(np.int64)
+
+    return level_branches, level_pointers
+
+
+@_jit
+def shirmohammadi_sweeps(level_branches, level_pointers, sending, receiving, Z, I_node, J_branch, J_node, V):
+    """
+    Perform the backward and forward sweeps of one iteration of Shirmohammadi's method in place.
+
+    The branches are visited level by level in the same order as by the NumPy sweeps, so that the currents of the
+    child branches are summed in the same order. Both backends give the same results, except for last-bit rounding
+    differences of the complex products, which NumPy may evaluate with fused multiply-add instructions.
+    """
+
+    # Backward sweep: calculate the complex branch currents, starting from the deepest level
+    J_node[:] = 0
+    for level in range(level_pointers.size - 2, -1, -1):
+        for k in range(level_pointers[level], level_pointers[level + 1]):
+            branch = level_branches[k]
+            J_branch[branch] = J_node[receiving[branch]] - I_node[receiving[branch]]
+            J_node[sending[branch]] += J_branch[branch]
+
+    # Forward sweep: calculate the complex node voltages, starting from the root
+    for k in range(level_branches.size):
+        branch = level_branches[k]
+        V[receiving[branch]] = V[sending[branch]] - Z[branch] * J_branch[branch]
+
+
+@_jit
+def distflow_sweeps(level_branches, level_pointers, sending, receiving, r, x, p_load, q_load, P, Q, P_node, Q_node,
+                    V):
+    """
+    Perform the backward and forward sweeps of one iteration of the DistFlow method in place, with the squared voltage
+    magnitudes V.
+
+    The branches are visited level by level in the same order as by the NumPy sweeps, so that both backends give
+    identical results.
+    """
+
+    # Backward sweep: calculate the active and reactive powers at the sending ends, starting from the deepest level
+    P_node[:] = 0
+    Q_node[:] = 0
+    for level in range(level_pointers.size - 2, -1, -1):
+        for k in range(level_pointers[level], level_pointers[level + 1]):
+            branch = level_branches[k]
+            P_rec = p_load[receiving[branch]] + P_node[receiving[branch]]
+            Q_rec = q_load[receiving[branch]] + Q_node[receiving[branch]]
+            P[branch] = P_rec + r[branch] * (P_rec ** 2 + Q_rec ** 2) / V[receiving[branch]]
+            Q[branch] = Q_rec + x[branch] * (P_rec ** 2 + Q_rec ** 2) / V[receiving[branch]]
+            P_node[sending[branch]] += P[branch]
+            Q_node[sending[branch]] += Q[branch]
+
+    # Forward sweep: calculate the squared node voltages, starting from the root
+    for k in range(level_branches.size):
+        branch = level_branches[k]
+        V[receiving[branch]] = V[sending[branch]] - 2 * (P[branch] * r[branch] + Q[branch] * x[branch]) + \
+            (r[branch] ** 2 + x[branch] ** 2) * (P[branch] ** 2 + Q[branch] ** 2) / V[sending[branch]]
+
+
+# Sample usage
+if __name__ == '__main__':
+    from shirmohammadi import shirmohammadi
+    from distflow import distflow
+    import pickle
+
+    # Load the system data
+    with open("13 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Compare the results of both backends
+    print("Numba installed:", use_numba('numba'))
+    for solver in [shirmohammadi, distflow]:
+        V_numpy, _ = solver(system)
+        V_numba, _ = solver(system, backend='numba')
+        print(f"{solver.__name__}: largest difference between the backends {np.max(np.abs(V_numpy - V_numba))}")
@@ -0,0 +1,174 @@
+from topology import feeder_topology
+from shirmohammadi import shirmohammadi
+
+import numpy as np
+import pickle
+
+
+class RadialSession:
+    """
+    Incremental power flow of a radial feeder that keeps its converged state between changes.
+
+    A change of the loads at a few buses alters the branch currents only on the paths from these buses to the root,
+    and it shifts the voltages of the subtrees below the branches of these paths by a common amount. The session
+    therefore stores the voltages as the converged voltages plus a voltage shift per bus, which applies to its whole
+    subtree, and updates a load by walking its path once: the current of the changed bus is iterated at its own
+    voltage with the driving-point impedance of the path, and the resulting current change is booked on the path.
+    The currents of the other loads are kept at their values for the converged voltages, which is accurate to the
+    second order of the change; refine() removes this approximation with warm-started sweeps of the whole feeder.
+    Switching branches changes the topology, so it is followed by a warm-started solution of the whole feeder.
+    """
+
+    def __init__(self, system, topology=None, tolerance=1e-6, max_iterations=20):
+        self.system = {**system, 'buses': np.array(system['buses'], dtype=float)}
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self._set_topology(topology)
+        self._solve()
+
+    def _set_topology(self, topology=None):
+        """
+        Determine the feeder topology and the lists used to walk the paths towards the root.
+        """
+
+        self.topology = feeder_topology(self.system) if topology is None else topology
+        r = self.system['branches'][:, 3].astype(float)
+        x = self.system['branches'][:, 4].astype(float)
+        self._Z = r + 1j * x
+        self._parent_bus = self.topology['parent_bus'].tolist()
+        self._paths = {}
+
+    def _solve(self, V0=None):
+        """
+        Solve the whole feeder (warm-started from V0 if given) and make the solution the converged state.
+        """
+
+        V, iteration = shirmohammadi(self.system, self.topology, V0)
+        self._V = V
+        self._shift = np.zeros(V.size, dtype=complex)
+        self._S_node = - self.system['buses'][:, 1] - 1j * self.system['buses'][:, 2]
+        self._I_node = np.conj(self._S_node / V)
+
+        return iteration
+
+    def _path(self, bus):
+        """
+        Return the buses on the path from a bus up to (but without) the root, the impedances of their parent branches
+        and the driving-point impedance of the path.
+        """
+
+        if bus not in self._paths:
+            path = [bus]
+            while self._parent_bus[path[-1]] >= 0:
+                path.append(self._parent_bus[path[-1]])
+            path = np.array(path[:-1], dtype=int)
+            Z = self._Z[self.topology['parent_branch'][path]]
+            self._paths[bus] = (path, Z, np.sum(Z))
+
+        return self._paths[bus]
+
+    def voltage(self, bus):
+        """
+        Return the complex voltage of a single bus, adding up the shifts on its path to the root.
+        """
+
+        path, _, _ = self._path(bus)
+
+        return self._V[bus] + np.sum(self._shift[path])
+
+    def voltages(self):
+        """
+        Return the complex voltages of all buses.
+        """
+
+        shift = np.copy(self._shift)
+        for level in self.topology['levels']:
+            shift[self.topology['receiving'][level]] += shift[self.topology['sending'][level]]
+
+        return self._V + shift
+
+    def set_loads(self, buses, p_load, q_load):
+        """
+        Change the active and reactive loads of some buses and update the state along their paths to the root.
+
+        The changed buses are visited repeatedly until the voltage change of each of them is below the tolerance, so
+        that their interaction through common parts of their paths is included. Returns the number of passes.
+        """
+
+        buses = np.atleast_1d(np.asarray(buses, dtype=int))
+        self.system['buses'][buses, 1] = p_load
+        self.system['buses'][buses, 2] = q_load
+        self._S_node[buses] = - self.system['buses'][buses, 1] - 1j * self.system['buses'][buses, 2]
+
+        for iteration in range(1, self.max_iterations + 1):
+            max_change = 0.0
+            for bus in buses.tolist():
+                path, Z, Z_path = self._path(bus)
+                if not path.size:
+                    continue
+
+                # Iterate the current of the bus at its own voltage, which the current change shifts by Z_path dI
+                V_bus = self._V[bus] + np.sum(self._shift[path])
+                I_bus = self._I_node[bus]
+                for _ in range(self.max_iterations):
+                    I_new = np.conj(self._S_node[bus] / V_bus)
+                    change = Z_path * (I_new - I_bus)
+                    V_bus += change
+                    I_bus = I_new
+                    if abs(change) < self.tolerance:
+                        break
+
+                # Book the current change on the path: each branch shifts the voltages of its subtree by Z dI
+                dI = I_bus - self._I_node[bus]
+                self._shift[path] += Z * dI
+                self._I_node[bus] = I_bus
+                max_change = max(max_change, abs(Z_path * dI))
+            if max_change < self.tolerance:
+                break
+
+        return iteration
+
+    def refine(self):
+        """
+        Solve the whole feeder with warm-started sweeps from the current state, so that the currents of all loads
+        match their voltages. Returns the number of iterations.
+        """
+
+        return self._solve(self.voltages())
+
+    def switch_branches(self, branches, in_service):
+        """
+        Switch branches of the complete branch table out of or back into service and solve the new topology,
+        warm-started from the current voltages.
+
+        The complete branch table and the in-service flags are kept in system['all_branches'] and
+        system['in_service']. A reconfiguration usually closes a tie branch and opens another branch of the loop in
+        one call, since the branches in service must form a radial feeder; otherwise a ValueError is raised and the
+        session is left unchanged. Returns the number of iterations.
+        """
+
+        all_branches = self.system.get('all_branches', self.system['branches'])
+        status = np.array(self.system.get('in_service', np.ones(all_branches.shape[0], dtype=bool)))
+        status[branches] = in_service
+        system = {**self.system, 'branches': all_branches[status], 'all_branches': all_branches, 'in_service': status}
+        topology = feeder_topology(system)
+
+        V = self.voltages()
+        self.system = system
+        self._set_topology(topology)
+
+        return self._solve(V)
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("13 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Increase the load of one bus and compare the incremental update with a complete solution
+    session = RadialSession(system)
+    session.set_loads(5, 2 * system['buses'][5, 1], 2 * system['buses'][5, 2])
+    V_incremental = session.voltages()
+    session.refine()
+    print("Node voltages:", np.abs(session.voltages()))
+    print("Largest deviation of the incremental update:", np.max(np.abs(V_incremental - session.voltages())))
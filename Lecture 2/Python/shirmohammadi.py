@@ -1,60 +1,171 @@
+from topology import feeder_topology
+from radial_kernels import use_numba, flatten_levels, shirmohammadi_sweeps
+
 import numpy as np
 import pickle
 
 
-def shirmohammadi(system):
+def shirmohammadi(system, topology=None, V0=None, max_iterations=100, trace=None, backend='numpy'):
     """
     Perform power flow calculations using Shirmohammadi's method.
+
+    The sweeps process the branches one depth level of the feeder topology at a time, which is determined once
+    (or passed in by the caller) instead of searching for the child branches in every iteration. The iterations
+    start from a flat voltage profile unless the voltages V0 of a previous solution are given as a warm start, and
+    stop after max_iterations if the voltages have not converged. If a trace is given, each iteration is recorded
+    with the mismatch between the node powers and the loads at the updated voltages for the currents of the sweep.
+    With backend='numba', the sweeps run as compiled loops over the branches (if Numba is installed), which avoids
+    the per-level overhead of the array operations on deep feeders.
     """
 
+    if trace is not None:
+        trace.start('shirmohammadi')
+    compiled = use_numba(backend)
+
     # Extract the bus data
     number_of_buses = system['buses'].shape[0]
-    p_load = system['buses'][:, 1]
-    q_load = system['buses'][:, 2]
+    p_load = system['buses'][:, 1].astype(float)
+    q_load = system['buses'][:, 2].astype(float)
 
     # Extract the branch data
     number_of_branches = system['branches'].shape[0]
-    from_bus = system['branches'][:, 1].astype(int)
-    to_bus = system['branches'][:, 2].astype(int)
-    r = system['branches'][:, 3]
-    x = system['branches'][:, 4]
+    r = system['branches'][:, 3].astype(float)
+    x = system['branches'][:, 4].astype(float)
+
+    # Determine the feeder topology
+    if topology is None:
+        topology = feeder_topology(system)
+    from_bus = topology['sending']
+    to_bus = topology['receiving']
+    levels = topology['levels']
+    if compiled:
+        level_branches, level_pointers = flatten_levels(levels)
+    else:
+        # Sending buses of each level and the index of each branch among them, so that the branch flows of a level
+        # are summed into only its sending buses
+        level_senders = []
+        level_index = []
+        for level in levels:
+            senders, index = np.unique(from_bus[level], return_inverse=True)
+            level_senders.append(senders)
+            level_index.append(index)
+    if trace is not None:
+        trace.setup_phase('topology')
 
     # Initialize the calculation variables
     S_node = - p_load - 1j * q_load
     Z = r + 1j * x
-    V = np.ones(number_of_buses, dtype=complex)
-    I_node = np.zeros(number_of_buses, dtype=complex)
+    V = np.ones(number_of_buses, dtype=complex) if V0 is None else np.array(V0, dtype=complex)
     J_branch = np.zeros(number_of_branches, dtype=complex)
+    J_node = np.zeros(number_of_buses, dtype=complex)
     V_old = np.zeros(number_of_buses, dtype=complex)
     tolerance = 1e-6
     iteration = 0
 
     # Main loop
-    while np.any(np.abs(V - V_old) > tolerance):
+    while np.any(np.abs(V - V_old) > tolerance) and iteration < max_iterations:
 
         # Update the iteration variables
         V_old = np.copy(V)
         iteration += 1
 
         # Calculate the complex node current injections
-        for i in range(number_of_buses):
-            I_node[i] = np.conj(S_node[i] / V[i])
+        I_node = np.conj(S_node / V)
+        if trace is not None:
+            trace.phase('injections')
 
-        # Backward sweep: calculate the complex branch currents
-        for i in range(number_of_branches - 1, -1, -1):
-            J_branch[i] = - I_node[to_bus[i]]
+        if compiled:
+            # Perform both sweeps with the compiled kernel
+            shirmohammadi_sweeps(level_branches, level_pointers, from_bus, to_bus, Z, I_node, J_branch, J_node, V)
+            if trace is not None:
+                trace.phase('sweep')
+        else:
+            # Backward sweep: calculate the complex branch currents, starting from the deepest level
+            J_node[:] = 0
+            for level, senders, index in zip(reversed(levels), reversed(level_senders), reversed(level_index)):
+                J_branch[level] = J_node[to_bus[level]] - I_node[to_bus[level]]
+                J_node[senders] += np.bincount(index, J_branch[level].real, senders.size) + \
+                    1j * np.bincount(index, J_branch[level].imag, senders.size)
+            if trace is not None:
+                trace.phase('backward_sweep')
 
-            for j in range(number_of_branches):
-                if to_bus[i] == from_bus[j]:
-                    J_branch[i] += J_branch[j]
-
-        # Forward sweep: calculate the complex node voltages
-        for i in range(number_of_branches):
-            V[to_bus[i]] = V[from_bus[i]] - Z[i] * J_branch[i]
+            # Forward sweep: calculate the complex node voltages, starting from the root
+            for level in levels:
+                V[to_bus[level]] = V[from_bus[level]] - Z[level] * J_branch[level]
+            if trace is not None:
+                trace.phase('forward_sweep')
+        if trace is not None:
+            mismatch = np.abs(V * np.conj(I_node) - S_node)[to_bus]
+            trace.phase('mismatch')
+            trace.iteration(iteration, np.max(mismatch, initial=0), np.max(np.abs(V - V_old)))
 
     return V, iteration
 
 
+def shirmohammadi_batch(system, p_load, q_load, topology=None, max_iterations=100):
+    """
+    Perform power flow calculations using Shirmohammadi's method for many load scenarios at once.
+
+    The loads p_load and q_load are arrays of buses x scenarios. All scenarios are swept together as array
+    operations, and each scenario stops updating as soon as it has converged. The complex node voltages
+    (buses x scenarios) and the number of iterations of each scenario are returned.
+    """
+
+    # Extract the bus data
+    number_of_buses = system['buses'].shape[0]
+    p_load = np.asarray(p_load, dtype=float).reshape(number_of_buses, -1)
+    q_load = np.asarray(q_load, dtype=float).reshape(number_of_buses, -1)
+    number_of_scenarios = p_load.shape[1]
+
+    # Extract the branch data
+    number_of_branches = system['branches'].shape[0]
+    r = system['branches'][:, 3].astype(float)
+    x = system['branches'][:, 4].astype(float)
+
+    # Determine the feeder topology
+    if topology is None:
+        topology = feeder_topology(system)
+    from_bus = topology['sending']
+    to_bus = topology['receiving']
+    levels = topology['levels']
+
+    # Initialize the calculation variables
+    S_node = - p_load - 1j * q_load
+    Z = (r + 1j * x)[:, np.newaxis]
+    V = np.ones((number_of_buses, number_of_scenarios), dtype=complex)
+    iterations = np.zeros(number_of_scenarios, dtype=int)
+    active = np.arange(number_of_scenarios)
+    tolerance = 1e-6
+
+    # Main loop, restricted to the scenarios that have not converged yet
+    while active.size and np.max(iterations) < max_iterations:
+
+        # Update the iteration variables
+        V_active = V[:, active]
+        V_old = np.copy(V_active)
+        iterations[active] += 1
+
+        # Calculate the complex node current injections
+        I_node = np.conj(S_node[:, active] / V_active)
+
+        # Backward sweep: calculate the complex branch currents, starting from the deepest level
+        J_branch = np.zeros((number_of_branches, active.size), dtype=complex)
+        J_node = np.zeros((number_of_buses, active.size), dtype=complex)
+        for level in reversed(levels):
+            J_branch[level] = J_node[to_bus[level]] - I_node[to_bus[level]]
+            np.add.at(J_node, from_bus[level], J_branch[level])
+
+        # Forward sweep: calculate the complex node voltages, starting from the root
+        for level in levels:
+            V_active[to_bus[level]] = V_active[from_bus[level]] - Z[level] * J_branch[level]
+
+        # Store the voltages and remove the converged scenarios
+        V[:, active] = V_active
+        active = active[np.any(np.abs(V_active - V_old) > tolerance, axis=0)]
+
+    return V, iterations
+
+
 # Sample usage
 if __name__ == '__main__':
     # Load the system data
@@ -0,0 +1,40 @@
+from shirmohammadi import shirmohammadi
+from distflow import distflow
+
+import numpy as np
+import pytest
+import importlib.util
+import os
+import pickle
+
+# The compiled kernels are compared with NumPy only if Numba is installed
+requires_numba = pytest.mark.skipif(importlib.util.find_spec('numba') is None, reason="Numba is not installed")
+
+
+@pytest.fixture
+def system():
+    """
+    Load the 13-bus system.
+    """
+
+    with open(os.path.join(os.path.dirname(__file__), "13 bus system.pkl"), "rb") as file:
+        return pickle.load(file)
+
+
+@requires_numba
+def test_shirmohammadi_backends(system):
+    V_numpy, iterations_numpy = shirmohammadi(system)
+    V_numba, iterations_numba = shirmohammadi(system, backend='numba')
+
+    # The complex products may differ in the last bit, where NumPy uses fused multiply-add instructions
+    np.testing.assert_allclose(V_numba, V_numpy, rtol=1e-14, atol=0)
+    assert iterations_numpy == iterations_numba
+
+
+@requires_numba
+def test_distflow_backends(system):
+    V_numpy, iterations_numpy = distflow(system)
+    V_numba, iterations_numba = distflow(system, backend='numba')
+
+    np.testing.assert_array_equal(V_numpy, V_numba)
+    assert iterations_numpy == iterations_numba
@@ -0,0 +1,177 @@
+from topology import feeder_topology
+
+import numpy as np
+import pickle
+
+# Balanced phase voltages of the root bus (phases a, b and c)
+ROOT_VOLTAGES = np.exp(-2j * np.pi / 3 * np.arange(3))
+
+
+def three_phase_data(system):
+    """
+    Extract the phase data of a feeder: the phase impedance matrices of the branches (branches x 3 x 3), the phases
+    of the branches (branches x 3), the complex loads of the buses (buses x 3) and whether they are delta-connected.
+
+    The data are taken from the optional entries 'phase_impedances', 'branch_phases', 'phase_loads' and 'delta_loads'
+    of the system. Without them, the branches have three uncoupled phases with the impedance r + jx of the branch
+    data and the loads p + jq of the bus data are balanced and wye-connected, so that each phase equals the
+    single-phase model in per unit. The loads of a delta-connected bus are those between phases ab, bc and ca.
+    """
+
+    number_of_buses = system['buses'].shape[0]
+    number_of_branches = system['branches'].shape[0]
+
+    if 'phase_impedances' in system:
+        Z = np.array(system['phase_impedances'], dtype=complex).reshape(number_of_branches, 3, 3)
+    else:
+        Z = (system['branches'][:, 3] + 1j * system['branches'][:, 4])[:, np.newaxis, np.newaxis] * np.eye(3)
+    if 'branch_phases' in system:
+        branch_phases = np.array(system['branch_phases'], dtype=bool).reshape(number_of_branches, 3)
+    else:
+        branch_phases = np.ones((number_of_branches, 3), dtype=bool)
+    if 'phase_loads' in system:
+        S_load = np.array(system['phase_loads'], dtype=complex).reshape(number_of_buses, 3)
+    else:
+        S_load = (system['buses'][:, 1] + 1j * system['buses'][:, 2])[:, np.newaxis] * np.ones(3)
+    delta = np.array(system.get('delta_loads', np.zeros(number_of_buses)), dtype=bool)
+
+    return Z, branch_phases, S_load, delta
+
+
+def three_phase_sweep(system, topology=None, V0=None, max_iterations=100, trace=None):
+    """
+    Perform unbalanced three-phase power flow calculations with the backward/forward sweep of Shirmohammadi's method.
+
+    The node voltages and branch currents are arrays of buses x 3 and branches x 3, and the phase impedance matrices
+    are stacked (branches x 3 x 3), so that each depth level of the feeder topology is swept with one batched matrix
+    product. Single- and two-phase laterals are branches without some of the phases, which must exist at the sending
+    bus; the missing phases of a bus have zero voltage and carry no current. The loads draw constant power, per phase
+    if they are wye-connected and between phases if they are delta-connected (see three_phase_data). The iterations
+    start from balanced voltages unless the voltages V0 (buses x 3) of a previous solution are given. The complex
+    node voltages (buses x 3) and the number of iterations are returned.
+    """
+
+    if trace is not None:
+        trace.start('three_phase_sweep')
+
+    # Extract the phase data
+    number_of_buses = system['buses'].shape[0]
+    number_of_branches = system['branches'].shape[0]
+    Z, branch_phases, S_load, delta = three_phase_data(system)
+
+    # Determine the feeder topology
+    if topology is None:
+        topology = feeder_topology(system)
+    from_bus = topology['sending']
+    to_bus = topology['receiving']
+    levels = topology['levels']
+
+    # Determine the phases of the buses from the root downwards, checking that each lateral is fed by its phases
+    bus_phases = np.ones((number_of_buses, 3), dtype=bool)
+    for level in levels:
+        if np.any(branch_phases[level] & ~bus_phases[from_bus[level]]):
+            raise ValueError("A branch has a phase that does not exist at its sending bus.")
+        bus_phases[to_bus[level]] = branch_phases[level]
+    Z = Z * (branch_phases[:, :, np.newaxis] & branch_phases[:, np.newaxis, :])
+
+    # Check that the loads are connected to existing phases (both phases of a delta-connected load)
+    load_phases = np.where(delta[:, np.newaxis], bus_phases & np.roll(bus_phases, -1, axis=1), bus_phases)
+    if np.any((S_load != 0) & ~load_phases):
+        raise ValueError("A load is connected to a phase that does not exist at its bus.")
+
+    # Stack the data of each level once
+    level_Z = [Z[level] for level in levels]
+    level_from = [from_bus[level] for level in levels]
+    level_to = [to_bus[level] for level in levels]
+    level_phases = [bus_phases[to_bus[level]] for level in levels]
+
+    # Sending buses of each level and the index of the phase current of each branch among them, so that the branch
+    # currents of a level are summed into only its sending buses
+    level_senders = []
+    level_index = []
+    for sending in level_from:
+        senders, position = np.unique(sending, return_inverse=True)
+        level_senders.append(senders)
+        level_index.append((3 * position[:, np.newaxis] + np.arange(3)).ravel())
+    if trace is not None:
+        trace.setup_phase('topology')
+
+    # Initialize the calculation variables
+    V = ROOT_VOLTAGES * bus_phases if V0 is None else np.array(V0, dtype=complex) * bus_phases
+    J_branch = np.zeros((number_of_branches, 3), dtype=complex)
+    V_old = np.zeros((number_of_buses, 3), dtype=complex)
+    tolerance = 1e-6
+    iteration = 0
+
+    # Main loop
+    while np.any(np.abs(V - V_old) > tolerance) and iteration < max_iterations:
+
+        # Update the iteration variables
+        V_old = np.copy(V)
+        iteration += 1
+
+        # Calculate the load currents of the wye-connected loads from the phase voltages and those of the
+        # delta-connected loads from the line voltages (Vab, Vbc, Vca), e.g. Ia = Iab - Ica
+        V_load = np.where(delta[:, np.newaxis], V - np.roll(V, -1, axis=1), V)
+        I_connection = np.conj(np.divide(S_load, V_load, out=np.zeros_like(S_load), where=load_phases))
+        I_load = np.where(delta[:, np.newaxis], I_connection - np.roll(I_connection, 1, axis=1), I_connection)
+        if trace is not None:
+            trace.phase('injections')
+
+        # Backward sweep: calculate the phase currents of the branches, starting from the deepest level
+        J_node = np.zeros((number_of_buses, 3), dtype=complex)
+        for level, receiving, senders, index in zip(reversed(levels), reversed(level_to), reversed(level_senders),
+                                                    reversed(level_index)):
+            J_level = J_node[receiving] + I_load[receiving]
+            J_branch[level] = J_level
+            size = 3 * senders.size
+            J_node[senders] += (np.bincount(index, J_level.real.ravel(), size) +
+                                1j * np.bincount(index, J_level.imag.ravel(), size)).reshape(-1, 3)
+        if trace is not None:
+            trace.phase('backward_sweep')
+
+        # Forward sweep: calculate the phase voltages with the stacked impedance matrices, starting from the root
+        for level, Z_level, receiving, sending, phases in zip(levels, level_Z, level_to, level_from, level_phases):
+            V[receiving] = (V[sending] - np.matmul(Z_level, J_branch[level][:, :, np.newaxis])[:, :, 0]) * phases
+        if trace is not None:
+            trace.phase('forward_sweep')
+            V_load = np.where(delta[:, np.newaxis], V - np.roll(V, -1, axis=1), V)
+            mismatch = np.abs(V_load * np.conj(I_connection) - S_load)[to_bus]
+            trace.phase('mismatch')
+            trace.iteration(iteration, np.max(mismatch, initial=0), np.max(np.abs(V - V_old)))
+
+    return V, iteration
+
+
+# Sample usage
+if __name__ == '__main__':
+    from shirmohammadi import shirmohammadi
+
+    # Load the system data
+    with open("13 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Compare the balanced three-phase solution with the single-phase one
+    V, iteration = three_phase_sweep(system)
+    V_single, _ = shirmohammadi(system)
+    print("Largest deviation from the single-phase solution:", np.max(np.abs(V[:, 0] - V_single)))
+    # Make branches 9 and 10 a two-phase (ab) and a single-phase (a) lateral with mutually coupled phases, and
+    # connect the loads of bus 4 in delta
+    number_of_branches = system['branches'].shape[0]
+    Z_series = system['branches'][:, 3] + 1j * system['branches'][:, 4]
+    branch_phases = np.ones((number_of_branches, 3), dtype=bool)
+    branch_phases[9] = [True, True, False]
+    branch_phases[10] = [True, False, False]
+    phase_loads = (system['buses'][:, 1] + 1j * system['buses'][:, 2])[:, np.newaxis] * np.ones(3)
+    phase_loads[10] = [1.5, 1.5, 0] * phase_loads[10]
+    phase_loads[11] = [3, 0, 0] * phase_loads[11]
+    unbalanced = {
+        **system,
+        'phase_impedances': Z_series[:, np.newaxis, np.newaxis] * (0.7 * np.eye(3) + 0.3),
+        'branch_phases': branch_phases,
+        'phase_loads': phase_loads,
+        'delta_loads': np.arange(system['buses'].shape[0]) == 4,
+    }
+    V, iteration = three_phase_sweep(unbalanced)
+    print("Phase voltage magnitudes:")
+    print(np.abs(V))
+    print("Number of iterations:", iteration)
@@ -0,0 +1,93 @@
+import numpy as np
+import pickle
+
+
+def feeder_topology(system, root=0):
+    """
+    Determine the topology of a radial feeder by a breadth-first search from the root bus.
+
+    The branches are oriented away from the root, so they can be listed in any order and direction. The returned
+    dictionary holds the sending and receiving bus of each branch, the parent branch, parent bus and depth of each bus,
+    and the branches grouped by depth (levels), which the backward and forward sweeps process one level at a time.
+    """
+
+    # Extract the bus and branch data
+    number_of_buses = system['buses'].shape[0]
+    number_of_branches = system['branches'].shape[0]
+    from_bus = system['branches'][:, 1].astype(int)
+    to_bus = system['branches'][:, 2].astype(int)
+
+    # A connected network is radial only if it has one branch less than buses
+    if number_of_branches != number_of_buses - 1:
+        raise ValueError(f"The feeder is not radial: {number_of_branches} branches for {number_of_buses} buses.")
+
+    # Form the adjacency lists of all buses in compressed form (neighbouring bus and connecting branch)
+    ends = np.concatenate([from_bus, to_bus])
+    neighbours = np.concatenate([to_bus, from_bus])
+    branch_ids = np.concatenate([np.arange(number_of_branches), np.arange(number_of_branches)])
+    order = np.argsort(ends, kind='stable')
+    neighbours = neighbours[order]
+    branch_ids = branch_ids[order]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(ends, minlength=number_of_buses))])
+
+    # Initialize the search variables
+    depth = np.full(number_of_buses, -1)
+    parent_bus = np.full(number_of_buses, -1)
+    parent_branch = np.full(number_of_buses, -1)
+    depth[root] = 0
+    frontier = np.array([root])
+    levels = []
+
+    # Visit the buses one depth level at a time
+    while frontier.size:
+        # Gather the adjacency entries of all buses in the frontier
+        counts = indptr[frontier + 1] - indptr[frontier]
+        offsets = np.repeat(indptr[frontier] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        candidates = neighbours[offsets]
+        candidate_branches = branch_ids[offsets]
+        senders = np.repeat(frontier, counts)
+
+        # Keep the entries that lead to buses which have not been visited yet
+        new = depth[candidates] < 0
+        candidates = candidates[new]
+        candidate_branches = candidate_branches[new]
+        senders = senders[new]
+        if np.unique(candidates).size != candidates.size:
+            raise ValueError("The feeder is not radial: it contains a loop.")
+
+        depth[candidates] = len(levels) + 1
+        parent_bus[candidates] = senders
+        parent_branch[candidates] = candidate_branches
+        levels.append(candidate_branches)
+        frontier = candidates
+
+    # Remove the empty level of the leaf buses and check that all buses have been reached
+    levels = levels[:-1]
+    if np.any(depth < 0):
+        raise ValueError(f"The feeder is not connected: buses {np.flatnonzero(depth < 0)} cannot be reached.")
+
+    # Orient each branch from the sending (upstream) to the receiving (downstream) bus
+    receiving = np.empty(number_of_branches, dtype=int)
+    receiving[parent_branch[parent_branch >= 0]] = np.flatnonzero(parent_branch >= 0)
+    sending = parent_bus[receiving]
+
+    return {
+        'root': root,
+        'sending': sending,
+        'receiving': receiving,
+        'parent_bus': parent_bus,
+        'parent_branch': parent_branch,
+        'depth': depth,
+        'levels': levels,
+    }
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("13 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Determine the feeder topology
+    topology = feeder_topology(system)
+    for depth, level in enumerate(topology['levels'], start=1):
+        print(f"Depth {depth}: branches {level}")
@@ -0,0 +1,210 @@
+from create_Yb import create_Yb
+from newton_raphson import newton_raphson, power_injections, create_jacobian
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import pickle
+
+
+class _OrderedFactorization:
+    """
+    Sparse LU factorization of matrices with the same sparsity pattern that reuses the fill-reducing column ordering
+    of the first matrix, so that only the numerical factorization is repeated when the path needs a new Jacobian.
+    """
+
+    def __init__(self):
+        self.order = None
+        self.factorizations = 0
+
+    def factorize(self, A):
+        A = sp.csc_matrix(A)
+        if self.order is None:
+            self.order = np.argsort(spla.splu(A).perm_c)
+        self.lu = spla.splu(A[:, self.order], permc_spec='NATURAL')
+        self.factorizations += 1
+
+    def solve(self, b):
+        x = np.empty_like(b)
+        x[self.order] = self.lu.solve(b)
+        return x
+
+
+def continuation_power_flow(system, p_direction=None, q_direction=None, initial_step=0.1, min_step=1e-4,
+                            max_step=1.0, nose_step=1e-3, stop_fraction=0.8, max_points=500, tolerance=1e-8,
+                            max_corrector_iterations=10, contraction=0.5, number_of_critical_buses=5, Y_b=None):
+    """
+    Trace the PV curves of a system with the continuation power flow and determine its maximum loading point.
+
+    The specified injections are p_specified + lambda * p_direction and q_specified + lambda * q_direction, by default
+    the base-case generation and loads scaled together (the slack bus covers the losses). Starting from the
+    Newton-Raphson solution at lambda = 0, each step predicts the next point along the tangent of the curve and
+    corrects it with Newton iterations on the power flow equations augmented by the local parameterization, which
+    fixes the variable (phase angle, voltage magnitude or lambda) that changes the most along the tangent. The step
+    size grows after easy corrections and is halved after failed ones, and a step that passes the nose is repeated
+    with half its size until it is below nose_step, which locates the maximum loading point precisely.
+
+    The corrector reuses the factorization of the predictor as a chord method, with a column ordering of the augmented
+    Jacobian computed once for the whole path. If the continuation parameter changes, the factorization is updated
+    for the new last row with the Sherman-Morrison formula, using the tangent solve it already holds. The Jacobian is
+    refactorized at the corrected point if the largest mismatch shrinks by less than the contraction factor in an
+    iteration, at an accepted point if its corrector needed more than two iterations, and at the current point after
+    a rejected step only if the corrector had refactorized it. The path is followed past the nose until lambda falls
+    below stop_fraction of its maximum.
+
+    Returns a dictionary with lambda and the voltage magnitudes and phase angles (in degrees) of all points, the
+    maximum loading lambda_max, the index of its point, the critical buses (the PQ buses with the largest voltage
+    sensitivity at the nose, most critical first) and the numbers of factorizations and corrector iterations.
+    """
+
+    # Extract the system data
+    bus_type = system['buses'][:, 1].astype(int)
+    non_slack_buses = np.where(bus_type != 1)[0]
+    pq_buses = np.where(bus_type == 3)[0]
+    p_specified = system['buses'][:, 6].astype(float) - system['buses'][:, 4].astype(float)
+    q_specified = system['buses'][:, 7].astype(float) - system['buses'][:, 5].astype(float)
+    p_direction = p_specified if p_direction is None else np.asarray(p_direction, dtype=float)
+    q_direction = -system['buses'][:, 5].astype(float) if q_direction is None else np.asarray(q_direction, dtype=float)
+    number_of_angles = non_slack_buses.size
+    number_of_variables = number_of_angles + pq_buses.size
+
+    # Create the sparse bus-admittance matrix and solve the base case
+    if Y_b is None:
+        Y_b = create_Yb(system, sparse=True)
+    V, theta, _, _, _ = newton_raphson(system, Y_b=Y_b)
+    V = np.copy(V)
+    theta = np.radians(theta)
+    d = np.concatenate([p_direction[non_slack_buses], q_direction[pq_buses]])
+
+    def state(y):
+        """
+        Unpack the continuation variables y = [theta, V, lambda] into the bus voltage magnitudes and phase angles.
+        """
+
+        V_y = np.copy(V)
+        theta_y = np.copy(theta)
+        theta_y[non_slack_buses] = y[:number_of_angles]
+        V_y[pq_buses] = y[number_of_angles:number_of_variables]
+        return V_y, theta_y
+
+    def mismatch(y):
+        V_y, theta_y = state(y)
+        P, Q = power_injections(Y_b, V_y * np.exp(1j * theta_y))
+        return np.concatenate([P[non_slack_buses] - p_specified[non_slack_buses],
+                               Q[pq_buses] - q_specified[pq_buses]]) - y[-1] * d
+
+    def augmented_jacobian(y, k):
+        V_y, theta_y = state(y)
+        J = create_jacobian(Y_b, V_y * np.exp(1j * theta_y), non_slack_buses, pq_buses)
+        e_k = sp.csr_matrix(([1.0], ([0], [k])), shape=(1, number_of_variables + 1))
+        return sp.vstack([sp.hstack([J, sp.csc_matrix(-d[:, np.newaxis])]), e_k], format='csc')
+
+    # Initialize the path with the base case and the tangent with lambda as the continuation parameter
+    factorization = _OrderedFactorization()
+    y = np.concatenate([theta[non_slack_buses], V[pq_buses], [0.0]])
+    k = number_of_variables
+    direction = 1.0
+    factorization.factorize(augmented_jacobian(y, k))
+    factorized_k = k
+    points = [np.copy(y)]
+    step = initial_step
+    corrector_iterations = 0
+    lambda_max = 0.0
+    passed_nose = False
+    critical_sensitivity = np.zeros(pq_buses.size)
+
+    while len(points) < max_points and step >= min_step:
+        # Predictor: determine the normalized tangent and choose the parameter that changes the most along it. The
+        # solution w of the factorized matrix for the last unit vector has w[factorized_k] = 1
+        rhs = np.zeros(number_of_variables + 1)
+        rhs[-1] = 1.0
+        w = factorization.solve(rhs)
+        tangent = direction * w / np.linalg.norm(w)
+        if y[-1] >= lambda_max:
+            critical_sensitivity = np.abs(tangent[number_of_angles:number_of_variables])
+        k = int(np.argmax(np.abs(tangent)))
+        direction = np.sign(tangent[k])
+        y_predicted = y + step * tangent
+
+        # Corrector: solve the power flow equations with the continuation parameter fixed at its predicted value,
+        # with chord iterations on the factorization of the predictor
+        y_corrected = np.copy(y_predicted)
+        converged = False
+        refactorized = False
+        previous_mismatch = np.inf
+        for iteration in range(max_corrector_iterations):
+            residual = np.append(mismatch(y_corrected), 0.0)
+            largest_mismatch = np.max(np.abs(residual))
+            if largest_mismatch < tolerance:
+                converged = True
+                break
+
+            # Refactorize at the corrected point if the chord iterations stall
+            if largest_mismatch > contraction * previous_mismatch:
+                factorization.factorize(augmented_jacobian(y_corrected, k))
+                factorized_k = k
+                refactorized = True
+            previous_mismatch = largest_mismatch
+
+            # Replace the last row e_factorized_k of the factorized matrix by e_k (Sherman-Morrison)
+            dy = factorization.solve(residual)
+            if factorized_k != k:
+                dy -= w * (dy[k] - dy[factorized_k]) / w[k]
+            y_corrected -= dy
+            corrector_iterations += 1
+            if not np.all(np.isfinite(y_corrected)):
+                break
+
+        # Adapt the step size and accept the corrected point
+        passes_nose = not passed_nose and y_corrected[-1] < y[-1]
+        if not converged or (passes_nose and step > nose_step):
+            step /= 2
+            if refactorized:
+                factorization.factorize(augmented_jacobian(y, k))
+                factorized_k = k
+            continue
+        passed_nose = passed_nose or passes_nose
+        if iteration <= 5:
+            step = min(step * 1.5, max_step)
+        y = y_corrected
+        points.append(np.copy(y))
+        lambda_max = max(lambda_max, y[-1])
+        if y[-1] < stop_fraction * lambda_max:
+            break
+
+        # Refactorize at the accepted point for the next predictor unless the chord iterations converged quickly
+        if iteration > 2:
+            factorization.factorize(augmented_jacobian(y, k))
+            factorized_k = k
+
+    # Evaluate the points of the path
+    points = np.array(points)
+    V_path = np.tile(V, (points.shape[0], 1))
+    theta_path = np.tile(theta, (points.shape[0], 1))
+    theta_path[:, non_slack_buses] = points[:, :number_of_angles]
+    V_path[:, pq_buses] = points[:, number_of_angles:number_of_variables]
+    nose = int(np.argmax(points[:, -1]))
+
+    return {
+        'lambda': points[:, -1],
+        'V': V_path,
+        'theta': np.degrees(theta_path),
+        'lambda_max': float(points[nose, -1]),
+        'max_loading_point': nose,
+        'critical_buses': pq_buses[np.argsort(-critical_sensitivity)[:number_of_critical_buses]],
+        'factorizations': factorization.factorizations,
+        'corrector_iterations': corrector_iterations,
+    }
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Trace the PV curves for a uniform increase of the loads and generation
+    curve = continuation_power_flow(system)
+    print("Maximum loading parameter:", curve['lambda_max'])
+    print("Critical buses:", curve['critical_buses'])
+    print("Voltage magnitudes at the maximum loading point:", curve['V'][curve['max_loading_point']])
+    print("Number of points:", curve['lambda'].size, "factorizations:", curve['factorizations'])
@@ -1,44 +1,67 @@
+from network_kernels import use_numba, stamp_branches
+
 import numpy as np
+import scipy.sparse as sp
 import pickle
 
 
-def create_Yb(system):
+def create_Yb(system, sparse=False, backend='numpy'):
     """
     Create the bus-admittance matrix using the non-singular transformation method.
+
+    All branches are stamped in a single vectorized pass into a sparse COO matrix. The result is returned in CSR
+    format if sparse is True and as a dense array otherwise. With backend='numba', the branches are stamped directly
+    into the CSR arrays by a compiled loop (if Numba is installed). Bus shunt admittances, such as those of a network
+    equivalent, are added from the optional system['shunts'] table with the columns [bus, g, b].
     """
 
-    # Determine the number of independent buses and the number of branches in the system
+    # Determine the number of independent buses in the system
     number_of_buses = system['buses'].shape[0]
-    number_of_branches = system['branches'].shape[0]
 
     # Extract the branch data
     from_bus = system['branches'][:, 0].astype(int)
     to_bus = system['branches'][:, 1].astype(int)
-    r = system['branches'][:, 2]
-    x = system['branches'][:, 3]
-    b = system['branches'][:, 4]
+    r = system['branches'][:, 2].astype(float)
+    x = system['branches'][:, 3].astype(float)
+    b = system['branches'][:, 4].astype(float)
+
+    # Calculate the series and shunt admittances of all branches
+    y_series = 1 / (r + 1j * x)
+    y_shunt = 1j * b / 2
+
+    if use_numba(backend):
+        # Stamp the branches with the compiled kernel
+        data, indices, indptr = stamp_branches(number_of_buses, from_bus, to_bus, y_series, y_shunt)
+        Yb = sp.csr_matrix((data, indices, indptr), shape=(number_of_buses, number_of_buses))
+    else:
+        # Stamp the off-diagonal and diagonal elements of all branches at once (duplicates are summed)
+        rows = np.concatenate([from_bus, to_bus, from_bus, to_bus])
+        cols = np.concatenate([to_bus, from_bus, from_bus, to_bus])
+        data = np.concatenate([-y_series, -y_series, y_series + y_shunt, y_series + y_shunt])
 
-    # Initialize the bus-admittance matrix
-    Yb = np.zeros((number_of_buses, number_of_buses), dtype=complex)
+        # Form the bus-admittance matrix
+        Yb = sp.coo_matrix((data, (rows, cols)), shape=(number_of_buses, number_of_buses)).tocsr()
 
-    # Form the bus-admittance matrix
-    for i in range(number_of_branches):
-        # Off-diagonal elements
-        Yb[from_bus[i], to_bus[i]] -= 1 / (r[i] + 1j * x[i])
-        Yb[to_bus[i], from_bus[i]] -= 1 / (r[i] + 1j * x[i])
+    # Add the bus shunt admittances
+    if 'shunts' in system:
+        shunt_bus = system['shunts'][:, 0].astype(int)
+        y_bus_shunt = system['shunts'][:, 1].astype(float) + 1j * system['shunts'][:, 2].astype(float)
+        Yb = Yb + sp.coo_matrix((y_bus_shunt, (shunt_bus, shunt_bus)), shape=(number_of_buses, number_of_buses))
 
-        # Diagonal elements
-        Yb[from_bus[i], from_bus[i]] += 1 / (r[i] + 1j * x[i]) + 1j * b[i] / 2
-        Yb[to_bus[i], to_bus[i]] += 1 / (r[i] + 1j * x[i]) + 1j * b[i] / 2
+    if sparse:
+        return Yb
 
-    return Yb
+    return Yb.toarray()
 
 
 if __name__ == "__main__":
     # Load the system data
     with open("9 bus system.pkl", "rb") as file:
         system = pickle.load(file)
-    # Create the bus-admittance matrix
+    # Create the bus-admittance matrix in dense and sparse form
     Y_b = create_Yb(system)
+    Y_b_sparse = create_Yb(system, sparse=True)
     # Print the matrix
     print(Y_b)
+    # Check the difference between the two matrices
+    print(np.sum(np.abs(Y_b - Y_b_sparse.toarray())))
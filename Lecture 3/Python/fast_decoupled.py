@@ -0,0 +1,175 @@
+from create_Yb import create_Yb
+from newton_raphson import power_injections
+from network_cache import NetworkCache
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import pickle
+
+# Factorizations of B' and B'' of recently solved topologies
+factorization_cache = NetworkCache(max_entries=16)
+
+
+def factorize_B(system, variant='XB'):
+    """
+    Create and factorize the constant matrices B' and B'' of the fast-decoupled power flow.
+
+    In the XB variant B' neglects the branch resistances and B'' is the imaginary part of the bus-admittance matrix,
+    in the BX variant B' is the imaginary part of the bus-admittance matrix without shunts and B'' neglects the branch
+    resistances. In both variants B'' includes the susceptances of the bus shunts in system['shunts'], as the
+    bus-admittance matrix does. The factorizations are cached per topology and variant and reused by repeated solves.
+    """
+
+    return factorization_cache.get(system, ('B', variant), lambda system: _build_factorizations(system, variant))
+
+
+def _build_factorizations(system, variant):
+    """
+    Create and factorize B' and B'' of a system.
+    """
+
+    # Extract the system data
+    number_of_buses = system['buses'].shape[0]
+    bus_type = system['buses'][:, 1].astype(int)
+    non_slack_buses = np.where(bus_type != 1)[0]
+    pq_buses = np.where(bus_type == 3)[0]
+    from_bus = system['branches'][:, 0].astype(int)
+    to_bus = system['branches'][:, 1].astype(int)
+    r = system['branches'][:, 2].astype(float)
+    x = system['branches'][:, 3].astype(float)
+    b = system['branches'][:, 4].astype(float)
+
+    # Susceptances of the series elements with and without resistances, and of the shunt elements
+    b_series = np.imag(1 / (r + 1j * x))
+    b_series_lossless = -1 / x
+
+    # Susceptances of the bus shunts, added to the diagonal as in create_Yb
+    b_bus_shunt = np.zeros(number_of_buses)
+    if 'shunts' in system:
+        np.add.at(b_bus_shunt, system['shunts'][:, 0].astype(int), system['shunts'][:, 2].astype(float))
+
+    def susceptance_matrix(b_branch, b_shunt):
+        rows = np.concatenate([from_bus, to_bus, from_bus, to_bus])
+        cols = np.concatenate([to_bus, from_bus, from_bus, to_bus])
+        data = np.concatenate([-b_branch, -b_branch, b_branch + b_shunt / 2, b_branch + b_shunt / 2])
+        return sp.coo_matrix((data, (rows, cols)), shape=(number_of_buses, number_of_buses)).tocsr()
+
+    if variant == 'XB':
+        B_1 = susceptance_matrix(b_series_lossless, np.zeros_like(b))
+        B_2 = np.imag(create_Yb(system, sparse=True))
+    elif variant == 'BX':
+        B_1 = susceptance_matrix(b_series, np.zeros_like(b))
+        B_2 = susceptance_matrix(b_series_lossless, b) + sp.diags(b_bus_shunt, format='csr')
+    else:
+        raise ValueError(f"Unknown fast-decoupled variant: {variant}")
+
+    # Reduce the matrices to the non-slack and PQ buses and factorize them (sign included)
+    lu_1 = spla.splu(-B_1[non_slack_buses, :][:, non_slack_buses].tocsc())
+    lu_2 = spla.splu(-B_2[pq_buses, :][:, pq_buses].tocsc()) if pq_buses.size else None
+
+    return lu_1, lu_2
+
+
+def fast_decoupled(system, variant='XB', V0=None, theta0=None, max_iterations=100, Y_b=None, trace=None):
+    """
+    Perform power flow analysis using the fast-decoupled power flow method.
+
+    The active power half-iteration updates the phase angles with B' and the reactive power half-iteration updates
+    the voltage magnitudes with B''. Both matrices are factorized only once per topology. The warm start and the
+    prebuilt bus-admittance matrix and the trace are passed in as for newton_raphson.
+    """
+
+    if trace is not None:
+        trace.start('fast_decoupled')
+
+    # Extract the system data
+    number_of_buses = system['buses'].shape[0]
+    bus_type = system['buses'][:, 1].astype(int)
+    non_slack_buses = np.where(bus_type != 1)[0]
+    pq_buses = np.where(bus_type == 3)[0]
+    v_specified = system['buses'][:, 2].astype(float)
+    theta = np.radians(system['buses'][:, 3].astype(float))
+    p_load = system['buses'][:, 4].astype(float)
+    q_load = system['buses'][:, 5].astype(float)
+    p_gen = system['buses'][:, 6].astype(float)
+    q_gen = system['buses'][:, 7].astype(float)
+
+    # Calculate the specified active and reactive power injections
+    p_specified = p_gen - p_load
+    q_specified = q_gen - q_load
+
+    # Create the sparse bus-admittance matrix and the factorizations of B' and B''
+    if Y_b is None:
+        Y_b = create_Yb(system, sparse=True)
+    if trace is not None:
+        trace.setup_phase('Y_b')
+    lu_1, lu_2 = factorize_B(system, variant)
+    if trace is not None:
+        trace.setup_phase('factorization')
+
+    # Apply the warm start, keeping the specified voltage magnitudes of the slack and PV buses
+    if V0 is not None:
+        V = np.asarray(V0, dtype=float).copy()
+        V[bus_type != 3] = v_specified[bus_type != 3]
+    else:
+        V = np.copy(v_specified)
+    if theta0 is not None:
+        theta = np.radians(np.asarray(theta0, dtype=float))
+        theta[bus_type == 1] = np.radians(system['buses'][bus_type == 1, 3].astype(float))
+
+    # Initialize the calculation variables
+    V_old = np.zeros(number_of_buses, dtype=complex)
+    iteration = 0
+    tolerance = 1e-6
+
+    # Main loop
+    while np.any(np.abs(V * np.exp(1j * theta) - V_old) > tolerance) and iteration < max_iterations:
+        # Update the iteration variables
+        V_old = V * np.exp(1j * theta)
+        iteration += 1
+
+        # Active power half-iteration: update the phase angles
+        P, Q = power_injections(Y_b, V * np.exp(1j * theta))
+        dP = (p_specified[non_slack_buses] - P[non_slack_buses]) / V[non_slack_buses]
+        if trace is not None:
+            trace.phase('mismatch')
+        dtheta = lu_1.solve(dP)
+        theta[non_slack_buses] += dtheta
+        if trace is not None:
+            trace.phase('linear_solve')
+
+        # Reactive power half-iteration: update the voltage magnitudes
+        dQ = dV = np.zeros(0)
+        if lu_2 is not None:
+            P, Q = power_injections(Y_b, V * np.exp(1j * theta))
+            dQ = (q_specified[pq_buses] - Q[pq_buses]) / V[pq_buses]
+            if trace is not None:
+                trace.phase('mismatch')
+            dV = lu_2.solve(dQ)
+            V[pq_buses] += dV
+            if trace is not None:
+                trace.phase('linear_solve')
+
+        if trace is not None:
+            trace.iteration(iteration, max(np.max(np.abs(dP), initial=0), np.max(np.abs(dQ), initial=0)),
+                            max(np.max(np.abs(dtheta), initial=0), np.max(np.abs(dV), initial=0)))
+
+    # Evaluate the power injections of the final solution and convert theta to degrees
+    P, Q = power_injections(Y_b, V * np.exp(1j * theta))
+    theta = np.rad2deg(theta)
+
+    return V, theta, P, Q, iteration
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Perform the power flow using both variants
+    for variant in ['XB', 'BX']:
+        v, theta, P, Q, iteration = fast_decoupled(system, variant)
+        print(f"{variant} variant, {iteration} iterations")
+        print("Voltage magnitudes:", v)
+        print("Voltage phase angles:", theta)
@@ -1,29 +1,58 @@
 from create_Yb import create_Yb
+from network_kernels import use_numba, gauss_seidel_sweep
 
 import numpy as np
+import scipy.sparse as sp
 import cmath
 import pickle
 
 
-def gauss_seidel(system):
+def _trace_iteration(trace, iteration, Y_b, v, v_old, p, q, non_slack_buses, pq_buses):
+    """
+    Evaluate the power mismatch of the voltages after an iteration and record it with the voltage update in a trace.
+    """
+
+    S = v * np.conj(Y_b @ v)
+    mismatch = max(np.max(np.abs(p - S.real)[non_slack_buses], initial=0),
+                   np.max(np.abs(q - S.imag)[pq_buses], initial=0))
+    trace.phase('mismatch')
+    trace.iteration(iteration, mismatch, np.max(np.abs(v - v_old)))
+
+
+def gauss_seidel(system, Y_b=None, acceleration=1.0, jacobi=False, max_iterations=10000, trace=None, backend='numpy'):
     """
     Perform power flow analysis using Gauss-Seidel's power flow method.
+
+    The node current contributions are summed over the nonzero elements of each row of the sparse bus-admittance
+    matrix, and each voltage update is scaled by the acceleration factor (successive over-relaxation). If jacobi is
+    True, all buses are updated at once from the voltages of the previous iteration (Jacobi's method), which is
+    vectorized but usually needs more iterations. A bus-admittance matrix that has already been created for the same
+    topology can be passed in as Y_b. If a trace is given, the power mismatch of each iteration is evaluated for it
+    in addition to the voltage update. With backend='numba', the sequential bus updates run as a compiled loop (if
+    Numba is installed), which gives the same results as the Python loop.
     """
 
+    if trace is not None:
+        trace.start('gauss_seidel')
+
     # Extract the system data
-    number_of_buses = system['buses'].shape[0]
     bus_type = system['buses'][:, 1].astype(int)
-    v_specified = system['buses'][:, 2]
-    theta = system['buses'][:, 3]
-    p_load = system['buses'][:, 4]
-    q_load = system['buses'][:, 5]
-    p_gen = system['buses'][:, 6]
-    q_gen = system['buses'][:, 7]
-    q_gen_min = system['buses'][:, 8]
-    q_gen_max = system['buses'][:, 9]
-
-    # Create the bus-admittance matrix
-    Y_b = create_Yb(system)
+    non_slack_buses = np.where(bus_type != 1)[0]
+    v_specified = system['buses'][:, 2].astype(float)
+    theta = system['buses'][:, 3].astype(float)
+    p_load = system['buses'][:, 4].astype(float)
+    q_load = system['buses'][:, 5].astype(float)
+    p_gen = system['buses'][:, 6].astype(float)
+    q_gen = system['buses'][:, 7].astype(float)
+    q_gen_min = system['buses'][:, 8].astype(float)
+    q_gen_max = system['buses'][:, 9].astype(float)
+
+    # Create the sparse bus-admittance matrix
+    if Y_b is None:
+        Y_b = create_Yb(system, sparse=True)
+    Y_b = sp.csr_matrix(Y_b)
+    if trace is not None:
+        trace.setup_phase('Y_b')
 
     # Initialize the calculation variables
     p = p_gen - p_load
@@ -33,40 +62,107 @@ def gauss_seidel(system):
     iteration = 0
     tolerance = 1e-6
 
-    # Precompute reciprocal of diagonal elements of Y_b
-    Y_b_diag_inv = 1.0 / np.diag(Y_b)
+    # Precompute the diagonal elements of Y_b and their reciprocals
+    Y_b_diag = Y_b.diagonal()
+    Y_b_diag_inv = 1.0 / Y_b_diag
+
+    if jacobi:
+        pv_buses = non_slack_buses[bus_type[non_slack_buses] == 2]
+        pq_buses = non_slack_buses[bus_type[non_slack_buses] == 3]
+
+        # Main loop
+        while np.any(np.abs(v - v_old) > tolerance) and iteration < max_iterations:
+            # Update the iteration variables
+            v_old = np.copy(v)
+            iteration += 1
+
+            # Calculate the sums of node current contributions of all buses
+            I = Y_b @ v
+            S = I - Y_b_diag * v
+
+            # PV nodes: determine the reactive powers and check the generator reactive power limits
+            q_gen[pv_buses] = -np.imag(np.conj(v[pv_buses]) * I[pv_buses]) + q_load[pv_buses]
+            at_limit = (q_gen[pv_buses] < q_gen_min[pv_buses]) | (q_gen[pv_buses] > q_gen_max[pv_buses])
+            q_gen[pv_buses] = np.clip(q_gen[pv_buses], q_gen_min[pv_buses], q_gen_max[pv_buses])
+            q[pv_buses] = q_gen[pv_buses] - q_load[pv_buses]
+
+            # Apply the power flow equations to all nodes except the slack node
+            v_new = Y_b_diag_inv * ((p - 1j * q) / np.conj(v) - S)
+            v[non_slack_buses] += acceleration * (v_new[non_slack_buses] - v[non_slack_buses])
+
+            # Keep the specified voltage magnitudes of the PV nodes within their limits
+            regulated = pv_buses[~at_limit]
+            v[regulated] = v_specified[regulated] * np.exp(1j * np.angle(v[regulated]))
+            if trace is not None:
+                trace.phase('sweep')
+                _trace_iteration(trace, iteration, Y_b, v, v_old, p, q, non_slack_buses, pq_buses)
+
+        # Evaluate the voltage magnitudes and phase angles
+        return np.abs(v), np.angle(v, deg=True), iteration
+
+    if use_numba(backend):
+        # Main loop with the compiled sequential bus updates
+        while np.any(np.abs(v - v_old) > tolerance) and iteration < max_iterations:
+            v_old = np.copy(v)
+            iteration += 1
+            gauss_seidel_sweep(non_slack_buses, bus_type, Y_b.indptr, Y_b.indices, Y_b.data, Y_b_diag, Y_b_diag_inv,
+                               v, p, q, q_gen, q_load, q_gen_min, q_gen_max, v_specified, acceleration)
+            if trace is not None:
+                trace.phase('sweep')
+                _trace_iteration(trace, iteration, Y_b, v, v_old, p, q, non_slack_buses,
+                                 non_slack_buses[bus_type[non_slack_buses] == 3])
+
+        # Evaluate the voltage magnitudes and phase angles
+        return np.abs(v), np.angle(v, deg=True), iteration
+
+    # Extract the rows of the sparse bus-admittance matrix as lists for the sequential bus updates
+    indptr = Y_b.indptr.tolist()
+    indices = Y_b.indices.tolist()
+    data = Y_b.data.tolist()
+    v = v.tolist()
+    Y_b_diag = Y_b_diag.tolist()
+    Y_b_diag_inv = Y_b_diag_inv.tolist()
 
     # Main loop
-    while np.any(np.abs(v - v_old) > tolerance):
+    while np.any(np.abs(np.array(v) - v_old) > tolerance) and iteration < max_iterations:
         # Update the iteration variables
-        v_old = np.copy(v)
+        v_old = np.array(v)
         iteration += 1
 
         # Apply the Gauss-Seidel power flow equations to each node except the slack node
-        for i in range(1, number_of_buses):
-            # Calculate the sum of node current contributions
-            S = np.dot(Y_b[i, :], v)
-            S -= Y_b[i, i] * v[i]
+        for i in non_slack_buses.tolist():
+            # Calculate the sum of node current contributions over the nonzero elements of the row
+            S = sum(data[k] * v[indices[k]] for k in range(indptr[i], indptr[i + 1]))
+            S -= Y_b_diag[i] * v[i]
 
             if bus_type[i] == 2:
                 # PV node
-                q[i] = -np.imag(np.conj(v[i]) * (S + Y_b[i, i] * v[i]))
+                q[i] = -(v[i].conjugate() * (S + Y_b_diag[i] * v[i])).imag
                 q_gen[i] = q[i] + q_load[i]
 
                 # Check the generator reactive power limits
                 if q_gen[i] < q_gen_min[i] or q_gen[i] > q_gen_max[i]:
                     q_gen[i] = max(min(q_gen[i], q_gen_max[i]), q_gen_min[i])
                     q[i] = q_gen[i] - q_load[i]
-                    v[i] = Y_b_diag_inv[i] * ((p[i] - 1j * q[i]) / np.conj(v[i]) - S)
+                    v_new = Y_b_diag_inv[i] * ((p[i] - 1j * q[i]) / v[i].conjugate() - S)
+                    v[i] += acceleration * (v_new - v[i])
                 else:
-                    v[i] = Y_b_diag_inv[i] * ((p[i] - 1j * q[i]) / np.conj(v[i]) - S)
+                    v_new = Y_b_diag_inv[i] * ((p[i] - 1j * q[i]) / v[i].conjugate() - S)
+                    v[i] += acceleration * (v_new - v[i])
                     v[i] = v_specified[i] * cmath.exp(1j * cmath.phase(v[i]))
 
             else:
                 # PQ node
-                v[i] = Y_b_diag_inv[i] * ((p[i] - 1j * q[i]) / np.conj(v[i]) - S)
+                v_new = Y_b_diag_inv[i] * ((p[i] - 1j * q[i]) / v[i].conjugate() - S)
+                v[i] += acceleration * (v_new - v[i])
+
+        if trace is not None:
+            trace.phase('sweep')
+            _trace_iteration(trace, iteration, Y_b, np.array(v), v_old, p, q, non_slack_buses,
+                             non_slack_buses[bus_type[non_slack_buses] == 3])
 
     # Evaluate the voltage magnitudes and phase angles
+    v = np.array(v)
     theta = np.angle(v, deg=True)
     v = np.abs(v)
 
@@ -0,0 +1,271 @@
+from network_kernels import use_numba, selected_inversion
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import inspect
+
+# Keyword of the relative tolerance of the Krylov methods, which SciPy renamed from tol to rtol in version 1.12
+KRYLOV_TOLERANCE = 'rtol' if 'rtol' in inspect.signature(spla.gmres).parameters else 'tol'
+
+
+class DirectSolver:
+    """
+    Sparse direct solver of the Newton step, which factorizes each new Jacobian with SuperLU.
+
+    When the Jacobian is kept over several iterations, its factorization is reused as well.
+    """
+
+    def __init__(self):
+        self.lu = None
+        self.factorizations = 0
+
+    def solve(self, J, rhs, new_jacobian=True):
+        """
+        Solve J @ dx = rhs, factorizing J only if it is new.
+        """
+
+        if new_jacobian or self.lu is None:
+            self.lu = spla.splu(sp.csc_matrix(J))
+            self.factorizations += 1
+
+        return self.lu.solve(rhs)
+
+    def statistics(self):
+        return {'factorizations': self.factorizations}
+
+
+class KrylovSolver:
+    """
+    Iterative solver of the Newton step (GMRES or BiCGStab) with an incomplete LU preconditioner.
+
+    The ILU factors of one Jacobian are kept as the preconditioner of the following Jacobians as long as the Krylov
+    method converges within refresh_ratio times the number of iterations it needed right after the preconditioner
+    was computed; otherwise the preconditioner is recomputed from the current Jacobian and the step is solved again.
+    The relative tolerance of each step follows the size of the mismatch (inexact Newton), so that the early steps
+    are solved only roughly. The minimum degree ordering of J + J^T keeps the ILU factors of the power flow
+    Jacobian much more accurate than the default column ordering.
+    """
+
+    def __init__(self, method='gmres', drop_tol=1e-4, fill_factor=10, ordering='MMD_AT_PLUS_A', refresh_ratio=2.0,
+                 max_iterations=200, restart=50):
+        if method not in ['gmres', 'bicgstab']:
+            raise ValueError(f"Unknown Krylov method {method}, expected 'gmres' or 'bicgstab'.")
+        self.method = method
+        self.drop_tol = drop_tol
+        self.fill_factor = fill_factor
+        self.ordering = ordering
+        self.refresh_ratio = refresh_ratio
+        self.max_iterations = max_iterations
+        self.restart = restart
+        self.preconditioner = None
+        self.reference_iterations = None
+        self.factorizations = 0
+        self.krylov_iterations = 0
+        self.failures = 0
+
+    def _precondition(self, J):
+        """
+        Compute the ILU factors of a Jacobian and wrap them as a preconditioner.
+        """
+
+        ilu = spla.spilu(sp.csc_matrix(J), drop_tol=self.drop_tol, fill_factor=self.fill_factor,
+                         permc_spec=self.ordering)
+        self.preconditioner = spla.LinearOperator(J.shape, ilu.solve)
+        self.reference_iterations = None
+        self.factorizations += 1
+
+    def _krylov(self, J, rhs):
+        """
+        Run the Krylov method with the current preconditioner and return the solution, the number of iterations and
+        whether it converged.
+        """
+
+        counter = [0]
+
+        def count(_):
+            counter[0] += 1
+
+        rtol = min(1e-2, max(np.max(np.abs(rhs), initial=0), 1e-10))
+        if self.method == 'gmres':
+            dx, info = spla.gmres(J, rhs, atol=0, restart=self.restart,
+                                  maxiter=-(-self.max_iterations // self.restart), M=self.preconditioner,
+                                  callback=count, callback_type='pr_norm', **{KRYLOV_TOLERANCE: rtol})
+        else:
+            dx, info = spla.bicgstab(J, rhs, atol=0, maxiter=self.max_iterations, M=self.preconditioner,
+                                     callback=count, **{KRYLOV_TOLERANCE: rtol})
+        self.krylov_iterations += counter[0]
+
+        return dx, counter[0], info == 0
+
+    def solve(self, J, rhs, new_jacobian=True):
+        """
+        Solve J @ dx = rhs approximately, reusing the preconditioner while the Krylov iterations stay few.
+        """
+
+        if self.preconditioner is None:
+            self._precondition(J)
+        dx, iterations, converged = self._krylov(J, rhs)
+
+        # Recompute the preconditioner if the method failed or slowed down and solve the step again
+        if self.reference_iterations is not None and \
+                (not converged or iterations > self.refresh_ratio * max(self.reference_iterations, 1)):
+            self._precondition(J)
+            dx, iterations, converged = self._krylov(J, rhs)
+        if not converged:
+            self.failures += 1
+        if self.reference_iterations is None:
+            self.reference_iterations = iterations
+
+        return dx
+
+    def statistics(self):
+        return {'factorizations': self.factorizations, 'krylov_iterations': self.krylov_iterations,
+                'failures': self.failures}
+
+
+class SymmetricFactorization:
+    """
+    Sparse L D L^T factorization of symmetric matrices with the same sparsity pattern, such as complex symmetric
+    bus-admittance matrices or real gain matrices, with selected inversion.
+
+    The minimum degree ordering of the first matrix is reused, so that only the numerical factorization is repeated
+    for the following matrices. SuperLU is run in symmetric mode without row pivoting, so that its factors are
+    U = D L^T. The elements of the inverse on the sparsity pattern of L, which include its diagonal and the elements
+    of all pairs of nonzeros of a row of the matrix, are calculated from the factors by selected inversion
+    (Takahashi's equations) at a cost of the order of the factorization, without forming any column of the inverse.
+    With backend='numba', the selected inversion runs in a compiled loop (if Numba is installed).
+    """
+
+    def __init__(self, backend='numpy'):
+        use_numba(backend)
+        self.backend = backend
+        self.order = None
+        self.lu = None
+        self.inverse = None
+        self.factorizations = 0
+
+    def factorize(self, A):
+        """
+        Factorize a matrix, determining the ordering if it is the first one.
+        """
+
+        A = sp.csc_matrix(A)
+        options = {'diag_pivot_thresh': 0, 'options': {'SymmetricMode': True}}
+        if self.order is None:
+            self.order = np.argsort(spla.splu(A, permc_spec='MMD_AT_PLUS_A', **options).perm_c)
+        self.lu = spla.splu(sp.csc_matrix(A[self.order, :][:, self.order]), permc_spec='NATURAL', **options)
+        if not np.array_equal(self.lu.perm_r, self.lu.perm_c):
+            raise ValueError("The matrix could not be factorized without row pivoting.")
+        self.inverse = None
+        self.factorizations += 1
+
+    def solve(self, b):
+        """
+        Solve A @ x = b for a vector or a matrix of right-hand sides.
+        """
+
+        y = self.lu.solve(np.ascontiguousarray(b[self.order]))
+        x = np.empty_like(y)
+        x[self.order] = y
+
+        return x
+
+    def _selected_inversion(self):
+        """
+        Calculate the elements of the inverse on the pattern of L, column by column from the last one.
+
+        Z = L^-T D^-1 L^-1 satisfies Z[rows, j] = -Z[rows, rows] @ L[rows, j] and Z[j, j] = 1 / d[j] - L[rows, j] @
+        Z[rows, j] for the rows of the nonzeros of column j below the diagonal, and Z[rows, rows] lies on the pattern
+        of the columns computed before.
+        """
+
+        n = self.lu.shape[0]
+        L = sp.csc_matrix(self.lu.L)
+        L.sort_indices()
+        d = self.lu.U.diagonal()
+        indptr, indices = L.indptr, L.indices.astype(np.int64)
+
+        # Key of each element of L (column-major) to look up the elements of the inverse on its pattern
+        keys = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr)) * n + indices
+
+        # Position of each row of the matrix in the factors (the ordering and the postordering of SuperLU)
+        position = self.lu.perm_c[np.argsort(self.order)]
+        if use_numba(self.backend):
+            Z, diagonal = selected_inversion(indptr.astype(np.int64), indices, L.data, d)
+        else:
+            Z = np.zeros(L.nnz, dtype=L.dtype)
+            diagonal = np.zeros(n, dtype=L.dtype)
+            pairs = {}
+
+            for j in range(n - 1, -1, -1):
+                column = slice(indptr[j], indptr[j + 1])
+                below = indices[column] > j
+                rows = indices[column][below]
+                l = L.data[column][below]
+                if not rows.size:
+                    diagonal[j] = 1 / d[j]
+                    continue
+
+                # Gather the symmetric block Z[rows, rows] from the columns computed before
+                if rows.size not in pairs:
+                    pairs[rows.size] = np.triu_indices(rows.size, 1)
+                first, second = pairs[rows.size]
+                Z_block = np.diag(diagonal[rows])
+                if first.size:
+                    Z_pairs = Z[np.searchsorted(keys, rows[first] * n + rows[second])]
+                    Z_block[first, second] = Z_pairs
+                    Z_block[second, first] = Z_pairs
+
+                z = -(Z_block @ l)
+                Z[column][below] = z
+                diagonal[j] = 1 / d[j] - l @ z
+
+        self.inverse = (keys, Z, diagonal, position)
+
+    def inverse_diagonal(self):
+        """
+        Return the diagonal of the inverse of the factorized matrix.
+        """
+
+        if self.inverse is None:
+            self._selected_inversion()
+        _, _, diagonal, position = self.inverse
+
+        return diagonal[position]
+
+    def inverse_elements(self, rows, cols):
+        """
+        Return the elements (rows, cols) of the inverse of the factorized matrix, which must lie on the pattern of the
+        factors, e.g. the pairs of nonzeros of a row of the matrix.
+        """
+
+        if self.inverse is None:
+            self._selected_inversion()
+        keys, Z, diagonal, position = self.inverse
+        n = diagonal.size
+
+        # Look up the elements below the diagonal of the factors and take the diagonal elements separately
+        i = position[np.asarray(rows, dtype=np.int64)]
+        j = position[np.asarray(cols, dtype=np.int64)]
+        wanted = np.minimum(i, j) * n + np.maximum(i, j)
+        index = np.minimum(np.searchsorted(keys, wanted), keys.size - 1)
+        off_diagonal = i != j
+        if np.any(keys[index[off_diagonal]] != wanted[off_diagonal]):
+            raise ValueError("The requested elements of the inverse are not on the pattern of the factors.")
+
+        return np.where(off_diagonal, Z[index], diagonal[i])
+
+
+def create_linear_solver(linear_solver):
+    """
+    Create the linear solver of the Newton step from its name ('direct', 'gmres' or 'bicgstab'), or return a
+    solver object that has already been created.
+    """
+
+    if linear_solver is None or linear_solver == 'direct':
+        return DirectSolver()
+    if isinstance(linear_solver, str):
+        return KrylovSolver(linear_solver)
+
+    return linear_solver
@@ -1,5 +1,6 @@
 from gauss_seidel import gauss_seidel
 from newton_raphson import newton_raphson
+from fast_decoupled import fast_decoupled
 
 import pickle
 import numpy as np
@@ -15,12 +16,17 @@ V_gs, theta_gs, iteration_gs = gauss_seidel(system)
 # Perform the power flow analysis using DistFlow
 V_nr, theta_nr, P, Q, iteration_nr = newton_raphson(system)
 
+# Perform the power flow analysis using the fast-decoupled method
+V_fd, theta_fd, _, _, iteration_fd = fast_decoupled(system)
+
 # Compare the voltage magnitudes
 dV = np.abs(np.abs(V_nr) - V_gs)
 mean_dV = np.mean(dV)
 print(f"The mean voltage deviation is: {mean_dV}")
+print(f"The mean voltage deviation of the fast-decoupled method is: {np.mean(np.abs(V_nr - V_fd))}")
 
 # Compare the number of iterations
 print("The number of iterations to convergence:")
 print(f"Gauss-Seidel: {iteration_gs}")
 print(f"Newton-Raphson: {iteration_nr}")
+print(f"Fast-decoupled: {iteration_fd}")
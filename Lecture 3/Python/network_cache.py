@@ -0,0 +1,180 @@
+from create_Yb import create_Yb
+
+from collections import OrderedDict
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import pickle
+
+
+def topology_key(system):
+    """
+    Create the hash of the network data of a system: the branch table and, if present, the bus types and the bus
+    shunt table (e.g. of a reduced equivalent).
+
+    The loads and generations are not part of the key, so systems that differ only in their injections share it.
+    """
+
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(system['branches'], dtype=float).tobytes())
+    if system['buses'].shape[1] > 3:
+        digest.update(np.ascontiguousarray(system['buses'][:, 1], dtype=float).tobytes())
+    if 'shunts' in system:
+        digest.update(b'shunts')
+        digest.update(np.ascontiguousarray(system['shunts'], dtype=float).tobytes())
+
+    return digest.hexdigest()
+
+
+def _estimate_size(value):
+    """
+    Estimate the memory used by a cached value in bytes.
+
+    The size of a sparse matrix in another format than CSR or CSC and that of a SuperLU factorization are estimated
+    from their number of nonzeros, without converting the matrix or extracting the factors. The elements of the
+    factors are counted as complex numbers with 32-bit indices, which is an upper bound for real factors.
+    """
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if sp.issparse(value):
+        if value.format in ['csr', 'csc']:
+            return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+        return value.nnz * (value.dtype.itemsize + 2 * np.dtype(np.int32).itemsize)
+    if isinstance(value, spla.SuperLU):
+        n = value.shape[0]
+        index_size = np.dtype(np.int32).itemsize
+        return value.nnz * (np.dtype(complex).itemsize + index_size) + 2 * (n + 1) * index_size + \
+            value.perm_r.nbytes + value.perm_c.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_estimate_size(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return sum(_estimate_size(item) for item in vars(value).values())
+
+    return 0
+
+
+class NetworkCache:
+    """
+    Cache of the matrices and factorizations that depend only on the network topology of a system.
+
+    The entries are keyed by the topology hash and the kind of entry (e.g. 'Y_b'). When the number of entries or
+    their estimated total size exceed the limits, the least recently used entries are evicted.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=2 ** 30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, system, kind, build):
+        """
+        Return the cached entry of a kind for the topology of a system, building it with build(system) on a miss.
+        """
+
+        key = (topology_key(system), kind)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        value = build(system)
+        self.entries[key] = value
+        self.sizes[key] = _estimate_size(value)
+        self._evict()
+
+        return value
+
+    def ybus(self, system):
+        """
+        Return the sparse bus-admittance matrix of a system.
+        """
+
+        return self.get(system, 'Y_b', lambda system: create_Yb(system, sparse=True))
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache is within its limits (keeping the newest entry).
+        """
+
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or
+                                         sum(self.sizes.values()) > self.max_bytes):
+            key, _ = self.entries.popitem(last=False)
+            del self.sizes[key]
+            self.evictions += 1
+
+    def invalidate(self, system):
+        """
+        Remove all entries of the topology of a system, e.g. when a branch is switched and the old topology is not
+        going to be solved again.
+        """
+
+        key = topology_key(system)
+        for entry in [entry for entry in self.entries if entry[0] == key]:
+            del self.entries[entry]
+            del self.sizes[entry]
+
+    def clear(self):
+        """
+        Remove all entries and reset the counters.
+        """
+
+        self.entries.clear()
+        self.sizes.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def statistics(self):
+        """
+        Return the number of entries, their estimated size and the hit, miss and eviction counters.
+        """
+
+        return {
+            'entries': len(self.entries),
+            'bytes': sum(self.sizes.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def switch_branch(system, branch, in_service, cache=None):
+    """
+    Switch a branch out of or back into service and return the new system.
+
+    The branch index refers to the complete branch table, which is kept in system['all_branches'] together with the
+    in-service flags in system['in_service'], while system['branches'] holds only the branches in service. If a cache
+    is given, the entries of the previous topology are invalidated.
+    """
+
+    if cache is not None:
+        cache.invalidate(system)
+
+    all_branches = system.get('all_branches', system['branches'])
+    status = np.array(system.get('in_service', np.ones(all_branches.shape[0], dtype=bool)))
+    status[branch] = in_service
+
+    return {**system, 'branches': all_branches[status], 'all_branches': all_branches, 'in_service': status}
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Request the bus-admittance matrix for a load change, a branch outage and the restored network
+    cache = NetworkCache()
+    cache.ybus(system)
+    system['buses'][:, 4] *= 1.1
+    cache.ybus(system)
+    outage_system = switch_branch(system, 4, False)
+    cache.ybus(outage_system)
+    cache.ybus(switch_branch(outage_system, 4, True))
+    print(cache.statistics())
@@ -0,0 +1,254 @@
+import numpy as np
+import cmath
+import functools
+
+# Backends of the kernels: NumPy array operations and Python loops, or compiled loops
+BACKENDS = ['numpy', 'numba']
+
+# Numba module, imported on the first use of the 'numba' backend so that the NumPy backend does not load it (False if
+# Numba is not installed)
+numba = None
+
+# Plain Python functions of the kernels and their compiled versions
+_kernels = {}
+_compiled = {}
+
+
+def _import_numba():
+    """
+    Import Numba on first use and return whether it is installed.
+    """
+
+    global numba
+    if numba is None:
+        try:
+            import numba as module
+        except ImportError:
+            module = False
+        numba = module
+
+    return numba is not False
+
+
+def _compile():
+    """
+    Wrap all kernels with Numba once, replacing the plain functions of the module so that the kernels call the
+    compiled versions of each other. Numba compiles each kernel for its argument types on its first call.
+    """
+
+    if not _compiled:
+        for name, function in _kernels.items():
+            _compiled[name] = globals()[name] = numba.njit(cache=True)(function)
+
+
+def _jit(function):
+    """
+    Register a kernel, which is compiled with Numba on its first call. Without Numba, the kernel stays a plain Python
+    function, which the solvers never call since they fall back to their NumPy implementation.
+    """
+
+    _kernels[function.__name__] = function
+
+    @functools.wraps(function)
+    def kernel(*args):
+        if not _import_numba():
+            return function(*args)
+        _compile()
+        return _compiled[function.__name__](*args)
+
+    return kernel
+
+
+def use_numba(backend):
+    """
+    Check the name of a backend and return whether the compiled kernels are used. The 'numba' backend falls back to
+    NumPy if Numba is not installed.
+    """
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {', '.join(BACKENDS)}.")
+
+    return backend == 'numba' and _import_numba()
+
+
+@_jit
+def _divide(a, b):
+    """
+    Divide two complex numbers with the algorithm of NumPy (Smith's method with a reciprocal scale), which the
+    Python loop of gauss_seidel uses since its power terms are NumPy scalars.
+    """
+
+    if abs(b.real) >= abs(b.imag):
+        ratio = b.imag / b.real
+        scale = 1.0 / (b.real + b.imag * ratio)
+        return complex((a.real + a.imag * ratio) * scale, (a.imag - a.real * ratio) * scale)
+
+    ratio = b.real / b.imag
+    scale = 1.0 / (b.imag + b.real * ratio)
+    return complex((a.real * ratio + a.imag) * scale, (a.imag * ratio - a.real) * scale)
+
+
+@_jit
+def gauss_seidel_sweep(buses, bus_type, indptr, indices, data, Y_b_diag, Y_b_diag_inv, v, p, q, q_gen, q_load,
+                       q_gen_min, q_gen_max, v_specified, acceleration):
+    """
+    Perform one Gauss-Seidel iteration over the given buses in place, with the same operations in the same order as
+    the sequential bus updates of gauss_seidel, so that both backends give identical results.
+    """
+
+    for i in buses:
+        # Calculate the sum of node current contributions over the nonzero elements of the row
+        S = 0j
+        for k in range(indptr[i], indptr[i + 1]):
+            S += data[k] * v[indices[k]]
+        S -= Y_b_diag[i] * v[i]
+
+        if bus_type[i] == 2:
+            # PV node
+            q[i] = -(v[i].conjugate() * (S + Y_b_diag[i] * v[i])).imag
+            q_gen[i] = q[i] + q_load[i]
+
+            # Check the generator reactive power limits
+            if q_gen[i] < q_gen_min[i] or q_gen[i] > q_gen_max[i]:
+                q_gen[i] = max(min(q_gen[i], q_gen_max[i]), q_gen_min[i])
+                q[i] = q_gen[i] - q_load[i]
+                v_new = Y_b_diag_inv[i] * (_divide(p[i] - 1j * q[i], v[i].conjugate()) - S)
+                v[i] += acceleration * (v_new - v[i])
+            else:
+                v_new = Y_b_diag_inv[i] * (_divide(p[i] - 1j * q[i], v[i].conjugate()) - S)
+                v[i] += acceleration * (v_new - v[i])
+                v[i] = v_specified[i] * cmath.exp(1j * cmath.phase(v[i]))
+
+        else:
+            # PQ node
+            v_new = Y_b_diag_inv[i] * (_divide(p[i] - 1j * q[i], v[i].conjugate()) - S)
+            v[i] += acceleration * (v_new - v[i])
+
+
+@_jit
+def stamp_branches(number_of_buses, from_bus, to_bus, y_series, y_shunt):
+    """
+    Stamp the branch admittances into the CSR arrays (data, indices, indptr) of the bus-admittance matrix.
+
+    The elements of each row are collected in the order in which create_Yb stamps them, sorted stably by column and
+    duplicates summed in that order, as SciPy does when it converts the stamped COO matrix.
+    """
+
+    number_of_branches = from_bus.size
+
+    # Count the stamped elements of each row: an off-diagonal and a diagonal element per branch end
+    counts = np.zeros(number_of_buses + 1, dtype=np.int64)
+    for k in range(number_of_branches):
+        counts[from_bus[k] + 1] += 2
+        counts[to_bus[k] + 1] += 2
+    pointers = np.cumsum(counts)
+
+    # Place the elements in the order of the stamps: off-diagonal from/to elements, then diagonal from/to elements
+    columns = np.empty(pointers[-1], dtype=np.int64)
+    values = np.empty(pointers[-1], dtype=np.complex128)
+    position = pointers[:-1].copy()
+    for stamp in range(4):
+        for k in range(number_of_branches):
+            row = from_bus[k] if stamp % 2 == 0 else to_bus[k]
+            if stamp < 2:
+                columns[position[row]] = to_bus[k] if stamp == 0 else from_bus[k]
+                values[position[row]] = -y_series[k]
+            else:
+                columns[position[row]] = row
+                values[position[row]] = y_series[k] + y_shunt[k]
+            position[row] += 1
+
+    # Sort each row stably by column (insertion sort) and sum the duplicate elements
+    indptr = np.zeros(number_of_buses + 1, dtype=np.int64)
+    indices = np.empty(pointers[-1], dtype=np.int64)
+    data = np.empty(pointers[-1], dtype=np.complex128)
+    nnz = 0
+    for row in range(number_of_buses):
+        start = pointers[row]
+        stop = pointers[row + 1]
+        for k in range(start + 1, stop):
+            column = columns[k]
+            value = values[k]
+            j = k
+            while j > start and columns[j - 1] > column:
+                columns[j] = columns[j - 1]
+                values[j] = values[j - 1]
+                j -= 1
+            columns[j] = column
+            values[j] = value
+        k = start
+        while k < stop:
+            column = columns[k]
+            value = values[k]
+            k += 1
+            while k < stop and columns[k] == column:
+                value += values[k]
+                k += 1
+            indices[nnz] = column
+            data[nnz] = value
+            nnz += 1
+        indptr[row + 1] = nnz
+
+    return data[:nnz], indices[:nnz], indptr
+
+
+@_jit
+def selected_inversion(indptr, indices, data, d):
+    """
+    Calculate the elements of the inverse of L D L^T on the pattern of L (CSC arrays with sorted row indices and the
+    unit diagonal) and its diagonal, with the same recursion as SymmetricFactorization.
+
+    The elements Z[rows, rows] needed for column j are gathered by walking each earlier column along the sorted rows
+    of column j, instead of looking them up one by one, so that the results equal those of the NumPy implementation
+    up to rounding.
+    """
+
+    number_of_columns = d.size
+    Z = np.zeros_like(data)
+    diagonal = np.zeros_like(d)
+
+    for j in range(number_of_columns - 1, -1, -1):
+        # Skip the diagonal element of the column
+        start = indptr[j]
+        stop = indptr[j + 1]
+        while start < stop and indices[start] <= j:
+            start += 1
+
+        # Calculate z = -Z[rows, rows] @ l from the lower triangle of the symmetric block
+        for m in range(start, stop):
+            k = indices[m]
+            Z[m] -= diagonal[k] * data[m]
+            q = indptr[k]
+            for p in range(m + 1, stop):
+                while indices[q] < indices[p]:
+                    q += 1
+                Z[m] -= Z[q] * data[p]
+                Z[p] -= Z[q] * data[m]
+
+        # Calculate the diagonal element
+        total = diagonal[j] * 0
+        for m in range(start, stop):
+            total += data[m] * Z[m]
+        diagonal[j] = 1 / d[j] - total
+
+    return Z, diagonal
+
+
+# Sample usage
+if __name__ == '__main__':
+    from create_Yb import create_Yb
+    from gauss_seidel import gauss_seidel
+    import pickle
+
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Compare the results of both backends
+    print("Numba installed:", use_numba('numba'))
+    Y_b_numpy = create_Yb(system, sparse=True)
+    Y_b_numba = create_Yb(system, sparse=True, backend='numba')
+    print("Bus-admittance matrices identical:", np.array_equal(Y_b_numpy.toarray(), Y_b_numba.toarray()))
+    V_numpy, theta_numpy, _ = gauss_seidel(system)
+    V_numba, theta_numba, _ = gauss_seidel(system, backend='numba')
+    print("Gauss-Seidel results identical:",
+          np.array_equal(V_numpy, V_numba) and np.array_equal(theta_numpy, theta_numba))
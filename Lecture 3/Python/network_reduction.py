@@ -0,0 +1,120 @@
+from create_Yb import create_Yb
+from newton_raphson import newton_raphson
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import pickle
+
+
+def reduce_network(system, retained_buses, V=None, theta=None, Y_b=None, drop_tolerance=0.0):
+    """
+    Reduce a system to a set of retained buses with a Kron reduction of the network and Ward equivalent injections.
+
+    The bus-admittance matrix of the eliminated buses is factorized once, and only the columns of the retained
+    boundary buses (those connected to eliminated buses) are solved for, so the reduction Y_RR - Y_RE Y_EE^-1 Y_ER
+    changes only the boundary block and no dense inverse is formed. The injections of the eliminated buses at the
+    base-case voltages V and theta (in degrees; solved with Newton-Raphson if not given) are moved to the boundary
+    buses as Ward equivalent loads, so that the reduced system reproduces the base-case voltages of the retained
+    buses exactly. Buses without injections are thereby eliminated exactly (Kron reduction).
+
+    The reduced system has the layout of the original one, with the retained buses renumbered in increasing order
+    and their original indices in 'retained_buses'. The branches between retained buses are kept, the boundary block
+    is represented by equivalent branches and the shunt admittances in 'shunts'. Equivalent branches whose
+    admittance is below drop_tolerance times the largest one are dropped, keeping the self-admittances. If the
+    slack bus is eliminated, the boundary bus with the largest equivalent injection becomes the slack bus.
+    """
+
+    # Extract the system data
+    number_of_buses = system['buses'].shape[0]
+    retained = np.unique(np.asarray(retained_buses, dtype=int))
+    eliminated = np.setdiff1d(np.arange(number_of_buses), retained)
+    position = np.full(number_of_buses, -1)
+    position[retained] = np.arange(retained.size)
+
+    # Create the sparse bus-admittance matrix and solve the base case
+    if Y_b is None:
+        Y_b = create_Yb(system, sparse=True)
+    Y_b = sp.csr_matrix(Y_b)
+    if V is None or theta is None:
+        V, theta, _, _, _ = newton_raphson(system, Y_b=Y_b)
+    V_complex = np.asarray(V) * np.exp(1j * np.radians(np.asarray(theta)))
+
+    # Partition the bus-admittance matrix and determine the boundary buses
+    Y_RE = Y_b[retained, :][:, eliminated].tocsr()
+    Y_EE = Y_b[eliminated, :][:, eliminated].tocsc()
+    boundary = np.unique(Y_RE.nonzero()[0])
+
+    # Factorize the admittances of the eliminated buses once and solve for the boundary columns and the injections
+    lu = spla.splu(Y_EE)
+    Y_RE_boundary = Y_RE[boundary, :]
+    correction = -Y_RE_boundary @ lu.solve(Y_RE_boundary.T.toarray())
+    I_eliminated = (Y_b @ V_complex)[eliminated]
+    I_equivalent = -Y_RE_boundary @ lu.solve(I_eliminated)
+    S_equivalent = V_complex[retained[boundary]] * np.conj(I_equivalent)
+
+    # Keep the branches between retained buses
+    from_bus = system['branches'][:, 0].astype(int)
+    to_bus = system['branches'][:, 1].astype(int)
+    internal = (position[from_bus] >= 0) & (position[to_bus] >= 0)
+    branches = np.array(system['branches'][internal], dtype=float)
+    branches[:, 0] = position[from_bus[internal]]
+    branches[:, 1] = position[to_bus[internal]]
+
+    # The equivalent is the difference between the reduced matrix and the matrix of the internal branches
+    Y_RR = Y_b[retained, :][:, retained]
+    Y_internal = create_Yb({'buses': np.zeros((retained.size, 1)), 'branches': branches}, sparse=True)
+    Y_equivalent = (Y_RR - Y_internal)[boundary, :][:, boundary].toarray() + correction
+
+    # Represent the off-diagonal elements by equivalent branches and the rest of the self-admittances by shunts
+    rows, cols = np.triu_indices(boundary.size, 1)
+    y_branch = -Y_equivalent[rows, cols]
+    keep = np.abs(y_branch) > drop_tolerance * np.max(np.abs(y_branch), initial=0)
+    keep &= y_branch != 0
+    rows, cols, y_branch = rows[keep], cols[keep], y_branch[keep]
+    z_branch = 1 / y_branch
+    equivalent_branches = np.zeros((rows.size, branches.shape[1]))
+    equivalent_branches[:, 0] = boundary[rows]
+    equivalent_branches[:, 1] = boundary[cols]
+    equivalent_branches[:, 2] = z_branch.real
+    equivalent_branches[:, 3] = z_branch.imag
+    y_shunt = np.diag(Y_equivalent) - np.bincount(rows, y_branch.real, boundary.size) - \
+        1j * np.bincount(rows, y_branch.imag, boundary.size) - np.bincount(cols, y_branch.real, boundary.size) - \
+        1j * np.bincount(cols, y_branch.imag, boundary.size)
+
+    # Retain the buses and add the Ward equivalent injections to their loads
+    buses = np.array(system['buses'][retained], dtype=float)
+    buses[:, 0] = np.arange(retained.size)
+    buses[:, 3] = np.degrees(np.angle(V_complex[retained]))
+    pq = buses[:, 1] == 3
+    buses[pq, 2] = np.abs(V_complex[retained[pq]])
+    buses[boundary, 4] -= S_equivalent.real
+    buses[boundary, 5] -= S_equivalent.imag
+
+    # Choose a new slack bus if the slack bus has been eliminated
+    if not np.any(buses[:, 1] == 1):
+        if not boundary.size:
+            raise ValueError("The retained buses are not connected to the slack bus or the eliminated buses.")
+        slack_bus = boundary[np.argmax(np.abs(S_equivalent))]
+        buses[slack_bus, 1] = 1
+        buses[slack_bus, 2] = np.abs(V_complex[retained[slack_bus]])
+
+    return {
+        'buses': buses,
+        'branches': np.vstack([branches, equivalent_branches]),
+        'shunts': np.column_stack([boundary, y_shunt.real, y_shunt.imag]),
+        'retained_buses': retained,
+    }
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Reduce the system to the buses of one area and compare the power flow solutions
+    V, theta, _, _, _ = newton_raphson(system)
+    reduced = reduce_network(system, [0, 3, 4, 5, 8], V, theta)
+    V_reduced, theta_reduced, _, _, _ = newton_raphson(reduced)
+    print("Equivalent branches:", reduced['branches'][:, :2])
+    print("Largest voltage deviation of the retained buses:", np.max(np.abs(V_reduced - V[reduced['retained_buses']])))
@@ -0,0 +1,213 @@
+from create_Yb import create_Yb
+from newton_raphson import JACOBIAN_REUSE_RATIO, newton_raphson, power_injections, create_jacobian
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import pickle
+
+
+class NetworkSession:
+    """
+    Incremental power flow of a meshed network that keeps its converged state and Jacobian factorization between
+    changes.
+
+    After a change of the injections, the Newton iterations restart from the converged state and solve their steps
+    with the factorization of the Jacobian at a reference state (a chord method), which converges in a few cheap
+    iterations for small changes. Switching a branch changes the bus-admittance matrix by the rank-two admittance
+    of the branch, and the Jacobian, which is linear in the bus-admittance matrix, only in the rows and columns of
+    the two terminal buses. These changes are collected as a low-rank correction of the reference Jacobian and
+    applied with the Sherman-Morrison-Woodbury formula, so a switching action does not need a new factorization.
+    The Jacobian is refactorized at the current state when the correction exceeds max_rank rows or the chord
+    iterations converge slowly.
+    """
+
+    def __init__(self, system, tolerance=1e-8, max_iterations=20, max_rank=24):
+        self.system = {**system, 'buses': np.array(system['buses'], dtype=float)}
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.max_rank = max_rank
+        self.factorizations = 0
+
+        # Extract the bus types
+        bus_type = self.system['buses'][:, 1].astype(int)
+        self._non_slack_buses = np.where(bus_type != 1)[0]
+        self._pq_buses = np.where(bus_type == 3)[0]
+
+        # Solve the base case and factorize its Jacobian
+        self.Y_b = create_Yb(self.system, sparse=True)
+        V, theta, _, _, _ = newton_raphson(self.system, Y_b=self.Y_b)
+        self._V = V * np.exp(1j * np.radians(theta))
+        self._factorize()
+
+    def _factorize(self):
+        """
+        Factorize the Jacobian at the current state, which becomes the reference state, and drop the low-rank
+        correction.
+        """
+
+        J = create_jacobian(self.Y_b, self._V, self._non_slack_buses, self._pq_buses)
+        try:
+            self._lu = spla.splu(J)
+        except RuntimeError:
+            raise ValueError("The Jacobian is singular, e.g. because a part of the network is islanded.")
+        self._V_reference = np.copy(self._V)
+        self._J_correction = sp.csr_matrix(J.shape)
+        self._rows = np.array([], dtype=int)
+        self._update = None
+        self.factorizations += 1
+
+    def _set_correction(self, J_correction):
+        """
+        Prepare the Woodbury update of the reference factorization for the Jacobian correction E_R D E_C^T, where R
+        and C are the rows and columns of the correction and D their dense block.
+        """
+
+        J_correction = sp.csr_matrix(J_correction)
+        J_correction.eliminate_zeros()
+        rows = np.unique(J_correction.nonzero()[0])
+        columns = np.unique(J_correction.nonzero()[1])
+        D = J_correction[rows, :][:, columns].toarray()
+
+        # Solve the reference system for the unit vectors of the corrected rows
+        E = np.zeros((J_correction.shape[0], rows.size))
+        E[rows, np.arange(rows.size)] = 1
+        W = self._lu.solve(E)
+        K = np.linalg.inv(np.eye(rows.size) + D @ W[columns, :])
+
+        self._J_correction = J_correction
+        self._rows = rows
+        self._update = (columns, D, W, K)
+
+    def _solve_step(self, rhs):
+        """
+        Solve the Newton step with the reference factorization and the low-rank correction.
+        """
+
+        x = self._lu.solve(rhs)
+        if self._update is not None:
+            columns, D, W, K = self._update
+            x -= W @ (K @ (D @ x[columns]))
+
+        return x
+
+    def _mismatch(self):
+        P, Q = power_injections(self.Y_b, self._V)
+        p_specified = self.system['buses'][:, 6] - self.system['buses'][:, 4]
+        q_specified = self.system['buses'][:, 7] - self.system['buses'][:, 5]
+
+        return np.concatenate([p_specified[self._non_slack_buses] - P[self._non_slack_buses],
+                               q_specified[self._pq_buses] - Q[self._pq_buses]])
+
+    def solve(self):
+        """
+        Iterate from the current state until the largest power mismatch is below the tolerance and return the number
+        of iterations. Whenever the largest mismatch does not at least halve in an iteration, the Jacobian is
+        refactorized at the current state, as in the dishonest Newton method of newton_raphson.
+        """
+
+        number_of_angles = self._non_slack_buses.size
+        mismatch = self._mismatch()
+        max_mismatch = np.max(np.abs(mismatch), initial=0)
+        iteration = 0
+
+        while max_mismatch > self.tolerance:
+            if iteration >= self.max_iterations:
+                raise ValueError(f"The power flow did not converge in {iteration} iterations.")
+            iteration += 1
+
+            # Update the voltage phase angles and magnitudes with the chord step
+            dX = self._solve_step(mismatch)
+            V = np.abs(self._V)
+            theta = np.angle(self._V)
+            theta[self._non_slack_buses] += dX[:number_of_angles]
+            V[self._pq_buses] += dX[number_of_angles:]
+            self._V = V * np.exp(1j * theta)
+
+            # Refactorize the Jacobian if the chord iterations converge slowly
+            mismatch = self._mismatch()
+            previous_mismatch = max_mismatch
+            max_mismatch = np.max(np.abs(mismatch), initial=0)
+            if max_mismatch > self.tolerance and max_mismatch > JACOBIAN_REUSE_RATIO * previous_mismatch:
+                self._factorize()
+
+        return iteration
+
+    def set_loads(self, buses, p_load, q_load):
+        """
+        Change the active and reactive loads of some buses and solve the power flow from the current state.
+        """
+
+        self.system['buses'][buses, 4] = p_load
+        self.system['buses'][buses, 5] = q_load
+
+        return self.solve()
+
+    def set_generation(self, buses, p_gen, q_gen=None):
+        """
+        Change the active (and, for PQ buses, reactive) generation of some buses and solve the power flow from the
+        current state.
+        """
+
+        self.system['buses'][buses, 6] = p_gen
+        if q_gen is not None:
+            self.system['buses'][buses, 7] = q_gen
+
+        return self.solve()
+
+    def switch_branch(self, branch, in_service):
+        """
+        Switch a branch of the complete branch table out of or back into service and solve the power flow from the
+        current state.
+
+        The complete branch table and the in-service flags are kept in system['all_branches'] and
+        system['in_service'], as by switch_branch of the network cache. If the power flow of the new topology cannot
+        be solved (e.g. because the branch outage islands a bus), a ValueError is raised and the session keeps its
+        previous state.
+        """
+
+        all_branches = self.system.get('all_branches', self.system['branches'])
+        status = np.array(self.system.get('in_service', np.ones(all_branches.shape[0], dtype=bool)))
+        if status[branch] == in_service:
+            return 0
+        status[branch] = in_service
+        previous_state = dict(vars(self))
+        self.system = {**self.system, 'branches': all_branches[status], 'all_branches': all_branches,
+                       'in_service': status}
+
+        # Add or remove the admittance of the branch and correct the reference Jacobian, which is linear in Y_b
+        Y_branch = create_Yb({'buses': self.system['buses'], 'branches': all_branches[[branch]]}, sparse=True)
+        Y_change = Y_branch if in_service else -Y_branch
+        self.Y_b = self.Y_b + Y_change
+        J_change = create_jacobian(Y_change, self._V_reference, self._non_slack_buses, self._pq_buses)
+        J_correction = self._J_correction + J_change
+        try:
+            if np.unique(sp.csr_matrix(J_correction).nonzero()[0]).size > self.max_rank:
+                self._factorize()
+            else:
+                self._set_correction(J_correction)
+            return self.solve()
+        except (ValueError, np.linalg.LinAlgError):
+            vars(self).update(previous_state)
+            raise
+
+    def voltages(self):
+        """
+        Return the voltage magnitudes and phase angles (in degrees) of the current state.
+        """
+
+        return np.abs(self._V), np.angle(self._V, deg=True)
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Change a load and switch a branch out of service, and compare with complete solutions
+    session = NetworkSession(system)
+    print("Iterations after a load change:", session.set_loads(4, 1.2 * system['buses'][4, 4], system['buses'][4, 5]))
+    print("Iterations after a branch outage:", session.switch_branch(1, False))
+    V, theta, _, _, _ = newton_raphson(session.system)
+    print("Voltage magnitudes:", session.voltages()[0])
+    print("Largest deviation from a complete solution:", np.max(np.abs(session.voltages()[0] - V)))
@@ -1,121 +1,171 @@
 from create_Yb import create_Yb
+from linear_solvers import create_linear_solver
 
 import numpy as np
+import scipy.sparse as sp
 import pickle
 
+# Required reduction of the largest mismatch per iteration for a reused Jacobian to be kept
+JACOBIAN_REUSE_RATIO = 0.5
 
-def newton_raphson(system):
+
+def power_injections(Y_b, V):
+    """
+    Calculate the active and reactive power injections S = V * conj(Yb @ V) for the complex bus voltages V.
+    """
+
+    S = V * np.conj(Y_b @ V)
+
+    return np.real(S), np.imag(S)
+
+
+def create_jacobian(Y_b, V, non_slack_buses, pq_buses):
+    """
+    Create the sparse power flow Jacobian [[dP/dtheta, dP/dV], [dQ/dtheta, dQ/dV]] for the complex bus voltages V.
+
+    The rows correspond to the active power equations of the non-slack buses and the reactive power equations of
+    the PQ buses, the columns to the phase angles of the non-slack buses and the voltage magnitudes of the PQ buses.
+    """
+
+    # Form the diagonal matrices of the bus voltages, normalized bus voltages and bus current injections
+    I = Y_b @ V
+    diag_V = sp.diags(V)
+    diag_V_norm = sp.diags(V / np.abs(V))
+    diag_I = sp.diags(I)
+
+    # Calculate the derivatives of the complex power injections with respect to the phase angles and magnitudes
+    dS_dtheta = 1j * diag_V @ (diag_I - Y_b @ diag_V).conj()
+    dS_dV = diag_V @ (Y_b @ diag_V_norm).conj() + diag_I.conj() @ diag_V_norm
+
+    # Extract the real and imaginary parts
+    dS_dtheta = dS_dtheta.tocsr()
+    dS_dV = dS_dV.tocsr()
+    J1 = dS_dtheta.real[non_slack_buses, :][:, non_slack_buses]
+    J2 = dS_dV.real[non_slack_buses, :][:, pq_buses]
+    J3 = dS_dtheta.imag[pq_buses, :][:, non_slack_buses]
+    J4 = dS_dV.imag[pq_buses, :][:, pq_buses]
+
+    # Create the complete Jacobian matrix
+    return sp.bmat([[J1, J2], [J3, J4]], format='csc')
+
+
+def branch_power_flows(system, V):
+    """
+    Calculate the complex power flows at the sending and receiving ends of all branches for the complex bus voltages V.
+    """
+
+    # Extract the branch data
+    from_bus = system['branches'][:, 0].astype(int)
+    to_bus = system['branches'][:, 1].astype(int)
+    r = system['branches'][:, 2].astype(float)
+    x = system['branches'][:, 3].astype(float)
+    b = system['branches'][:, 4].astype(float)
+
+    # Calculate the branch currents at both ends of the pi-equivalent
+    y_series = 1 / (r + 1j * x)
+    I_from = (V[from_bus] - V[to_bus]) * y_series + V[from_bus] * 1j * b / 2
+    I_to = (V[to_bus] - V[from_bus]) * y_series + V[to_bus] * 1j * b / 2
+
+    return V[from_bus] * np.conj(I_from), V[to_bus] * np.conj(I_to)
+
+
+def newton_raphson(system, V0=None, theta0=None, max_iterations=100, Y_b=None, trace=None, linear_solver='direct',
+                   reuse_jacobian=False):
     """
     Perform power flow analysis using Newton-Raphson's power flow method.
+
+    The iterations start from the specified voltages unless the voltage magnitudes V0 and phase angles theta0
+    (in degrees) of a previous solution are given as a warm start. A sparse bus-admittance matrix that has already
+    been created for the same topology can be passed in as Y_b. A trace object (such as the SolverTrace of the
+    tools) records the mismatch, the voltage update and the phase timings of each iteration.
+
+    The Newton steps are solved with a sparse direct solver by default, or with linear_solver='gmres' or 'bicgstab'
+    (or a solver object from linear_solvers) using an ILU preconditioner that is reused over the iterations. If
+    reuse_jacobian is True, the Jacobian is only rebuilt when the largest mismatch does not at least halve in an
+    iteration (a dishonest Newton method).
     """
 
+    if trace is not None:
+        trace.start('newton_raphson')
+
     # Extract the system data
     number_of_buses = system['buses'].shape[0]
     bus_type = system['buses'][:, 1].astype(int)
+    non_slack_buses = np.where(bus_type != 1)[0]
     pq_buses = np.where(bus_type == 3)[0]
-    v_specified = system['buses'][:, 2]
-    theta = system['buses'][:, 3]
-    p_load = system['buses'][:, 4]
-    q_load = system['buses'][:, 5]
-    p_gen = system['buses'][:, 6]
-    q_gen = system['buses'][:, 7]
+    v_specified = system['buses'][:, 2].astype(float)
+    theta = np.radians(system['buses'][:, 3].astype(float))
+    p_load = system['buses'][:, 4].astype(float)
+    q_load = system['buses'][:, 5].astype(float)
+    p_gen = system['buses'][:, 6].astype(float)
+    q_gen = system['buses'][:, 7].astype(float)
 
     # Calculate the specified active and reactive power injections
     p_specified = p_gen - p_load
     q_specified = q_gen - q_load
 
-    # Create the bus-admittance matrix and evaluate its real and imaginary parts
-    Y_b = create_Yb(system)
-    G = np.real(Y_b)
-    B = np.imag(Y_b)
+    # Create the sparse bus-admittance matrix
+    if Y_b is None:
+        Y_b = create_Yb(system, sparse=True)
+    if trace is not None:
+        trace.setup_phase('Y_b')
+
+    # Apply the warm start, keeping the specified voltage magnitudes of the slack and PV buses
+    if V0 is not None:
+        V = np.asarray(V0, dtype=float).copy()
+        V[bus_type != 3] = v_specified[bus_type != 3]
+    else:
+        V = np.copy(v_specified)
+    if theta0 is not None:
+        theta = np.radians(np.asarray(theta0, dtype=float))
+        theta[bus_type == 1] = np.radians(system['buses'][bus_type == 1, 3].astype(float))
 
     # Initialize the calculation variables
-    V = np.copy(v_specified)
-    V_old = np.zeros_like(V)
+    V_old = np.zeros(number_of_buses, dtype=complex)
+    number_of_angles = non_slack_buses.size
+    solver = create_linear_solver(linear_solver)
+    J = None
+    mismatch = np.inf
     iteration = 0
     tolerance = 1e-6
 
     # Main loop
-    while np.any(np.abs(V * np.exp(1j * theta) - V_old) > tolerance):
+    while np.any(np.abs(V * np.exp(1j * theta) - V_old) > tolerance) and iteration < max_iterations:
         # Update the iteration variables
         V_old = V * np.exp(1j * theta)
         iteration += 1
 
         # Determine active and reactive power injections
-        P = np.zeros(number_of_buses)
-        Q = np.zeros(number_of_buses)
-        for i in range(number_of_buses):
-            for j in range(number_of_buses):
-                P[i] += V[i] * V[j] * (G[i, j] * np.cos(theta[i] - theta[j]) + B[i, j] * np.sin(theta[i] - theta[j]))
-                Q[i] += V[i] * V[j] * (G[i, j] * np.sin(theta[i] - theta[j]) - B[i, j] * np.cos(theta[i] - theta[j]))
+        P, Q = power_injections(Y_b, V_old)
 
         # Determine the active and reactive power injection deviations
-        dP = p_specified - P
-        dP = dP[1:]
-        dQ = q_specified - Q
-        dQ = dQ[pq_buses]
-
-        # Create J1 = dP/dtheta
-        J1 = np.zeros((number_of_buses, number_of_buses))
-        for i in range(number_of_buses):
-            for j in range(number_of_buses):
-                if i == j:
-                    for k in range(number_of_buses):
-                        J1[i, i] += V[i] * V[k] * (
-                                    -G[i, k] * np.sin(theta[i] - theta[k]) + B[i, k] * np.cos(theta[i] - theta[k]))
-                    J1[i, i] -= V[i] ** 2 * B[i, i]
-                else:
-                    J1[i, j] = V[i] * V[j] * (
-                                G[i, j] * np.sin(theta[i] - theta[j]) - B[i, j] * np.cos(theta[i] - theta[j]))
-        J1 = J1[1:, 1:]
-
-        # Create J2 = dP/dV
-        J2 = np.zeros((number_of_buses, number_of_buses))
-        for i in range(number_of_buses):
-            for j in range(number_of_buses):
-                if i == j:
-                    for k in range(number_of_buses):
-                        J2[i, i] += V[k] * (G[i, k] * np.cos(theta[i] - theta[k]) + B[i, k] * np.sin(theta[i] - theta[k]))
-                    J2[i, i] += G[i, i] * V[i]
-                else:
-                    J2[i, j] = V[i] * (G[i, j] * np.cos(theta[i] - theta[j]) + B[i, j] * np.sin(theta[i] - theta[j]))
-        J2 = J2[1:, pq_buses]
-
-        # Create J3 = dQ/dtheta
-        J3 = np.zeros((number_of_buses, number_of_buses))
-        for i in range(number_of_buses):
-            for j in range(number_of_buses):
-                if i == j:
-                    for k in range(number_of_buses):
-                        J3[i, i] += V[i] * V[k] * (G[i, k] * np.cos(theta[i] - theta[k]) + B[i, k] * np.sin(theta[i] - theta[k]))
-                    J3[i, i] -= G[i, i] * V[i] ** 2
-                else:
-                    J3[i, j] = -V[i] * V[j] * (G[i, j] * np.cos(theta[i] - theta[j]) + B[i, j] * np.sin(theta[i] - theta[j]))
-        J3 = J3[pq_buses, 1:]
-
-        # Create J4 = dQ/dtheta
-        J4 = np.zeros((number_of_buses, number_of_buses))
-        for i in range(number_of_buses):
-            for j in range(number_of_buses):
-                if i == j:
-                    for k in range(number_of_buses):
-                        J4[i, i] += V[k] * (G[i, k] * np.sin(theta[i] - theta[k]) - B[i, k] * np.cos(theta[i] - theta[k]))
-                    J4[i, i] -= B[i, i] * V[i]
-                else:
-                    J4[i, j] = V[i] * (G[i, j] * np.sin(theta[i] - theta[j]) - B[i, j] * np.cos(theta[i] - theta[j]))
-        J4 = J4[pq_buses, :][:, pq_buses]
-
-        # Create the complete Jacobian matrix
-        J = np.block([[J1, J2], [J3, J4]])
+        dP = p_specified[non_slack_buses] - P[non_slack_buses]
+        dQ = q_specified[pq_buses] - Q[pq_buses]
+        if trace is not None:
+            trace.phase('mismatch')
+
+        # Create the sparse Jacobian matrix, unless the previous one is reused while the mismatch decreases fast
+        rebuild = J is None or not reuse_jacobian
+        if reuse_jacobian:
+            previous_mismatch = mismatch
+            mismatch = max(np.max(np.abs(dP), initial=0), np.max(np.abs(dQ), initial=0))
+            rebuild = rebuild or mismatch > JACOBIAN_REUSE_RATIO * previous_mismatch
+        if rebuild:
+            J = create_jacobian(Y_b, V_old, non_slack_buses, pq_buses)
+            if trace is not None:
+                trace.phase('jacobian')
 
         # Solve the linear system of equations
-        dX = np.linalg.solve(J, np.concatenate([dP, dQ]))
+        dX = solver.solve(J, np.concatenate([dP, dQ]), rebuild)
+        if trace is not None:
+            trace.phase('linear_solve')
 
         # Update the voltage magnitudes and voltage phase angles
-        dTh = dX[:number_of_buses - 1]
-        dV = dX[number_of_buses - 1:]
-        theta[1:] += dTh
-        V[pq_buses] += dV
+        theta[non_slack_buses] += dX[:number_of_angles]
+        V[pq_buses] += dX[number_of_angles:]
+        if trace is not None:
+            trace.iteration(iteration, max(np.max(np.abs(dP), initial=0), np.max(np.abs(dQ), initial=0)),
+                            np.max(np.abs(dX), initial=0))
 
     # Convert theta to degrees
     theta = np.rad2deg(theta)
@@ -132,4 +182,3 @@ if __name__ == '__main__':
     v, theta, P, Q, iteration = newton_raphson(system)
     print("Voltage magnitudes:", v)
     print("Voltage phase angles:", theta)
-
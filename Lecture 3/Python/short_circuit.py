@@ -0,0 +1,156 @@
+from create_Yb import create_Yb
+from linear_solvers import SymmetricFactorization
+
+import numpy as np
+import scipy.sparse as sp
+import pickle
+
+# Kinds of faults: three-phase, single line-to-ground, line-to-line and double line-to-ground
+FAULT_KINDS = ['three_phase', 'line_to_ground', 'line_to_line', 'double_line_to_ground']
+
+# Operator of the symmetrical components and the transformation from sequence to phase quantities
+a = np.exp(2j * np.pi / 3)
+A = np.array([[1, 1, 1], [1, a ** 2, a], [1, a, a ** 2]])
+
+
+class ShortCircuit:
+    """
+    Sparse short-circuit model of a system, which factorizes the sequence bus-admittance matrices once.
+
+    The positive-sequence network is the bus-admittance matrix with the subtransient reactances of the generators
+    (at the slack and PV buses) connected to ground, and the negative-sequence network is assumed to be equal to it.
+    The zero-sequence network scales the series impedances of all branches by zero_sequence_ratio and connects the
+    generators through their zero-sequence reactances, i.e. all branches and generators are assumed to be grounded.
+    The prefault voltages are 1 p.u. unless the complex voltages of a power flow solution are given.
+
+    The fault impedances Z_kk, the diagonal elements of Zbus = Ybus^-1, are computed for all buses at once from the
+    factors by selected inversion when faults are screened, and the Zbus columns needed for the post-fault voltages
+    are computed by forward and back substitution with the factors for a batch of buses at a time. With
+    backend='numba', the selected inversion runs in a compiled loop (if Numba is installed).
+    """
+
+    def __init__(self, system, generator_reactance=0.2, generator_zero_reactance=0.05, zero_sequence_ratio=3.0,
+                 V_prefault=None, backend='numpy'):
+        # Extract the system data
+        self.number_of_buses = system['buses'].shape[0]
+        bus_type = system['buses'][:, 1].astype(int)
+        generators = np.flatnonzero(bus_type != 3)
+        self.V_prefault = np.ones(self.number_of_buses, dtype=complex) if V_prefault is None else \
+            np.asarray(V_prefault, dtype=complex)
+
+        # Create the positive-sequence bus-admittance matrix with the generator admittances
+        x_generator = np.broadcast_to(np.asarray(generator_reactance, dtype=float), (self.number_of_buses,))
+        Y_1 = create_Yb(system, sparse=True) + self._grounding(generators, x_generator[generators])
+
+        # Create the zero-sequence bus-admittance matrix
+        branches = np.array(system['branches'], dtype=float)
+        branches[:, 2:4] *= zero_sequence_ratio
+        x_zero = np.broadcast_to(np.asarray(generator_zero_reactance, dtype=float), (self.number_of_buses,))
+        Y_0 = create_Yb({**system, 'branches': branches}, sparse=True) + self._grounding(generators, x_zero[generators])
+
+        # Factorize both matrices once
+        self.factorization_1 = SymmetricFactorization(backend)
+        self.factorization_1.factorize(Y_1)
+        self.factorization_0 = SymmetricFactorization(backend)
+        self.factorization_0.factorize(Y_0)
+
+    def _grounding(self, buses, x):
+        """
+        Create the diagonal matrix of the admittances of reactances x connected from the buses to ground.
+        """
+
+        return sp.coo_matrix((1 / (1j * x), (buses, buses)), shape=(self.number_of_buses, self.number_of_buses))
+
+    def impedance_columns(self, buses, sequence='positive'):
+        """
+        Return the columns of the positive- (and negative-) or zero-sequence Zbus of the given buses (buses x faults).
+        """
+
+        buses = np.atleast_1d(np.asarray(buses, dtype=int))
+        E = np.zeros((self.number_of_buses, buses.size), dtype=complex)
+        E[buses, np.arange(buses.size)] = 1
+        factorization = self.factorization_0 if sequence == 'zero' else self.factorization_1
+
+        return factorization.solve(E)
+
+    def impedance_diagonal(self, sequence='positive'):
+        """
+        Return the diagonal of the positive- (and negative-) or zero-sequence Zbus by selected inversion.
+        """
+
+        factorization = self.factorization_0 if sequence == 'zero' else self.factorization_1
+
+        return factorization.inverse_diagonal()
+
+    def _sequence_currents(self, kind, V_f, Z_1, Z_0, Z_f):
+        """
+        Calculate the zero-, positive- and negative-sequence fault currents (3 x faults) of a kind of fault.
+        """
+
+        Z_2 = Z_1
+        if kind == 'three_phase':
+            I_1 = V_f / (Z_1 + Z_f)
+            return np.array([np.zeros_like(I_1), I_1, np.zeros_like(I_1)])
+        if kind == 'line_to_ground':
+            I_0 = V_f / (Z_1 + Z_2 + Z_0 + 3 * Z_f)
+            return np.array([I_0, I_0, I_0])
+        if kind == 'line_to_line':
+            I_1 = V_f / (Z_1 + Z_2 + Z_f)
+            return np.array([np.zeros_like(I_1), I_1, -I_1])
+        if kind == 'double_line_to_ground':
+            Z_ground = Z_0 + 3 * Z_f
+            I_1 = V_f / (Z_1 + Z_2 * Z_ground / (Z_2 + Z_ground))
+            return np.array([-I_1 * Z_2 / (Z_2 + Z_ground), I_1, -I_1 * Z_ground / (Z_2 + Z_ground)])
+
+        raise ValueError(f"Unknown fault kind {kind}, expected one of {', '.join(FAULT_KINDS)}.")
+
+    def fault_currents(self, buses=None, kind='three_phase', Z_f=0.0):
+        """
+        Screen faults at many buses (all buses by default) and return the largest phase current of each fault.
+
+        The fault impedances are taken from the diagonals of the sequence Zbus matrices, which are calculated for all
+        buses at once by selected inversion, so that screening every bus costs about as much as a few factorizations.
+        Z_f is the fault impedance (zero for bolted faults), a scalar or one value per faulted bus.
+        """
+
+        buses = np.arange(self.number_of_buses) if buses is None else np.atleast_1d(np.asarray(buses, dtype=int))
+        Z_f = np.broadcast_to(np.asarray(Z_f, dtype=complex), buses.shape)
+        Z_1 = self.impedance_diagonal()[buses]
+        Z_0 = self.impedance_diagonal('zero')[buses] if kind != 'three_phase' else np.zeros(buses.size, dtype=complex)
+        I_sequence = self._sequence_currents(kind, self.V_prefault[buses], Z_1, Z_0, Z_f)
+
+        return np.max(np.abs(A @ I_sequence), axis=0)
+
+    def fault(self, bus, kind='three_phase', Z_f=0.0):
+        """
+        Analyze a fault at one bus and return a dictionary with the phase fault currents, the sequence fault currents
+        and the post-fault phase voltages of all buses (buses x 3).
+        """
+
+        Z_1 = self.impedance_columns(bus)[:, 0]
+        Z_0 = self.impedance_columns(bus, 'zero')[:, 0]
+        I_0, I_1, I_2 = self._sequence_currents(kind, self.V_prefault[bus], Z_1[bus], Z_0[bus], Z_f)
+
+        # Calculate the post-fault sequence voltages with the Zbus columns of the faulted bus
+        V_sequence = np.column_stack([-Z_0 * I_0, self.V_prefault - Z_1 * I_1, -Z_1 * I_2])
+
+        return {
+            'I_fault': A @ np.array([I_0, I_1, I_2]),
+            'I_sequence': np.array([I_0, I_1, I_2]),
+            'V_phase': V_sequence @ A.T,
+        }
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Screen bolted faults of all kinds at all buses
+    short_circuit = ShortCircuit(system)
+    for kind in FAULT_KINDS:
+        print(f"{kind} fault currents:", short_circuit.fault_currents(kind=kind))
+    # Analyze a line-to-ground fault through an impedance at one bus
+    result = short_circuit.fault(4, 'line_to_ground', Z_f=0.05)
+    print("Phase fault currents:", np.abs(result['I_fault']))
+    print("Post-fault voltage magnitudes of phase a:", np.abs(result['V_phase'][:, 0]))
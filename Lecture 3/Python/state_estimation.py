@@ -0,0 +1,298 @@
+from create_Yb import create_Yb
+from newton_raphson import newton_raphson, power_injections, create_jacobian, branch_power_flows, \
+    JACOBIAN_REUSE_RATIO
+from linear_solvers import SymmetricFactorization
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.stats import chi2
+import pickle
+
+# Kinds of measurements, whose index is stored in the first column of the measurement table [kind, element, value,
+# sigma]: bus power injections, branch power flows at the from and to ends and bus voltage magnitudes
+MEASUREMENT_KINDS = ['p_injection', 'q_injection', 'p_from', 'q_from', 'p_to', 'q_to', 'v_magnitude']
+
+
+def _branch_flow_derivatives(Y_branch, C_branch, V):
+    """
+    Calculate the derivatives of the complex branch power flows S = (C_branch @ V) * conj(Y_branch @ V) at one end of
+    the branches with respect to the phase angles and the voltage magnitudes of all buses.
+    """
+
+    I = sp.diags(np.conj(Y_branch @ V))
+    V_branch = sp.diags(C_branch @ V)
+    diag_V = sp.diags(V)
+    diag_V_norm = sp.diags(V / np.abs(V))
+
+    dS_dtheta = 1j * (I @ C_branch @ diag_V - V_branch @ (Y_branch @ diag_V).conj())
+    dS_dV = V_branch @ (Y_branch @ diag_V_norm).conj() + I @ C_branch @ diag_V_norm
+
+    return dS_dtheta.tocsr(), dS_dV.tocsr()
+
+
+def simulate_measurements(system, V, theta, sigma=0.01, voltage_sigma=0.004, seed=None):
+    """
+    Create a measurement table of the voltage magnitudes and power injections of all buses and the power flows at
+    the from ends of all branches from a power flow solution (theta in degrees), with Gaussian errors of standard
+    deviation sigma (powers) and voltage_sigma (voltage magnitudes).
+    """
+
+    rng = np.random.default_rng(seed)
+    number_of_buses = system['buses'].shape[0]
+    number_of_branches = system['branches'].shape[0]
+    V_complex = V * np.exp(1j * np.radians(theta))
+
+    # Calculate the true values of the measured quantities
+    P, Q = power_injections(create_Yb(system, sparse=True), V_complex)
+    S_from, _ = branch_power_flows(system, V_complex)
+    kind = np.repeat([6, 0, 1, 2, 3], [number_of_buses] * 3 + [number_of_branches] * 2)
+    element = np.concatenate([np.arange(number_of_buses)] * 3 + [np.arange(number_of_branches)] * 2)
+    value = np.concatenate([V, P, Q, S_from.real, S_from.imag])
+    deviation = np.where(kind == 6, voltage_sigma, sigma)
+
+    return np.column_stack([kind, element, value + deviation * rng.standard_normal(value.size), deviation])
+
+
+class StateEstimator:
+    """
+    Weighted-least-squares state estimator, which solves the normal equations G dx = H^T W r with the sparse gain
+    matrix G = H^T W H in each Gauss-Newton iteration.
+
+    The measurement table holds one row [kind, element, value, sigma] per measurement, with the kind as an index of
+    MEASUREMENT_KINDS. The measured quantities are calculated with the bus-admittance matrix and the power flow
+    functions of Newton-Raphson's method, whose Jacobian also gives the rows of the injection measurements. The state
+    consists of the phase angles of all buses except the slack bus (the reference) and all voltage magnitudes.
+
+    The layout of the measurements is fixed, so the sparsity pattern of the gain matrix is the same in every scan and
+    its ordering is determined only once. Each scan passes the new measured values and starts from the estimate of
+    the previous scan. If reuse_gain is True, the factorized gain matrix of the previous iteration (or scan) is kept
+    as long as the largest state update at least halves in each iteration, which does not change the solution since
+    H^T W r = 0 at convergence. Bad data are detected with the chi-square test of the objective and identified with the
+    largest normalized residual test, in which the residual covariances come from the selected inverse of the gain
+    matrix and the residuals are updated with a single solve per identified measurement. With backend='numba', the
+    selected inversion runs in a compiled loop (if Numba is installed).
+    """
+
+    def __init__(self, system, measurements, Y_b=None, tolerance=1e-6, max_iterations=20, reuse_gain=True,
+                 backend='numpy'):
+        # Extract the system data
+        self.system = system
+        self.number_of_buses = system['buses'].shape[0]
+        number_of_branches = system['branches'].shape[0]
+        bus_type = system['buses'][:, 1].astype(int)
+        self.reference_bus = int(np.flatnonzero(bus_type == 1)[0]) if np.any(bus_type == 1) else 0
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.reuse_gain = reuse_gain
+
+        # Extract the measurement data
+        measurements = np.asarray(measurements, dtype=float)
+        self.kind = measurements[:, 0].astype(int)
+        self.element = measurements[:, 1].astype(int)
+        self.values = measurements[:, 2].copy()
+        self.sigma = measurements[:, 3].copy()
+        self.weights = 1 / self.sigma ** 2
+        if np.any((self.kind < 0) | (self.kind >= len(MEASUREMENT_KINDS))):
+            raise ValueError(f"Unknown measurement kind, expected indices of {', '.join(MEASUREMENT_KINDS)}.")
+
+        # Index of each measurement in the vector of all measurable quantities of the kinds
+        sizes = np.array([self.number_of_buses] * 2 + [number_of_branches] * 4 + [self.number_of_buses])
+        self.index = np.concatenate([[0], np.cumsum(sizes)])[self.kind] + self.element
+
+        # Create the bus-admittance matrix and the branch admittance and connection matrices of both ends
+        self.Y_b = create_Yb(system, sparse=True) if Y_b is None else sp.csr_matrix(Y_b)
+        from_bus = system['branches'][:, 0].astype(int)
+        to_bus = system['branches'][:, 1].astype(int)
+        y_series = 1 / (system['branches'][:, 2] + 1j * system['branches'][:, 3])
+        y_shunt = 1j * system['branches'][:, 4] / 2
+        branches = np.arange(number_of_branches)
+        shape = (number_of_branches, self.number_of_buses)
+        self.Y_from = sp.csr_matrix((np.concatenate([y_series + y_shunt, -y_series]),
+                                     (np.concatenate([branches, branches]), np.concatenate([from_bus, to_bus]))), shape)
+        self.Y_to = sp.csr_matrix((np.concatenate([y_series + y_shunt, -y_series]),
+                                   (np.concatenate([branches, branches]), np.concatenate([to_bus, from_bus]))), shape)
+        self.C_from = sp.csr_matrix((np.ones(number_of_branches), (branches, from_bus)), shape)
+        self.C_to = sp.csr_matrix((np.ones(number_of_branches), (branches, to_bus)), shape)
+
+        # Columns of the state: the phase angles of the non-reference buses and all voltage magnitudes
+        all_buses = np.arange(self.number_of_buses)
+        self.state = np.concatenate([np.delete(all_buses, self.reference_bus), self.number_of_buses + all_buses])
+        if self.values.size < self.state.size:
+            raise ValueError("There are fewer measurements than state variables.")
+
+        # Start from the specified voltages
+        self.V = system['buses'][:, 2].astype(float).copy()
+        self.theta = np.radians(system['buses'][:, 3].astype(float))
+        self.factorization = SymmetricFactorization(backend)
+
+    def measurement_functions(self, V):
+        """
+        Calculate the measured quantities h(x) and their sparse Jacobian H (measurements x state) for the complex bus
+        voltages V.
+        """
+
+        all_buses = np.arange(self.number_of_buses)
+
+        # Calculate all measurable quantities
+        P, Q = power_injections(self.Y_b, V)
+        S_from, S_to = branch_power_flows(self.system, V)
+        h = np.concatenate([P, Q, S_from.real, S_from.imag, S_to.real, S_to.imag, np.abs(V)])[self.index]
+
+        # Stack the derivatives of all measurable quantities and keep the rows of the measurements
+        J_injections = create_jacobian(self.Y_b, V, all_buses, all_buses)
+        dS_from_dtheta, dS_from_dV = _branch_flow_derivatives(self.Y_from, self.C_from, V)
+        dS_to_dtheta, dS_to_dV = _branch_flow_derivatives(self.Y_to, self.C_to, V)
+        H = sp.vstack([
+            J_injections,
+            sp.hstack([dS_from_dtheta.real, dS_from_dV.real]), sp.hstack([dS_from_dtheta.imag, dS_from_dV.imag]),
+            sp.hstack([dS_to_dtheta.real, dS_to_dV.real]), sp.hstack([dS_to_dtheta.imag, dS_to_dV.imag]),
+            sp.hstack([sp.csr_matrix((self.number_of_buses, self.number_of_buses)), sp.identity(self.number_of_buses)]),
+        ], format='csr')[self.index, :][:, self.state]
+
+        return h, H.tocsr()
+
+    def _factorize_gain(self, H):
+        """
+        Factorize the gain matrix H^T W H, reusing the ordering of the first scan.
+        """
+
+        G = (H.T @ sp.diags(self.weights) @ H).tocsc()
+        try:
+            self.factorization.factorize(G)
+        except RuntimeError:
+            raise ValueError("The system is not observable with the given measurements.") from None
+
+    def _gauss_newton(self):
+        """
+        Iterate from the current state until the largest state update is below the tolerance, and return the
+        residuals, the Jacobian of the last iteration and the number of iterations.
+        """
+
+        number_of_angles = self.number_of_buses - 1
+        non_reference_buses = self.state[:number_of_angles]
+        refactorize = not self.reuse_gain or self.factorization.lu is None
+        step = np.inf
+
+        for iteration in range(1, self.max_iterations + 1):
+            h, H = self.measurement_functions(self.V * np.exp(1j * self.theta))
+            residuals = self.values - h
+
+            # Solve the normal equations, factorizing the gain matrix unless the previous one is reused
+            if refactorize:
+                self._factorize_gain(H)
+            dx = self.factorization.solve(H.T @ (self.weights * residuals))
+
+            # Update the phase angles and the voltage magnitudes
+            self.theta[non_reference_buses] += dx[:number_of_angles]
+            self.V += dx[number_of_angles:]
+            previous_step, step = step, np.max(np.abs(dx), initial=0)
+            if step < self.tolerance:
+                break
+            refactorize = not self.reuse_gain or step > JACOBIAN_REUSE_RATIO * previous_step
+
+        h, H = self.measurement_functions(self.V * np.exp(1j * self.theta))
+
+        return self.values - h, H, iteration
+
+    def residual_variances(self, H):
+        """
+        Calculate the diagonal of the residual covariance matrix Omega = R - H G^-1 H^T from the elements of the
+        inverse gain matrix at the pairs of nonzeros of each row of H.
+        """
+
+        H = sp.csr_matrix(H)
+        row_sizes = np.diff(H.indptr)
+
+        # Form all pairs of nonzeros of each row
+        pair_counts = row_sizes ** 2
+        pair_row = np.repeat(np.arange(H.shape[0]), pair_counts)
+        pair_start = np.repeat(H.indptr[:-1], pair_counts)
+        pair_offset = np.arange(pair_counts.sum()) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+        pair_size = np.repeat(row_sizes, pair_counts)
+        first = pair_start + pair_offset // np.maximum(pair_size, 1)
+        second = pair_start + pair_offset % np.maximum(pair_size, 1)
+
+        # Sum h_i^T G^-1 h_i over the pairs
+        Z = self.factorization.inverse_elements(H.indices[first], H.indices[second])
+        projection = np.bincount(pair_row, H.data[first] * H.data[second] * Z, H.shape[0])
+
+        return self.sigma ** 2 - projection
+
+    def estimate(self, values=None, bad_data_threshold=3.0, confidence=0.99, max_bad_data=10):
+        """
+        Estimate the state for the measured values of a scan (the stored values if not given) and return a dictionary
+        with the voltage magnitudes, the phase angles (in degrees), the residuals, the objective, the number of
+        iterations and the identified bad data.
+
+        While the objective exceeds the chi-square limit of the given confidence, the measurement with the largest
+        normalized residual above bad_data_threshold is identified as bad data and its value is corrected by the
+        expected error, after which the residuals are updated linearly with one column of Omega, up to max_bad_data
+        measurements. The state is then re-estimated with the corrected values, whose gain matrix keeps its pattern
+        and ordering. With bad_data_threshold None, no bad data are processed.
+        """
+
+        if values is not None:
+            self.values = np.asarray(values, dtype=float).copy()
+
+        residuals, H, iterations = self._gauss_newton()
+        objective = np.sum(self.weights * residuals ** 2)
+        bad_data = []
+
+        # Detect bad data with the chi-square test of the objective
+        limit = chi2.ppf(confidence, max(self.values.size - self.state.size, 1))
+        if bad_data_threshold is not None and objective > limit:
+            self._factorize_gain(H)
+            omega = self.residual_variances(H)
+
+            # Critical measurements (without redundancy) have no residual covariance and cannot be identified
+            redundant = omega > 1e-12 * self.sigma ** 2
+            normalized = np.zeros_like(residuals)
+            r = residuals.copy()
+
+            # Identify the measurement with the largest normalized residual and update the residuals linearly, until
+            # the objective of the updated residuals passes the chi-square test
+            while len(bad_data) < max_bad_data and np.sum(self.weights * r ** 2) > limit:
+                normalized[redundant] = np.abs(r[redundant]) / np.sqrt(omega[redundant])
+                k = int(np.argmax(normalized))
+                if normalized[k] <= bad_data_threshold:
+                    break
+                omega_column = -H @ self.factorization.solve(H[k, :].toarray().ravel())
+                omega_column[k] += self.sigma[k] ** 2
+                self.values[k] -= self.sigma[k] ** 2 / omega[k] * r[k]
+                r -= r[k] / omega[k] * omega_column
+                bad_data.append(k)
+
+            # Re-estimate the state with the corrected values
+            if bad_data:
+                residuals, H, extra_iterations = self._gauss_newton()
+                iterations += extra_iterations
+                objective = np.sum(self.weights * residuals ** 2)
+
+        return {
+            'V': self.V.copy(),
+            'theta': np.degrees(self.theta),
+            'residuals': residuals,
+            'objective': objective,
+            'iterations': iterations,
+            'bad_data': np.array(bad_data, dtype=int),
+        }
+
+
+# Sample usage
+if __name__ == '__main__':
+    # Load the system data
+    with open("9 bus system.pkl", "rb") as file:
+        system = pickle.load(file)
+    # Simulate the measurements of a power flow solution
+    V, theta, _, _, _ = newton_raphson(system)
+    measurements = simulate_measurements(system, V, theta, seed=0)
+    estimator = StateEstimator(system, measurements)
+    result = estimator.estimate()
+    print("Largest voltage magnitude error:", np.max(np.abs(result['V'] - V)))
+    print("Largest phase angle error:", np.max(np.abs(result['theta'] - theta)))
+    # Estimate the next scan with a gross error in the active power flow of branch 4
+    values = measurements[:, 2].copy()
+    values[27 + 4] += 0.5
+    result = estimator.estimate(values)
+    print("Bad data:", result['bad_data'], "in", result['iterations'], "iterations")
+    print("Largest voltage magnitude error:", np.max(np.abs(result['V'] - V)))
@@ -0,0 +1,63 @@
+from create_Yb import create_Yb
+from gauss_seidel import gauss_seidel
+
+import numpy as np
+import pytest
+import importlib.util
+import os
+import pickle
+
+# The compiled kernels are compared with NumPy only if Numba is installed
+requires_numba = pytest.mark.skipif(importlib.util.find_spec('numba') is None, reason="Numba is not installed")
+
+@pytest.fixture
+def system():
+    """
+    Load the 9-bus system.
+    """
+
+    with open(os.path.join(os.path.dirname(__file__), "9 bus system.pkl"), "rb") as file:
+        return pickle.load(file)
+
+
+def _nonsingular_transformation(system):
+    """
+    Create the dense bus-admittance matrix branch by branch, as the original create_Yb did.
+    """
+
+    number_of_buses = system['buses'].shape[0]
+    Y_b = np.zeros((number_of_buses, number_of_buses), dtype=complex)
+    for from_bus, to_bus, r, x, b in system['branches'][:, :5]:
+        i, j = int(from_bus), int(to_bus)
+        Y_b[i, j] -= 1 / (r + 1j * x)
+        Y_b[j, i] -= 1 / (r + 1j * x)
+        Y_b[i, i] += 1 / (r + 1j * x) + 1j * b / 2
+        Y_b[j, j] += 1 / (r + 1j * x) + 1j * b / 2
+
+    return Y_b
+
+
+def test_create_Yb_sparse(system):
+    Y_b_sparse = create_Yb(system, sparse=True)
+
+    assert Y_b_sparse.format == 'csr'
+    np.testing.assert_allclose(Y_b_sparse.toarray(), _nonsingular_transformation(system), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(create_Yb(system), Y_b_sparse.toarray())
+
+
+@requires_numba
+def test_create_Yb_backends(system):
+    Y_b_numpy = create_Yb(system, sparse=True)
+    Y_b_numba = create_Yb(system, sparse=True, backend='numba')
+
+    np.testing.assert_array_equal(Y_b_numpy.toarray(), Y_b_numba.toarray())
+
+
+@requires_numba
+def test_gauss_seidel_backends(system):
+    V_numpy, theta_numpy, iterations_numpy = gauss_seidel(system)
+    V_numba, theta_numba, iterations_numba = gauss_seidel(system, backend='numba')
+
+    np.testing.assert_array_equal(V_numpy, V_numba)
+    np.testing.assert_array_equal(theta_numpy, theta_numba)
+    assert iterations_numpy == iterations_numba
@@ -0,0 +1,301 @@
+import lectures
+from generator import meshed_grid, radial_feeder
+from create_Yb import create_Yb
+from dc_power_flow import DCPowerFlow, DC_power_flow
+from newton_raphson import newton_raphson, power_injections
+from fast_decoupled import fast_decoupled, factorize_B, factorization_cache
+from gauss_seidel import gauss_seidel
+from topology import feeder_topology
+from shirmohammadi import shirmohammadi
+from distflow import distflow
+from solver_trace import SolverTrace
+
+import argparse
+import datetime
+import functools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import scipy
+
+# Version of the layout of the benchmark reports
+REPORT_VERSION = 1
+
+
+def _prepare_meshed(system):
+    """
+    Create the sparse bus-admittance matrix of a meshed system.
+    """
+
+    return create_Yb(system, sparse=True)
+
+
+def _prepare_fast_decoupled(system):
+    """
+    Create the sparse bus-admittance matrix and factorize the decoupled matrices of a meshed system.
+    """
+
+    factorization_cache.clear()
+    factorize_B(system)
+
+    return create_Yb(system, sparse=True)
+
+
+def _solve_newton_raphson(system, Y_b, trace=None, linear_solver='direct'):
+    V, theta, _, _, iteration = newton_raphson(system, Y_b=Y_b, trace=trace, linear_solver=linear_solver)
+    return V * np.exp(1j * np.radians(theta)), iteration
+
+
+def _solve_fast_decoupled(system, Y_b, trace=None):
+    V, theta, _, _, iteration = fast_decoupled(system, Y_b=Y_b, trace=trace)
+    return V * np.exp(1j * np.radians(theta)), iteration
+
+
+def _solve_gauss_seidel(system, Y_b, trace=None):
+    V, theta, iteration = gauss_seidel(system, Y_b=Y_b, trace=trace)
+    return V * np.exp(1j * np.radians(theta)), iteration
+
+
+def _solve_dc(system, model, trace=None):
+    DC_power_flow(system, model, trace)
+    return None, 1
+
+
+def _solve_shirmohammadi(system, topology, trace=None):
+    _, iteration = shirmohammadi(system, topology, trace=trace)
+    return None, iteration
+
+
+def _solve_distflow(system, topology, trace=None):
+    _, iteration = distflow(system, topology, trace=trace)
+    return None, iteration
+
+
+# Benchmarked solvers: the kind of generated system, the setup phase (matrices, factorizations or the feeder
+# topology), the solution phase and the largest default system size (Gauss-Seidel is too slow for large systems).
+# Newton-Raphson is included with the direct and the preconditioned Krylov solvers of the Newton step.
+SOLVERS = {
+    'nr': {'kind': 'meshed', 'setup': _prepare_meshed, 'solve': _solve_newton_raphson, 'max_buses': None},
+    'nr_gmres': {'kind': 'meshed', 'setup': _prepare_meshed,
+                 'solve': functools.partial(_solve_newton_raphson, linear_solver='gmres'), 'max_buses': None},
+    'nr_bicgstab': {'kind': 'meshed', 'setup': _prepare_meshed,
+                    'solve': functools.partial(_solve_newton_raphson, linear_solver='bicgstab'), 'max_buses': None},
+    'fd': {'kind': 'meshed', 'setup': _prepare_fast_decoupled, 'solve': _solve_fast_decoupled, 'max_buses': None},
+    'gs': {'kind': 'meshed', 'setup': _prepare_meshed, 'solve': _solve_gauss_seidel, 'max_buses': 300},
+    'dc': {'kind': 'meshed', 'setup': DCPowerFlow, 'solve': _solve_dc, 'max_buses': None},
+    'shirmohammadi': {'kind': 'radial', 'setup': feeder_topology, 'solve': _solve_shirmohammadi, 'max_buses': None},
+    'distflow': {'kind': 'radial', 'setup': feeder_topology, 'solve': _solve_distflow, 'max_buses': None},
+}
+
+GENERATORS = {'meshed': meshed_grid, 'radial': radial_feeder}
+
+
+def _max_mismatch(system, V):
+    """
+    Calculate the largest active or reactive power mismatch of the non-slack buses of an AC solution.
+    """
+
+    buses = system['buses']
+    P, Q = power_injections(create_Yb(system, sparse=True), V)
+    p_mismatch = np.abs(P - buses[:, 6] + buses[:, 4])[buses[:, 1] != 1]
+    q_mismatch = np.abs(Q - buses[:, 7] + buses[:, 5])[buses[:, 1] == 3]
+
+    return float(max(p_mismatch.max(initial=0), q_mismatch.max(initial=0)))
+
+
+def benchmark_solver(name, system, repeats=3, trace=False):
+    """
+    Benchmark one solver on one system and return a record of its timings, iterations and peak memory.
+
+    The setup and solution phases are timed separately in each repetition and the medians are reported. The peak
+    memory is measured with tracemalloc in an additional run, so that the tracing does not affect the timings; it
+    covers the memory allocated through Python and NumPy, but not the internal memory of the sparse LU solver. If
+    trace is set, a further run is traced and the summary of its iterations (the time of each phase of the
+    iterations and the final mismatch) is added to the record.
+    """
+
+    solver = SOLVERS[name]
+    setup_times = []
+    solve_times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        state = solver['setup'](system)
+        setup_end = time.perf_counter()
+        V, iteration = solver['solve'](system, state)
+        solve_end = time.perf_counter()
+        setup_times.append(setup_end - start)
+        solve_times.append(solve_end - setup_end)
+
+    # Measure the peak memory of both phases
+    tracemalloc.start()
+    solver['solve'](system, solver['setup'](system))
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    wall_times = np.add(setup_times, solve_times)
+    record = {
+        'solver': name,
+        'buses': int(system['buses'].shape[0]),
+        'branches': int(system['branches'].shape[0]),
+        'repeats': repeats,
+        'wall_time': float(np.median(wall_times)),
+        'wall_time_min': float(np.min(wall_times)),
+        'phases': {'setup': float(np.median(setup_times)), 'solve': float(np.median(solve_times))},
+        'iterations': int(iteration),
+        'peak_memory': int(peak_memory),
+        'max_mismatch': None if V is None else _max_mismatch(system, V),
+    }
+
+    # Trace the iterations of the solver
+    if trace:
+        solver_trace = SolverTrace()
+        solver['solve'](system, solver['setup'](system), solver_trace)
+        record['trace'] = solver_trace.summary()
+
+    return record
+
+
+def _git_commit():
+    """
+    Return the commit of the repository, or None if it cannot be determined.
+    """
+
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=lectures.ROOT, capture_output=True, text=True,
+                                timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    return result.stdout.strip() or None
+
+
+def metadata():
+    """
+    Describe the environment of a benchmark run, so that reports of different versions can be told apart.
+    """
+
+    return {
+        'report_version': REPORT_VERSION,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def run_benchmark(sizes, solvers=None, repeats=3, seed=0, loading=1.0, all_sizes=False, trace=False, progress=None):
+    """
+    Benchmark the solvers on generated systems of the given sizes and return the report.
+
+    The meshed grids and radial feeders are generated once per size and shared by the solvers of the same kind.
+    Sizes above the maximum of a solver are skipped unless all_sizes is set, and trace adds the summaries of traced
+    runs to the records. If progress is given, it is called with each record as soon as it is available.
+    """
+
+    solvers = solvers or list(SOLVERS)
+    records = []
+
+    for size in sizes:
+        systems = {}
+        for name in solvers:
+            solver = SOLVERS[name]
+            if not all_sizes and solver['max_buses'] is not None and size > solver['max_buses']:
+                continue
+            if solver['kind'] not in systems:
+                systems[solver['kind']] = GENERATORS[solver['kind']](size, seed, loading)
+            record = benchmark_solver(name, systems[solver['kind']], repeats, trace)
+            records.append(record)
+            if progress is not None:
+                progress(record)
+
+    return {
+        'metadata': metadata(),
+        'parameters': {'sizes': list(sizes), 'solvers': solvers, 'repeats': repeats, 'seed': seed,
+                       'loading': loading, 'trace': trace},
+        'results': records,
+    }
+
+
+def compare(old, new, tolerance=0.1):
+    """
+    Compare two benchmark reports and return the relative changes of the solvers and sizes found in both.
+
+    A ratio above 1 means that the new version is slower or uses more memory. Changes of the wall time beyond the
+    tolerance are marked as 'slower' or 'faster', and changes of the iteration count are marked as well.
+    """
+
+    old_records = {(record['solver'], record['buses']): record for record in old['results']}
+    comparison = []
+
+    for record in new['results']:
+        key = (record['solver'], record['buses'])
+        if key not in old_records:
+            continue
+        reference = old_records[key]
+        time_ratio = record['wall_time'] / reference['wall_time']
+        status = 'slower' if time_ratio > 1 + tolerance else 'faster' if time_ratio < 1 - tolerance else 'unchanged'
+        comparison.append({
+            'solver': key[0],
+            'buses': key[1],
+            'time_ratio': time_ratio,
+            'phase_ratios': {phase: record['phases'][phase] / reference['phases'][phase]
+                             for phase in record['phases'] if reference['phases'].get(phase)},
+            'memory_ratio': record['peak_memory'] / max(reference['peak_memory'], 1),
+            'iterations': (reference['iterations'], record['iterations']),
+            'status': status if record['iterations'] == reference['iterations'] else f"{status}, iterations changed",
+        })
+
+    return comparison
+
+
+def _print_record(record):
+    print(f"{record['solver']:>14} {record['buses']:>8} buses: {record['wall_time'] * 1e3:10.2f} ms "
+          f"(setup {record['phases']['setup'] * 1e3:.2f} ms), {record['iterations']} iterations, "
+          f"{record['peak_memory'] / 2 ** 20:.1f} MiB")
+    if 'trace' in record:
+        print(" " * 30 + ", ".join(f"{phase} {duration * 1e3:.2f} ms"
+                                   for phase, duration in record['trace']['phases'].items()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the power flow solvers on generated systems.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmark and write a JSON report")
+    run_parser.add_argument("--sizes", type=int, nargs='+', default=[10, 100, 1000, 10000], help="numbers of buses")
+    run_parser.add_argument("--solvers", nargs='+', choices=list(SOLVERS), help="solvers to benchmark (all by default)")
+    run_parser.add_argument("--repeats", type=int, default=3, help="number of timed repetitions")
+    run_parser.add_argument("--seed", type=int, default=0, help="seed of the generated systems")
+    run_parser.add_argument("--loading", type=float, default=1.0, help="scaling factor of the loads")
+    run_parser.add_argument("--all-sizes", action="store_true", help="ignore the maximum system sizes of the solvers")
+    run_parser.add_argument("--trace", action="store_true", help="add the phase timings of traced runs")
+    run_parser.add_argument("--output", default="benchmark.json", help="path of the report")
+    compare_parser = commands.add_parser("compare", help="compare two JSON reports")
+    compare_parser.add_argument("old", help="report of the reference version")
+    compare_parser.add_argument("new", help="report of the new version")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1, help="relative change of the wall time that "
+                                                                            "is reported as slower or faster")
+    arguments = parser.parse_args()
+
+    if arguments.command == "run":
+        report = run_benchmark(arguments.sizes, arguments.solvers, arguments.repeats, arguments.seed,
+                               arguments.loading, arguments.all_sizes, arguments.trace, progress=_print_record)
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(arguments.output)
+    else:
+        with open(arguments.old) as file:
+            old = json.load(file)
+        with open(arguments.new) as file:
+            new = json.load(file)
+        for row in compare(old, new, arguments.tolerance):
+            print(f"{row['solver']:>14} {row['buses']:>8} buses: time x{row['time_ratio']:.2f}, "
+                  f"memory x{row['memory_ratio']:.2f}, iterations {row['iterations'][0]} -> {row['iterations'][1]}: "
+                  f"{row['status']}")
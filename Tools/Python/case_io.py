@@ -0,0 +1,283 @@
+from collections.abc import Mapping
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pickle
+
+# Version of the binary case format
+FORMAT_VERSION = 1
+
+# Columns of the bus and branch data of the transmission (Lectures 1 and 3) and distribution (Lecture 2) cases
+LAYOUTS = {
+    'transmission': {
+        'sheets': {'buses': "Bus data", 'branches': "Branch data"},
+        'buses': [('bus_id', '<i8'), ('bus_type', '<i8'), ('V', '<f8'), ('theta', '<f8'), ('p_load', '<f8'),
+                  ('q_load', '<f8'), ('p_gen', '<f8'), ('q_gen', '<f8'), ('q_gen_min', '<f8'), ('q_gen_max', '<f8')],
+        'branches': [('from_bus', '<i8'), ('to_bus', '<i8'), ('r', '<f8'), ('x', '<f8'), ('b', '<f8')],
+        'bus_references': {'buses': ['bus_id'], 'branches': ['from_bus', 'to_bus']},
+    },
+    'distribution': {
+        'sheets': {'buses': "Buses", 'branches': "Branches"},
+        'buses': [('bus_id', '<i8'), ('p_load', '<f8'), ('q_load', '<f8')],
+        'branches': [('branch_id', '<i8'), ('from_bus', '<i8'), ('to_bus', '<i8'), ('r', '<f8'), ('x', '<f8')],
+        'bus_references': {'buses': ['bus_id'], 'branches': ['branch_id', 'from_bus', 'to_bus']},
+    },
+}
+
+TABLES = ['buses', 'branches']
+
+
+def detect_layout(system):
+    """
+    Determine the layout of a system from the number of bus data columns.
+    """
+
+    for layout, columns in LAYOUTS.items():
+        if system['buses'].shape[1] == len(columns['buses']):
+            return layout
+
+    raise ValueError(f"Unknown case layout with {system['buses'].shape[1]} bus data columns.")
+
+
+def validate(system, layout):
+    """
+    Check the bus and branch data of a system against a layout and raise a ValueError on the first problem found.
+    """
+
+    columns = LAYOUTS[layout]
+    for table in TABLES:
+        data = np.asarray(system[table])
+        if data.ndim != 2 or data.shape[1] != len(columns[table]):
+            raise ValueError(f"The {table} data must have {len(columns[table])} columns, got shape {data.shape}.")
+        data = data.astype(float)
+        if not np.all(np.isfinite(data)):
+            raise ValueError(f"The {table} data contains values that are not finite.")
+        for i, (name, dtype) in enumerate(columns[table]):
+            if dtype.startswith('<i') and np.any(data[:, i] != np.round(data[:, i])):
+                raise ValueError(f"The {table} column {name} must contain integers.")
+
+    # Check that the buses are numbered consecutively from zero and that the branches connect existing buses
+    number_of_buses = system['buses'].shape[0]
+    if np.any(np.asarray(system['buses'][:, 0], dtype=float) != np.arange(number_of_buses)):
+        raise ValueError("The bus ids must be numbered consecutively from zero.")
+    names = [name for name, _ in columns['branches']]
+    for name in ['from_bus', 'to_bus']:
+        bus = np.asarray(system['branches'][:, names.index(name)], dtype=float)
+        if np.any((bus < 0) | (bus >= number_of_buses)):
+            raise ValueError(f"The branch column {name} refers to buses that do not exist.")
+
+    if layout == 'transmission':
+        bus_type = np.asarray(system['buses'][:, 1], dtype=float)
+        if not np.all(np.isin(bus_type, [1, 2, 3])):
+            raise ValueError("The bus types must be 1 (slack), 2 (PV) or 3 (PQ).")
+        if np.count_nonzero(bus_type == 1) != 1:
+            raise ValueError("The system must have exactly one slack bus.")
+
+
+def _renumber(system, layout):
+    """
+    Renumber the bus and branch ids of a system read from a source file to start from 0.
+    """
+
+    for table in TABLES:
+        names = [name for name, _ in LAYOUTS[layout][table]]
+        for name in LAYOUTS[layout]['bus_references'][table]:
+            system[table][:, names.index(name)] -= 1
+
+    return system
+
+
+def read_excel(path, layout):
+    """
+    Read the bus and branch data of a system from an .xlsx file, with the bus ids renumbered to start from 0.
+    """
+
+    import pandas as pd
+
+    sheets = LAYOUTS[layout]['sheets']
+    system = {table: pd.read_excel(path, sheet_name=sheets[table]).to_numpy(dtype=float) for table in TABLES}
+
+    return _renumber(system, layout)
+
+
+def read_mat(path, layout):
+    """
+    Read the bus and branch data of a system from a .mat file, with the bus ids renumbered to start from 0.
+
+    The data must be stored as numeric matrices, either in a struct System with the fields Buses and Branches or
+    as the variables Buses and Branches. MATLAB table objects cannot be read outside MATLAB and have to be saved
+    with table2array first.
+    """
+
+    import scipy.io as sio
+
+    content = sio.loadmat(path, squeeze_me=True)
+    source = content['System'] if 'System' in content else content
+    system = {}
+    for table, field in [('buses', 'Buses'), ('branches', 'Branches')]:
+        data = source[field] if 'System' not in content else source[field].item()
+        if not isinstance(data, np.ndarray) or data.dtype.kind not in 'iuf':
+            raise ValueError(f"The {field} data in {path} is not a numeric matrix (save MATLAB tables with "
+                             f"table2array).")
+        system[table] = np.atleast_2d(data).astype(float)
+
+    return _renumber(system, layout)
+
+
+def read_source(path, layout=None):
+    """
+    Read the system data from an .xlsx, .mat or .pkl file and return it with its layout.
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.pkl':
+        with open(path, "rb") as file:
+            system = pickle.load(file)
+        return system, layout or detect_layout(system)
+
+    if layout is None:
+        raise ValueError("The layout must be given for .xlsx and .mat files.")
+    if extension == '.xlsx':
+        return read_excel(path, layout), layout
+    if extension == '.mat':
+        return read_mat(path, layout), layout
+
+    raise ValueError(f"Unsupported case file: {path}")
+
+
+def _column_hash(digest, name, array):
+    """
+    Add the name, type and content of a column to a hash.
+    """
+
+    digest.update(name.encode())
+    digest.update(array.dtype.str.encode())
+    digest.update(np.ascontiguousarray(array).tobytes())
+
+
+def save_case(system, folder, layout=None):
+    """
+    Save a system in the binary case format and return its content hash.
+
+    Each column of the bus and branch data is stored as a typed .npy file in a subfolder per table, and the file
+    schema.json describes the layout, the columns, their types and the content hash.
+    """
+
+    layout = layout or detect_layout(system)
+    validate(system, layout)
+
+    digest = hashlib.sha256()
+    schema = {'format_version': FORMAT_VERSION, 'layout': layout, 'tables': {}}
+    for table in TABLES:
+        os.makedirs(os.path.join(folder, table), exist_ok=True)
+        data = np.asarray(system[table], dtype=float)
+        columns = []
+        for i, (name, dtype) in enumerate(LAYOUTS[layout][table]):
+            column = data[:, i].astype(dtype)
+            np.save(os.path.join(folder, table, f"{name}.npy"), column)
+            _column_hash(digest, f"{table}.{name}", column)
+            columns.append({'name': name, 'dtype': dtype})
+        schema['tables'][table] = {'rows': data.shape[0], 'columns': columns}
+    schema['hash'] = digest.hexdigest()
+
+    with open(os.path.join(folder, "schema.json"), "w") as file:
+        json.dump(schema, file, indent=2)
+
+    return schema['hash']
+
+
+class Case(Mapping):
+    """
+    Lazily loaded case in the binary format.
+
+    The columns are memory-mapped on first access without copying. Indexing the case with 'buses' or 'branches'
+    gives the two-dimensional float arrays of the {'buses', 'branches'} system dictionary expected by the solvers.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, "schema.json")) as file:
+            self.schema = json.load(file)
+        if self.schema['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported case format version {self.schema['format_version']}.")
+        self.layout = self.schema['layout']
+        self.hash = self.schema['hash']
+        self._columns = {}
+        self._tables = {}
+
+    def column(self, table, name):
+        """
+        Return one column of a table as a read-only memory-mapped array.
+        """
+
+        if (table, name) not in self._columns:
+            column = np.load(os.path.join(self.folder, table, f"{name}.npy"), mmap_mode='r')
+            declared = self.schema['tables'][table]['columns'][self.column_names(table).index(name)]['dtype']
+            if column.shape != (self.schema['tables'][table]['rows'],) or column.dtype.str != declared:
+                raise ValueError(f"The column {table}.{name} does not match the schema.")
+            self._columns[(table, name)] = column
+
+        return self._columns[(table, name)]
+
+    def column_names(self, table):
+        """
+        Return the column names of a table.
+        """
+
+        return [column['name'] for column in self.schema['tables'][table]['columns']]
+
+    def verify(self):
+        """
+        Check the content of all columns against the hash stored in the schema.
+        """
+
+        digest = hashlib.sha256()
+        for table in TABLES:
+            for name in self.column_names(table):
+                _column_hash(digest, f"{table}.{name}", self.column(table, name))
+
+        return digest.hexdigest() == self.hash
+
+    def __getitem__(self, table):
+        if table not in self._tables:
+            if table not in TABLES:
+                raise KeyError(table)
+            self._tables[table] = np.column_stack([self.column(table, name) for name in self.column_names(table)])
+            self._tables[table] = self._tables[table].astype(float)
+
+        return self._tables[table]
+
+    def __iter__(self):
+        return iter(TABLES)
+
+    def __len__(self):
+        return len(TABLES)
+
+
+def load_case(path, layout=None, verify=False):
+    """
+    Load a case from a folder in the binary format, or from an .xlsx, .mat or .pkl file as a system dictionary.
+    """
+
+    if os.path.isdir(path):
+        case = Case(path)
+        if verify and not case.verify():
+            raise ValueError(f"The content of {path} does not match its hash.")
+        return case
+
+    system, _ = read_source(path, layout)
+
+    return system
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert .xlsx, .mat and .pkl cases to the binary case format.")
+    parser.add_argument("source", help="case file to convert")
+    parser.add_argument("folder", help="output folder of the binary case")
+    parser.add_argument("--layout", choices=list(LAYOUTS), help="layout of the case (detected for .pkl files)")
+    arguments = parser.parse_args()
+
+    system, layout = read_source(arguments.source, arguments.layout)
+    print(save_case(system, arguments.folder, layout))
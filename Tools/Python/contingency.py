@@ -0,0 +1,154 @@
+import lectures
+from create_Yb import create_Yb
+from dc_power_flow import DCPowerFlow
+from sensitivity import SensitivityFactors
+from newton_raphson import newton_raphson, power_injections, branch_power_flows
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pickle
+
+# Layout of the rows of the violation table
+VIOLATION_DTYPE = np.dtype([
+    ('outage', int),
+    ('kind', 'U10'),
+    ('element', int),
+    ('value', float),
+    ('limit', float),
+])
+
+# Tolerance of the power mismatch above which an AC re-solve is considered divergent
+MISMATCH_TOLERANCE = 1e-3
+
+# Data shared by the AC verification tasks of a worker process
+_worker_state = {}
+
+
+def _initialize_worker(system, ratings, voltage_limits, V0, theta0):
+    """
+    Store the system and the base-case solution in a worker process, so that each task only carries an outage index.
+    """
+
+    _worker_state.update(system=system, ratings=ratings, voltage_limits=voltage_limits, V0=V0, theta0=theta0)
+
+
+def _verify_outage(outage):
+    """
+    Re-solve the AC power flow without one branch, warm-started from the base case, and return its violations.
+    """
+
+    system = _worker_state['system']
+    v_min, v_max = _worker_state['voltage_limits']
+
+    # Remove the outaged branch
+    branches = np.delete(np.arange(system['branches'].shape[0]), outage)
+    outage_system = {'buses': system['buses'], 'branches': system['branches'][branches]}
+    ratings = _worker_state['ratings'][branches]
+
+    # Solve the AC power flow
+    V, theta, _, _, iteration = newton_raphson(outage_system, _worker_state['V0'], _worker_state['theta0'])
+    V_complex = V * np.exp(1j * np.radians(theta))
+
+    # Check the power mismatch of the solution
+    bus_type = system['buses'][:, 1].astype(int)
+    P, Q = power_injections(create_Yb(outage_system, sparse=True), V_complex)
+    dP = system['buses'][:, 6] - system['buses'][:, 4] - P
+    dQ = system['buses'][:, 7] - system['buses'][:, 5] - Q
+    mismatch = np.concatenate([dP[bus_type != 1], dQ[bus_type == 3]])
+    if not np.all(np.isfinite(mismatch)) or np.max(np.abs(mismatch), initial=0) > MISMATCH_TOLERANCE:
+        return [(outage, 'divergence', -1, iteration, np.nan)]
+
+    # Check the apparent power flows at both ends of the branches
+    S_from, S_to = branch_power_flows(outage_system, V_complex)
+    S = np.maximum(np.abs(S_from), np.abs(S_to))
+    violations = [(outage, 'overload', branches[i], S[i], ratings[i]) for i in np.flatnonzero(S > ratings)]
+
+    # Check the voltage magnitudes
+    violations += [(outage, 'voltage', i, V[i], v_min) for i in np.flatnonzero(V < v_min)]
+    violations += [(outage, 'voltage', i, V[i], v_max) for i in np.flatnonzero(V > v_max)]
+
+    return violations
+
+
+def dc_screening(system, ratings, outages=None, threshold=0.9, chunk_size=256):
+    """
+    Screen branch outages with the DC model and return the critical and the islanding outages.
+
+    The post-outage flows are rank-1 (Sherman-Morrison) updates of the base-case solution, expressed by the line
+    outage distribution factors and computed from the base-case factorization in chunks of outages. An outage is
+    critical if any post-outage flow exceeds the given fraction of its branch rating.
+    """
+
+    # Solve the base case and keep its factorization
+    model = DCPowerFlow(system)
+    factors = SensitivityFactors(model)
+    _, p_branch = model.solve(model.injections(system))
+    outages = np.arange(model.number_of_branches) if outages is None else np.atleast_1d(outages).astype(int)
+
+    critical = []
+    islanding = []
+    for start in range(0, outages.size, chunk_size):
+        chunk = outages[start:start + chunk_size]
+
+        # Update the base-case flows with the redistributed flow of each outaged branch
+        lodf = factors.lodf(chunk)
+        p_branch_outage = p_branch[:, np.newaxis] + lodf * p_branch[chunk]
+        p_branch_outage[chunk, np.arange(chunk.size)] = 0
+
+        # Outages with undefined distribution factors split the network into islands
+        split = np.isnan(lodf).all(axis=0)
+        loading = np.abs(p_branch_outage) / ratings[:, np.newaxis]
+        islanding.extend(chunk[split])
+        critical.extend(chunk[~split & (loading.max(axis=0) > threshold)])
+
+    return np.array(critical, dtype=int), np.array(islanding, dtype=int)
+
+
+def contingency_analysis(system, ratings=None, outages=None, threshold=0.9, voltage_limits=(0.9, 1.1),
+                         processes=None):
+    """
+    Perform the N-1 contingency analysis of a system and return the violation table.
+
+    All branch outages are screened with the DC model and only the critical ones are verified with AC power flows,
+    which are warm-started from the base-case voltages and distributed over a process pool. Each row of the returned
+    table holds the outaged branch, the kind of violation ('overload', 'voltage', 'islanding' or 'divergence'), the
+    violating branch or bus, the value and the limit.
+    """
+
+    # Use the branch ratings stored in the system if they are not given
+    if ratings is None:
+        if system['branches'].shape[1] <= 5:
+            raise ValueError("The branch ratings must be given or stored in the sixth column of the branch data.")
+        ratings = system['branches'][:, 5]
+    ratings = np.asarray(ratings, dtype=float)
+
+    # Screen the outages with the DC model
+    critical, islanding = dc_screening(system, ratings, outages, threshold)
+    violations = [(outage, 'islanding', -1, np.nan, np.nan) for outage in islanding]
+
+    # Solve the AC base case, which is the warm start of all re-solves
+    V0, theta0, _, _, _ = newton_raphson(system)
+    state = (system, ratings, voltage_limits, V0, theta0)
+
+    # Verify the critical outages with the AC model
+    if processes == 1 or critical.size <= 1:
+        _initialize_worker(*state)
+        for rows in map(_verify_outage, critical):
+            violations += rows
+    else:
+        with ProcessPoolExecutor(processes, initializer=_initialize_worker, initargs=state) as executor:
+            for rows in executor.map(_verify_outage, critical, chunksize=max(1, critical.size // 64)):
+                violations += rows
+
+    return np.array(violations, dtype=VIOLATION_DTYPE)
+
+
+if __name__ == '__main__':
+    # Load the system data
+    with open(lectures.case_path(3, "9 bus system.pkl"), "rb") as file:
+        system = pickle.load(file)
+    # Perform the N-1 contingency analysis with uniform branch ratings
+    ratings = np.full(system['branches'].shape[0], 1.5)
+    violations = contingency_analysis(system, ratings, threshold=0.8)
+    for row in violations:
+        print(row)
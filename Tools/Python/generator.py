@@ -0,0 +1,166 @@
+import lectures
+from dc_power_flow import DC_power_flow
+from create_Yb import create_Yb
+from newton_raphson import branch_power_flows
+
+import argparse
+import os
+import numpy as np
+import pickle
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import minimum_spanning_tree
+
+
+def meshed_grid(number_of_buses, seed=None, loading=1.0, branches_per_bus=1.8, generator_share=0.2):
+    """
+    Generate a meshed transmission system in the layout of Lectures 1 and 3.
+
+    The buses are placed on a square lattice and connected by a random spanning tree of the lattice, to which random
+    lattice edges are added until the network has the requested number of branches per bus. The branch parameters
+    are drawn from typical per-unit ranges (X/R between 3 and 10). Most buses carry a load with a power factor between
+    0.9 and 0.98, and the lattice is divided into blocks of 3 x 3 buses whose loads are covered by the PV buses of the
+    same block, together with the estimated losses, so that the power transfers stay realistic
+    for any size. The slack bus 0 lies in the middle of the lattice. The linearized solution used for the loss
+    estimate is stored as the initial voltages, which lets the AC methods converge for large systems.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    # Determine the lattice positions and number the buses so that the middle one is bus 0
+    columns = int(np.ceil(np.sqrt(number_of_buses)))
+    position = np.arange(number_of_buses)
+    row = position // columns
+    column = position % columns
+    bus = np.arange(number_of_buses)
+    middle = (number_of_buses // columns // 2) * columns + columns // 2
+    middle = min(middle, number_of_buses - 1)
+    bus[[0, middle]] = bus[[middle, 0]]
+
+    # Form all edges between horizontally and vertically adjacent lattice points
+    horizontal = position[(column < columns - 1) & (position + 1 < number_of_buses)]
+    vertical = position[position + columns < number_of_buses]
+    edges = np.vstack([np.column_stack([horizontal, horizontal + 1]), np.column_stack([vertical, vertical + columns])])
+
+    # Select a random spanning tree of the lattice, then add random edges to create loops
+    weights = sp.coo_matrix((rng.uniform(1, 2, len(edges)), (edges[:, 0], edges[:, 1])),
+                            shape=(number_of_buses, number_of_buses))
+    tree = minimum_spanning_tree(weights).tocoo()
+    lookup = {(i, j): k for k, (i, j) in enumerate(edges.tolist())}
+    in_tree = np.zeros(len(edges), dtype=bool)
+    in_tree[[lookup.get((i, j), lookup.get((j, i))) for i, j in zip(tree.row.tolist(), tree.col.tolist())]] = True
+    remaining = np.flatnonzero(~in_tree)
+    number_of_extra = min(remaining.size, max(0, int(branches_per_bus * number_of_buses) - np.count_nonzero(in_tree)))
+    edges = np.vstack([edges[in_tree], edges[rng.choice(remaining, number_of_extra, replace=False)]])
+    edges = bus[edges[rng.permutation(len(edges))]]
+    number_of_branches = len(edges)
+
+    # Draw the branch parameters
+    x = rng.uniform(0.02, 0.2, number_of_branches)
+    r = x / rng.uniform(3, 10, number_of_branches)
+    b = x * rng.uniform(0.2, 1, number_of_branches)
+    branches = np.column_stack([edges[:, 0], edges[:, 1], r, x, b]).astype(float)
+
+    # Draw the loads (indexed by lattice position)
+    has_load = rng.random(number_of_buses) < 0.7
+    p_load = has_load * rng.uniform(0.05, 0.3, number_of_buses) * loading
+    q_load = p_load * np.tan(np.arccos(rng.uniform(0.9, 0.98, number_of_buses)))
+
+    # Select the PV buses: the bus with the highest random priority of each block and a random share of the others
+    block = (row // 3) * int(np.ceil(columns / 3)) + column // 3
+    priority = rng.random(number_of_buses)
+    priority[middle] = -1
+    order = np.lexsort((-priority, block))
+    first = np.concatenate([[True], block[order][1:] != block[order][:-1]])
+    is_pv = np.zeros(number_of_buses, dtype=bool)
+    is_pv[order[first]] = True
+    is_pv |= rng.random(number_of_buses) < generator_share
+    is_pv[middle] = False
+
+    # Form the bus data in the order of the bus numbers, with the PV buses covering the loads of their blocks
+    block_generators = np.bincount(block, is_pv)
+    p_gen = np.where(is_pv, np.bincount(block, p_load)[block] / np.maximum(block_generators[block], 1), 0)
+    bus_type = np.where(is_pv, 2, 3)
+    bus_type[middle] = 1
+    v_specified = np.where(bus_type == 3, 1.0, rng.uniform(1.01, 1.03, number_of_buses))
+    v_specified[middle] = 1.0
+    buses = np.empty((number_of_buses, 10))
+    buses[bus] = np.column_stack([
+        bus, bus_type, v_specified, np.zeros(number_of_buses), p_load, q_load, p_gen, np.zeros(number_of_buses),
+        np.zeros(number_of_buses), np.zeros(number_of_buses),
+    ])
+    system = {'buses': buses, 'branches': branches}
+
+    # Estimate the branch losses from a linearized AC solution (the DC phase angles and the voltage magnitudes of one
+    # decoupled reactive power step) and let the PV buses also cover the losses of their blocks, so that the slack
+    # bus only balances the remaining difference
+    theta, _ = DC_power_flow(system)
+    Y_b = create_Yb(system, sparse=True)
+    V = buses[:, 2].copy()
+    pq_buses = np.flatnonzero(buses[:, 1] == 3)
+    q_mismatch = -buses[pq_buses, 5] - np.imag(V * np.conj(Y_b @ V))[pq_buses]
+    V[pq_buses] += spla.spsolve(-Y_b.imag[pq_buses, :][:, pq_buses].tocsc(), q_mismatch)
+    S_from, S_to = branch_power_flows(system, V * np.exp(1j * theta))
+    branch_losses = np.real(S_from + S_to) / 2
+    block_losses = (np.bincount(block[bus[edges[:, 0]]], branch_losses, block_generators.size) +
+                    np.bincount(block[bus[edges[:, 1]]], branch_losses, block_generators.size))
+    p_gen += np.where(is_pv, block_losses[block] / np.maximum(block_generators[block], 1), 0)
+    buses[bus, 6] = p_gen
+    buses[pq_buses, 2] = V[pq_buses]
+    buses[:, 3] = np.degrees(theta)
+    buses[bus, 8] = np.where(is_pv, -p_gen - 1, 0)
+    buses[bus, 9] = np.where(is_pv, p_gen + 1, 0)
+
+    return system
+
+
+def radial_feeder(number_of_buses, seed=None, loading=1.0, window=None):
+    """
+    Generate a radial distribution feeder in the layout of Lecture 2.
+
+    Each new bus is connected to a random one of the previous window buses, which controls the depth of the feeder
+    (a window of about the square root of the number of buses by default). The impedances are scaled so that the
+    total impedance from the root to the deepest bus stays in a realistic range, and the loads add up to about
+    1 p.u. at a loading of 1.
+    """
+
+    rng = np.random.default_rng(seed)
+    window = window or max(2, int(np.sqrt(number_of_buses)))
+
+    # Connect each bus to one of the previous buses
+    child = np.arange(1, number_of_buses)
+    parent = np.array([rng.integers(max(0, i - window), i) for i in child], dtype=int)
+    number_of_branches = number_of_buses - 1
+
+    # Draw the branch parameters, scaled by the expected depth of the feeder
+    depth = max(1.0, 2 * number_of_buses / window)
+    r = rng.uniform(0.5, 1.5, number_of_branches) * 0.05 / depth
+    x = r * rng.uniform(0.5, 2, number_of_branches)
+    branches = np.column_stack([np.arange(number_of_branches), parent, child, r, x]).astype(float)
+
+    # Draw the loads
+    p_load = rng.uniform(0.5, 1.5, number_of_buses) * loading / number_of_buses
+    q_load = p_load * np.tan(np.arccos(rng.uniform(0.9, 0.98, number_of_buses)))
+    p_load[0] = q_load[0] = 0
+    buses = np.column_stack([np.arange(number_of_buses), p_load, q_load]).astype(float)
+
+    return {'buses': buses, 'branches': branches}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic meshed grids and radial feeders.")
+    parser.add_argument("kind", choices=['meshed', 'radial'], help="kind of the generated system")
+    parser.add_argument("sizes", type=int, nargs='+', help="numbers of buses")
+    parser.add_argument("--folder", default=".", help="output folder of the .pkl files")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random number generator")
+    parser.add_argument("--loading", type=float, default=1.0, help="scaling factor of the loads")
+    arguments = parser.parse_args()
+
+    os.makedirs(arguments.folder, exist_ok=True)
+    for size in arguments.sizes:
+        generate = meshed_grid if arguments.kind == 'meshed' else radial_feeder
+        system = generate(size, arguments.seed, arguments.loading)
+        path = os.path.join(arguments.folder, f"{size} bus {arguments.kind} system.pkl")
+        with open(path, "wb") as file:
+            pickle.dump(system, file)
+        print(path)
@@ -0,0 +1,25 @@
+import os
+import sys
+
+# Root folder of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Folders with the power flow methods of the individual lectures
+LECTURE_FOLDERS = [
+    os.path.join(ROOT, "Lecture 1", "Python", "DC power flow"),
+    os.path.join(ROOT, "Lecture 2", "Python"),
+    os.path.join(ROOT, "Lecture 3", "Python"),
+]
+
+# Make the lecture modules importable by their file names
+for folder in LECTURE_FOLDERS:
+    if folder not in sys.path:
+        sys.path.append(folder)
+
+
+def case_path(lecture, file_name):
+    """
+    Return the path of a test system shipped with the Python code of a lecture.
+    """
+
+    return os.path.join(ROOT, f"Lecture {lecture}", "Python", file_name)
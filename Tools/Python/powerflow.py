@@ -0,0 +1,256 @@
+import lectures
+from case_io import LAYOUTS, load_case, detect_layout
+from create_Yb import create_Yb
+from dc_power_flow import DC_power_flow
+from newton_raphson import newton_raphson, power_injections
+from fast_decoupled import fast_decoupled
+from gauss_seidel import gauss_seidel
+from shirmohammadi import shirmohammadi
+from distflow import distflow
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import os
+import time
+import numpy as np
+import pickle
+
+
+class PowerFlowResult:
+    """
+    Result of a power flow solution, common to all solvers.
+
+    V and theta are the bus voltage magnitudes and phase angles (in degrees). P and Q are the bus power injections
+    of the meshed AC solvers and p_branch the branch active power flows of the DC method; the quantities a solver
+    does not determine are None. converged is False if the iteration limit was reached.
+    """
+
+    def __init__(self, method, V, theta, iterations, converged, P=None, Q=None, p_branch=None):
+        self.method = method
+        self.V = V
+        self.theta = theta
+        self.iterations = iterations
+        self.converged = converged
+        self.P = P
+        self.Q = Q
+        self.p_branch = p_branch
+        self.time = None
+
+    def arrays(self):
+        """
+        Return the arrays of the result that are not None.
+        """
+
+        return {name: value for name, value in [('V', self.V), ('theta', self.theta), ('P', self.P), ('Q', self.Q),
+                                                ('p_branch', self.p_branch)] if value is not None}
+
+    def summary(self):
+        """
+        Return the scalar summary of the result.
+        """
+
+        return {
+            'method': self.method,
+            'buses': self.V.size,
+            'iterations': self.iterations,
+            'converged': self.converged,
+            'time': self.time,
+            'V_min': float(np.min(self.V)),
+            'V_max': float(np.max(self.V)),
+        }
+
+
+def _solve_dc(system, **options):
+    theta, p_branch = DC_power_flow(system, **options)
+    return PowerFlowResult('dc', np.ones(theta.shape[0]), np.degrees(theta), 1, True, p_branch=p_branch)
+
+
+def _solve_gauss_seidel(system, max_iterations=10000, **options):
+    V, theta, iteration = gauss_seidel(system, max_iterations=max_iterations, **options)
+    P, Q = power_injections(create_Yb(system, sparse=True), V * np.exp(1j * np.radians(theta)))
+    return PowerFlowResult('gs', V, theta, iteration, iteration < max_iterations, P, Q)
+
+
+def _solve_newton_raphson(system, max_iterations=100, **options):
+    V, theta, P, Q, iteration = newton_raphson(system, max_iterations=max_iterations, **options)
+    return PowerFlowResult('nr', V, theta, iteration, iteration < max_iterations, P, Q)
+
+
+def _solve_fast_decoupled(system, max_iterations=100, **options):
+    V, theta, P, Q, iteration = fast_decoupled(system, max_iterations=max_iterations, **options)
+    return PowerFlowResult('fd', V, theta, iteration, iteration < max_iterations, P, Q)
+
+
+def _solve_shirmohammadi(system, max_iterations=100, **options):
+    V, iteration = shirmohammadi(system, max_iterations=max_iterations, **options)
+    converged = iteration < max_iterations and bool(np.all(np.isfinite(V)))
+    return PowerFlowResult('shirmohammadi', np.abs(V), np.angle(V, deg=True), iteration, converged)
+
+
+def _solve_distflow(system, max_iterations=100, **options):
+    V, iteration = distflow(system, max_iterations=max_iterations, **options)
+    converged = iteration < max_iterations and bool(np.all(np.isfinite(V)))
+    return PowerFlowResult('distflow', V, None, iteration, converged)
+
+
+# Registered solvers: the layout of the cases they accept and the function that returns a PowerFlowResult
+SOLVERS = {
+    'dc': {'layout': 'transmission', 'solve': _solve_dc},
+    'gs': {'layout': 'transmission', 'solve': _solve_gauss_seidel},
+    'nr': {'layout': 'transmission', 'solve': _solve_newton_raphson},
+    'fd': {'layout': 'transmission', 'solve': _solve_fast_decoupled},
+    'shirmohammadi': {'layout': 'distribution', 'solve': _solve_shirmohammadi},
+    'distflow': {'layout': 'distribution', 'solve': _solve_distflow},
+}
+
+# Solvers used for the cases of a layout if no solvers are given
+DEFAULT_SOLVERS = {'transmission': ['nr'], 'distribution': ['shirmohammadi']}
+
+
+def solve(system, method, **options):
+    """
+    Solve the power flow of a system with a registered method and return a PowerFlowResult.
+
+    The options are passed on to the solver (e.g. max_iterations, Y_b or trace).
+    """
+
+    if method not in SOLVERS:
+        raise ValueError(f"Unknown power flow method {method}, expected one of {', '.join(SOLVERS)}.")
+    layout = detect_layout(system)
+    if SOLVERS[method]['layout'] != layout:
+        raise ValueError(f"The method {method} cannot solve a {layout} case.")
+
+    start = time.perf_counter()
+    result = SOLVERS[method]['solve'](system, **options)
+    result.time = time.perf_counter() - start
+
+    return result
+
+
+def find_cases(folder):
+    """
+    Return the paths of the cases in a folder: .pkl, .xlsx and .mat files and binary case folders.
+    """
+
+    paths = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if os.path.isdir(path) and os.path.isfile(os.path.join(path, "schema.json")):
+            paths.append(path)
+        elif os.path.splitext(name)[1].lower() in ['.pkl', '.xlsx', '.mat']:
+            paths.append(path)
+
+    return paths
+
+
+def _run_case(task):
+    """
+    Load a case and solve it with the given methods (or the default methods of its layout).
+
+    A case that cannot be loaded or solved, e.g. an islanded case whose matrix is singular, is reported with its error
+    message instead of stopping the batch.
+    """
+
+    path, methods, layout = task
+    try:
+        system = load_case(path, layout)
+        layout = detect_layout(system)
+    except (ValueError, OSError, KeyError, pickle.UnpicklingError) as error:
+        return path, [], str(error)
+
+    results = []
+    for method in methods or DEFAULT_SOLVERS[layout]:
+        if SOLVERS[method]['layout'] != layout:
+            continue
+        try:
+            results.append(solve(system, method))
+        except (ValueError, ArithmeticError, RuntimeError, np.linalg.LinAlgError) as error:
+            return path, results, f"{method}: {error}"
+
+    return path, results, None
+
+
+def run_cases(paths, methods=None, layout=None, processes=None):
+    """
+    Solve many cases in a process pool and return a list of (path, results, error) tuples in the order of the paths.
+
+    Each case is loaded and solved in a worker process, so the cases never have to be held in memory together.
+    """
+
+    tasks = [(path, methods, layout) for path in paths]
+    if processes == 1 or len(tasks) <= 1:
+        return list(map(_run_case, tasks))
+
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(_run_case, tasks, chunksize=max(1, len(tasks) // 64)))
+
+
+def write_results(outcomes, output_folder):
+    """
+    Write the results of a batch in bulk: a summary.csv with one row per case and method, and a results.npz with the
+    arrays of all results, named <case>/<method>/<array>.
+    """
+
+    os.makedirs(output_folder, exist_ok=True)
+    arrays = {}
+    fields = ['case', 'method', 'buses', 'iterations', 'converged', 'time', 'V_min', 'V_max', 'error']
+
+    with open(os.path.join(output_folder, "summary.csv"), "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for path, results, error in outcomes:
+            case = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+            for result in results:
+                writer.writerow({'case': case, **result.summary(), 'error': ''})
+                arrays.update({f"{case}/{result.method}/{name}": value for name, value in result.arrays().items()})
+            if error is not None:
+                writer.writerow({'case': case, 'error': error})
+
+    np.savez(os.path.join(output_folder, "results.npz"), **arrays)
+
+
+def plot_results(outcomes, output_folder):
+    """
+    Save a plot of the voltage magnitude profiles of each case.
+
+    Matplotlib is imported only here, with a non-interactive backend, so that batch runs without plots start fast.
+    """
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    for path, results, _ in outcomes:
+        if not results:
+            continue
+        case = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+        figure, axes = plt.subplots()
+        for result in results:
+            axes.plot(result.V, marker='.', label=result.method)
+        axes.set_xlabel("Bus")
+        axes.set_ylabel("Voltage magnitude (p.u.)")
+        axes.set_title(case)
+        axes.legend()
+        figure.savefig(os.path.join(output_folder, f"{case}.png"))
+        plt.close(figure)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Solve the power flow of all cases in a folder.")
+    parser.add_argument("folder", help="folder with .pkl, .xlsx and .mat files or binary case folders")
+    parser.add_argument("--methods", nargs='+', choices=list(SOLVERS),
+                        help="power flow methods (by default nr for transmission and shirmohammadi for distribution "
+                             "cases); methods that do not fit the layout of a case are skipped")
+    parser.add_argument("--layout", choices=list(LAYOUTS), help="layout of the .xlsx and .mat cases")
+    parser.add_argument("--processes", type=int, help="number of worker processes")
+    parser.add_argument("--output", default="results", help="output folder")
+    parser.add_argument("--plot", action="store_true", help="save the voltage profiles of the cases")
+    arguments = parser.parse_args()
+
+    outcomes = run_cases(find_cases(arguments.folder), arguments.methods, arguments.layout, arguments.processes)
+    write_results(outcomes, arguments.output)
+    if arguments.plot:
+        plot_results(outcomes, arguments.output)
+    for path, results, error in outcomes:
+        print(path, ", ".join(f"{result.method} {result.iterations} iterations" for result in results), error or "")
@@ -0,0 +1,219 @@
+import lectures
+from dc_power_flow import DCPowerFlow
+from topology import feeder_topology
+from shirmohammadi import shirmohammadi_batch
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import scipy.sparse as sp
+import pickle
+
+# Data attached by the study tasks of a worker process
+_worker_state = {}
+
+
+class SharedArrays:
+    """
+    Named NumPy arrays placed in shared memory blocks, which worker processes attach to without copying.
+
+    The creating process copies each array into a new block once and passes spec() to the workers, where attach()
+    returns views of the same memory. The creator releases the blocks with close(), or by using the object as a
+    context manager.
+    """
+
+    def __init__(self, arrays):
+        self.blocks = {}
+        self.arrays = {}
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.blocks[name] = block
+            self.arrays[name] = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+            self.arrays[name][...] = array
+
+    def spec(self):
+        """
+        Return the picklable description of the arrays: the block name, shape and data type of each array.
+        """
+
+        return {name: (self.blocks[name].name, array.shape, array.dtype.str) for name, array in self.arrays.items()}
+
+    @staticmethod
+    def attach(spec):
+        """
+        Attach to the arrays of a spec and return the blocks (which must be kept open) and the arrays.
+        """
+
+        blocks = {name: shared_memory.SharedMemory(name=block_name) for name, (block_name, _, _) in spec.items()}
+        arrays = {name: np.ndarray(shape, dtype, buffer=blocks[name].buf) for name, (_, shape, dtype) in spec.items()}
+
+        return blocks, arrays
+
+    def close(self):
+        """
+        Release and remove the shared memory blocks.
+        """
+
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def _network_arrays(kind, system):
+    """
+    Build the network model of a study once and return its arrays for shared memory: the CSR components of the
+    bus-susceptance matrix of the DC study, or the feeder topology of the radial study with its levels concatenated.
+    """
+
+    if kind == 'dc':
+        B = DCPowerFlow.susceptance_matrix(system)
+        return {'B_data': B.data, 'B_indices': B.indices, 'B_indptr': B.indptr}
+
+    topology = feeder_topology(system)
+    levels = topology['levels']
+    return {
+        'sending': topology['sending'],
+        'receiving': topology['receiving'],
+        'parent_bus': topology['parent_bus'],
+        'parent_branch': topology['parent_branch'],
+        'depth': topology['depth'],
+        'level_branches': np.concatenate(levels) if levels else np.zeros(0, dtype=int),
+        'level_pointers': np.concatenate([[0], np.cumsum([level.size for level in levels])]),
+        'root': np.array([topology['root']]),
+    }
+
+
+def _initialize_worker(kind, spec):
+    """
+    Attach a worker process to the shared case, network, scenario and output arrays and prepare the model of the
+    study once.
+
+    The DC model wraps the shared bus-susceptance matrix and only factorizes its reduced form, since SuperLU factors
+    cannot be placed in shared memory. The feeder topology consists of views of the shared arrays.
+    """
+
+    blocks, arrays = SharedArrays.attach(spec)
+    system = {'buses': arrays['buses'], 'branches': arrays['branches']}
+    if kind == 'dc':
+        number_of_buses = system['buses'].shape[0]
+        B = sp.csr_matrix((arrays['B_data'], arrays['B_indices'], arrays['B_indptr']),
+                          shape=(number_of_buses, number_of_buses))
+        model = DCPowerFlow(system, B=B)
+    else:
+        model = {name: arrays[name] for name in ['sending', 'receiving', 'parent_bus', 'parent_branch', 'depth']}
+        model['root'] = int(arrays['root'][0])
+        model['levels'] = np.split(arrays['level_branches'], arrays['level_pointers'][1:-1])
+    _worker_state.update(kind=kind, blocks=blocks, arrays=arrays, system=system, model=model)
+
+
+def _solve_chunk(chunk):
+    """
+    Solve the scenarios start to stop - 1 and write their results into the shared output arrays.
+    """
+
+    start, stop = chunk
+    arrays = _worker_state['arrays']
+
+    if _worker_state['kind'] == 'dc':
+        theta, p_branch = _worker_state['model'].solve(arrays['p'][start:stop].T)
+        arrays['theta'][start:stop] = theta.T
+        arrays['p_branch'][start:stop] = p_branch.T
+    else:
+        V, iterations = shirmohammadi_batch(_worker_state['system'], arrays['p_load'][start:stop].T,
+                                            arrays['q_load'][start:stop].T, _worker_state['model'])
+        arrays['V'][start:stop] = V.T
+        arrays['iterations'][start:stop] = iterations
+
+    return stop - start
+
+
+def _run_study(kind, system, inputs, outputs, number_of_scenarios, processes, chunk_size):
+    """
+    Place the case, its network model, the scenario inputs and the preallocated outputs in shared memory, solve the
+    scenarios in chunks of a process pool and return copies of the outputs.
+    """
+
+    arrays = {'buses': np.asarray(system['buses'], dtype=float),
+              'branches': np.asarray(system['branches'], dtype=float),
+              **_network_arrays(kind, system), **inputs,
+              **{name: np.zeros(shape, dtype) for name, (shape, dtype) in outputs.items()}}
+    chunks = [(start, min(start + chunk_size, number_of_scenarios))
+              for start in range(0, number_of_scenarios, chunk_size)]
+
+    with SharedArrays(arrays) as shared:
+        if processes == 1 or len(chunks) <= 1:
+            _initialize_worker(kind, shared.spec())
+            list(map(_solve_chunk, chunks))
+            _worker_state.clear()
+        else:
+            with ProcessPoolExecutor(processes, initializer=_initialize_worker,
+                                     initargs=(kind, shared.spec())) as executor:
+                list(executor.map(_solve_chunk, chunks))
+
+        return {name: np.copy(shared.arrays[name]) for name in outputs}
+
+
+def dc_study(system, p, processes=None, chunk_size=256):
+    """
+    Solve many DC power flow scenarios in a process pool and return their voltage phase angles and branch flows.
+
+    The injections p are an array of scenarios x buses. The bus-susceptance matrix is built once and shared with the
+    case and scenario arrays. Each worker factorizes its reduced form once and solves chunks of scenarios, which it
+    identifies only by their indices, with a single substitution each. The results are the phase angles
+    (scenarios x buses) and the branch active power flows (scenarios x branches).
+    """
+
+    p = np.asarray(p, dtype=float)
+    number_of_scenarios = p.shape[0]
+    outputs = {
+        'theta': ((number_of_scenarios, system['buses'].shape[0]), float),
+        'p_branch': ((number_of_scenarios, system['branches'].shape[0]), float),
+    }
+
+    return _run_study('dc', system, {'p': p}, outputs, number_of_scenarios, processes, chunk_size)
+
+
+def radial_study(system, p_load, q_load, processes=None, chunk_size=64):
+    """
+    Solve many load scenarios of a radial feeder in a process pool and return their node voltages.
+
+    The loads p_load and q_load are arrays of scenarios x buses. The feeder topology is determined once and shared
+    with the case and scenario arrays, and each worker sweeps chunks of scenarios together. The results are the complex
+    node voltages (scenarios x buses) and the number of iterations of each scenario.
+    """
+
+    p_load = np.asarray(p_load, dtype=float)
+    q_load = np.asarray(q_load, dtype=float)
+    number_of_scenarios = p_load.shape[0]
+    outputs = {
+        'V': ((number_of_scenarios, system['buses'].shape[0]), complex),
+        'iterations': ((number_of_scenarios,), int),
+    }
+
+    return _run_study('radial', system, {'p_load': p_load, 'q_load': q_load}, outputs, number_of_scenarios,
+                      processes, chunk_size)
+
+
+if __name__ == '__main__':
+    # Load the system data
+    with open(lectures.case_path(3, "9 bus system.pkl"), "rb") as file:
+        system = pickle.load(file)
+    with open(lectures.case_path(2, "13 bus system.pkl"), "rb") as file:
+        feeder = pickle.load(file)
+    # Solve randomly scaled loads of both systems
+    rng = np.random.default_rng(0)
+    scaling = rng.uniform(0.5, 1.5, (1000, 1))
+    p = system['buses'][:, 6] - scaling * system['buses'][:, 4]
+    results = dc_study(system, p, processes=2)
+    print("Largest DC branch flows:", np.max(np.abs(results['p_branch']), axis=0))
+    results = radial_study(feeder, scaling * feeder['buses'][:, 1], scaling * feeder['buses'][:, 2], processes=2)
+    print("Lowest node voltages:", np.min(np.abs(results['V']), axis=0))
@@ -0,0 +1,166 @@
+import lectures
+from dc_power_flow import DC_power_flow
+from newton_raphson import newton_raphson
+from fast_decoupled import fast_decoupled
+from gauss_seidel import gauss_seidel
+from shirmohammadi import shirmohammadi
+from distflow import distflow
+
+import csv
+import json
+import time
+import numpy as np
+import pickle
+
+# Phases of an iteration that are timed by the solvers
+PHASES = ['injections', 'mismatch', 'jacobian', 'linear_solve', 'sweep', 'backward_sweep', 'forward_sweep']
+
+
+class SolverTrace:
+    """
+    Per-iteration record of a power flow solution, passed to a solver as trace.
+
+    The solvers call start(solver) before their setup, setup_phase(name) after building or factorizing matrices,
+    phase(name) after each timed part of an iteration and iteration(iteration, max_mismatch, update_norm) at the end
+    of each iteration. Each call to setup_phase or phase books the time since the previous mark. If a callback is
+    given, it is called with each iteration record as soon as it is complete, e.g. to watch slowly converging cases.
+    Without a trace, the solvers skip all of this work.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.solver = None
+        self.setup = {}
+        self.iterations = []
+        self._phases = {}
+        self._mark = None
+        self._iteration_start = None
+
+    def start(self, solver):
+        """
+        Reset the trace for a new solution by a solver.
+        """
+
+        self.solver = solver
+        self.setup = {}
+        self.iterations = []
+        self._phases = {}
+        self._mark = time.perf_counter()
+        self._iteration_start = self._mark
+
+    def setup_phase(self, name):
+        """
+        Book the time since the previous mark to a phase of the setup.
+        """
+
+        now = time.perf_counter()
+        self.setup[name] = self.setup.get(name, 0.0) + now - self._mark
+        self._mark = self._iteration_start = now
+
+    def phase(self, name):
+        """
+        Book the time since the previous mark to a phase of the current iteration.
+        """
+
+        now = time.perf_counter()
+        self._phases[name] = self._phases.get(name, 0.0) + now - self._mark
+        self._mark = now
+
+    def iteration(self, iteration, max_mismatch, update_norm):
+        """
+        Complete the record of an iteration with its largest mismatch and the largest change of the voltages.
+        """
+
+        now = time.perf_counter()
+        record = {
+            'solver': self.solver,
+            'iteration': int(iteration),
+            'max_mismatch': float(max_mismatch),
+            'update_norm': float(update_norm),
+            'time': now - self._iteration_start,
+            'phases': self._phases,
+        }
+        self.iterations.append(record)
+        self._phases = {}
+        self._mark = self._iteration_start = now
+        if self.callback is not None:
+            self.callback(record)
+
+    def records(self):
+        """
+        Return the iteration records as flat dictionaries with one time_<phase> entry per phase.
+        """
+
+        return [{**{key: value for key, value in record.items() if key != 'phases'},
+                 **{f"time_{phase}": record['phases'].get(phase, 0.0) for phase in self.phase_names()}}
+                for record in self.iterations]
+
+    def phase_names(self):
+        """
+        Return the names of the phases that occur in the iterations, in the order of PHASES.
+        """
+
+        names = {phase for record in self.iterations for phase in record['phases']}
+
+        return [phase for phase in PHASES if phase in names] + sorted(names - set(PHASES))
+
+    def to_array(self):
+        """
+        Return the iteration records as a structured NumPy array.
+        """
+
+        phases = self.phase_names()
+        dtype = [('iteration', int), ('max_mismatch', float), ('update_norm', float), ('time', float)] + \
+            [(f"time_{phase}", float) for phase in phases]
+
+        return np.array([tuple(record[name] for name, _ in dtype) for record in self.records()], dtype=dtype)
+
+    def summary(self):
+        """
+        Summarize the trace: the number of iterations, the final mismatch, the setup times and the total time of each
+        phase over all iterations.
+        """
+
+        return {
+            'solver': self.solver,
+            'iterations': len(self.iterations),
+            'final_mismatch': self.iterations[-1]['max_mismatch'] if self.iterations else None,
+            'setup': dict(self.setup),
+            'phases': {phase: sum(record['phases'].get(phase, 0.0) for record in self.iterations)
+                       for phase in self.phase_names()},
+            'time': sum(record['time'] for record in self.iterations),
+        }
+
+    def save(self, path):
+        """
+        Write the iteration records to a .csv file or, together with the summary, to a .json file.
+        """
+
+        if path.endswith(".json"):
+            with open(path, "w") as file:
+                json.dump({'summary': self.summary(), 'iterations': self.records()}, file, indent=2)
+            return
+
+        records = self.records()
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(records[0]) if records else ['solver', 'iteration'])
+            writer.writeheader()
+            writer.writerows(records)
+
+
+if __name__ == '__main__':
+    # Load the system data
+    with open(lectures.case_path(3, "9 bus system.pkl"), "rb") as file:
+        system = pickle.load(file)
+    with open(lectures.case_path(2, "13 bus system.pkl"), "rb") as file:
+        feeder = pickle.load(file)
+    # Trace the convergence of each solver
+    trace = SolverTrace()
+    for solve in [lambda: newton_raphson(system, trace=trace), lambda: fast_decoupled(system, trace=trace),
+                  lambda: gauss_seidel(system, trace=trace), lambda: DC_power_flow(system, trace=trace),
+                  lambda: shirmohammadi(feeder, trace=trace), lambda: distflow(feeder, trace=trace)]:
+        solve()
+        summary = trace.summary()
+        print(f"{summary['solver']}: {summary['iterations']} iterations, final mismatch "
+              f"{summary['final_mismatch']:.2e}, phases {summary['phases']}")
+    print(trace.to_array())
@@ -0,0 +1,55 @@
+import lectures
+from powerflow import solve, find_cases, run_cases, write_results
+
+import numpy as np
+import pytest
+import os
+import pickle
+
+
+@pytest.fixture
+def transmission_system():
+    """
+    Load the 9-bus system of Lecture 3.
+    """
+
+    with open(lectures.case_path(3, "9 bus system.pkl"), "rb") as file:
+        return pickle.load(file)
+
+
+@pytest.fixture
+def distribution_system():
+    """
+    Load the 13-bus feeder of Lecture 2.
+    """
+
+    with open(lectures.case_path(2, "13 bus system.pkl"), "rb") as file:
+        return pickle.load(file)
+
+
+def test_batch_reports_failing_case(transmission_system, tmp_path):
+    # Island bus 8 by removing both of its branches, which makes the Jacobian singular
+    islanded_system = {**transmission_system, 'branches': transmission_system['branches'][:7]}
+    with open(tmp_path / "a_islanded.pkl", "wb") as file:
+        pickle.dump(islanded_system, file)
+    with open(tmp_path / "b_nine_bus.pkl", "wb") as file:
+        pickle.dump(transmission_system, file)
+
+    outcomes = run_cases(find_cases(tmp_path), processes=2)
+    write_results(outcomes, tmp_path / "results")
+
+    (_, islanded_results, islanded_error), (_, results, error) = outcomes
+    assert not islanded_results and islanded_error.startswith("nr:")
+    assert error is None and results[0].converged
+    assert os.path.isfile(tmp_path / "results" / "summary.csv")
+    assert "b_nine_bus/nr/V" in np.load(tmp_path / "results" / "results.npz")
+
+
+@pytest.mark.parametrize('method', ['shirmohammadi', 'distflow'])
+def test_radial_iteration_limit(distribution_system, method):
+    assert solve(distribution_system, method).converged
+
+    # The sweeps do not converge when the loads are far beyond the capacity of the feeder
+    distribution_system['buses'][:, 1:3] *= 20
+    result = solve(distribution_system, method, max_iterations=50)
+    assert result.iterations == 50 and not result.converged
@@ -0,0 +1,147 @@
+import lectures
+from topology import feeder_topology
+from shirmohammadi import shirmohammadi
+from distflow import distflow
+from create_Yb import create_Yb
+from newton_raphson import newton_raphson
+from fast_decoupled import fast_decoupled
+
+import os
+import tempfile
+import numpy as np
+import pickle
+
+# Columns of the bus data that hold the load and generation of each method
+BUS_COLUMNS = {
+    'shirmohammadi': {'p_load': 1, 'q_load': 2},
+    'distflow': {'p_load': 1, 'q_load': 2},
+    'newton_raphson': {'p_load': 4, 'q_load': 5, 'p_gen': 6, 'q_gen': 7},
+    'fast_decoupled': {'p_load': 4, 'q_load': 5, 'p_gen': 6, 'q_gen': 7},
+}
+
+
+def _radial_step(method):
+    """
+    Create the step function of a radial feeder solver, which reuses the feeder topology between steps.
+    """
+
+    solver = shirmohammadi if method == 'shirmohammadi' else distflow
+    state = {}
+
+    def step(system, V0):
+        if 'topology' not in state:
+            state['topology'] = feeder_topology(system)
+        V, iteration = solver(system, state['topology'], V0)
+        return np.abs(V), np.angle(V, deg=True), iteration, V
+
+    return step
+
+
+def _meshed_step(method):
+    """
+    Create the step function of a meshed network solver, which reuses the bus-admittance matrix between steps.
+    """
+
+    solver = newton_raphson if method == 'newton_raphson' else fast_decoupled
+    state = {}
+
+    def step(system, V0):
+        if 'Y_b' not in state:
+            state['Y_b'] = create_Yb(system, sparse=True)
+        V_start, theta_start = (None, None) if V0 is None else V0
+        if solver is newton_raphson:
+            V, theta, _, _, iteration = newton_raphson(system, V_start, theta_start, Y_b=state['Y_b'])
+        else:
+            V, theta, _, _, iteration = fast_decoupled(system, V0=V_start, theta0=theta_start, Y_b=state['Y_b'])
+        return V, theta, iteration, (V, theta)
+
+    return step
+
+
+def time_series(system, method, output_folder, p_load=None, q_load=None, p_gen=None, q_gen=None, chunk_size=96,
+                warm_start=True):
+    """
+    Perform a quasi-static time-series power flow and stream the results to memory-mapped arrays.
+
+    The profiles are arrays of steps x buses (or memory-mapped arrays) that replace the corresponding bus data of the
+    system in each step; the profiles that are not given keep the values of the system. Each step is warm-started
+    from the solution of the previous one, and the topology or the bus-admittance matrix is reused by all steps.
+    The voltage magnitudes, phase angles (in degrees) and iteration counts are written in chunks of steps to
+    V.npy, theta.npy and iterations.npy in the output folder, so the memory use does not grow with the number of
+    steps. The results are returned as read-only memory-mapped arrays.
+    """
+
+    columns = BUS_COLUMNS[method]
+    profiles = {name: profile for name, profile in
+                [('p_load', p_load), ('q_load', q_load), ('p_gen', p_gen), ('q_gen', q_gen)] if profile is not None}
+
+    # Radial feeders have no generation columns, so the generation is treated as negative load
+    if 'p_gen' not in columns:
+        for name in ['p_gen', 'q_gen']:
+            if name in profiles:
+                load = name.replace('gen', 'load')
+                base = system['buses'][:, columns[load]].astype(float)
+                profiles[load] = (profiles[load] if load in profiles else base) - profiles.pop(name)
+
+    # Determine the number of steps and create the output arrays
+    number_of_buses = system['buses'].shape[0]
+    number_of_steps = next(iter(profiles.values())).shape[0]
+    os.makedirs(output_folder, exist_ok=True)
+    V_out = np.lib.format.open_memmap(os.path.join(output_folder, "V.npy"), mode='w+', dtype=float,
+                                      shape=(number_of_steps, number_of_buses))
+    theta_out = np.lib.format.open_memmap(os.path.join(output_folder, "theta.npy"), mode='w+', dtype=float,
+                                          shape=(number_of_steps, number_of_buses))
+    iterations_out = np.lib.format.open_memmap(os.path.join(output_folder, "iterations.npy"), mode='w+', dtype=int,
+                                               shape=(number_of_steps,))
+
+    # Prepare the solver and a working copy of the system, whose bus data is overwritten in each step
+    step = _radial_step(method) if method in ['shirmohammadi', 'distflow'] else _meshed_step(method)
+    step_system = {'buses': system['buses'].astype(float), 'branches': system['branches']}
+    start = None
+
+    for chunk_start in range(0, number_of_steps, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, number_of_steps)
+
+        # Load the chunk of the profiles and allocate the chunk of the results
+        chunk_profiles = {name: np.asarray(profile[chunk_start:chunk_end], dtype=float)
+                          for name, profile in profiles.items()}
+        V_chunk = np.empty((chunk_end - chunk_start, number_of_buses))
+        theta_chunk = np.empty((chunk_end - chunk_start, number_of_buses))
+        iterations_chunk = np.empty(chunk_end - chunk_start, dtype=int)
+
+        for i in range(chunk_end - chunk_start):
+            for name, profile in chunk_profiles.items():
+                step_system['buses'][:, columns[name]] = profile[i]
+            V_chunk[i], theta_chunk[i], iterations_chunk[i], solution = step(step_system, start)
+            if warm_start:
+                start = solution
+
+        # Write the chunk of the results to the disk
+        V_out[chunk_start:chunk_end] = V_chunk
+        theta_out[chunk_start:chunk_end] = theta_chunk
+        iterations_out[chunk_start:chunk_end] = iterations_chunk
+        for array in [V_out, theta_out, iterations_out]:
+            array.flush()
+
+    del V_out, theta_out, iterations_out
+
+    return {name: np.load(os.path.join(output_folder, f"{name}.npy"), mmap_mode='r')
+            for name in ['V', 'theta', 'iterations']}
+
+
+if __name__ == '__main__':
+    # Load the system data
+    with open(lectures.case_path(2, "13 bus system.pkl"), "rb") as file:
+        system = pickle.load(file)
+    # Create a daily load profile with 15-minute resolution
+    hours = np.arange(96) / 4
+    scale = 0.7 + 0.3 * np.sin(np.pi * (hours - 6) / 12) ** 2
+    p_load = scale[:, np.newaxis] * system['buses'][:, 1]
+    q_load = scale[:, np.newaxis] * system['buses'][:, 2]
+    # Perform the time-series power flow with and without warm starts
+    output_folder = tempfile.mkdtemp()
+    results = time_series(system, 'shirmohammadi', output_folder, p_load, q_load)
+    print("Minimum voltage magnitude:", np.min(results['V']))
+    print("Iterations with warm start:", np.sum(results['iterations']))
+    results = time_series(system, 'shirmohammadi', output_folder, p_load, q_load, warm_start=False)
+    print("Iterations without warm start:", np.sum(results['iterations']))